@@ -0,0 +1,113 @@
+"""Deterministic synthetic OBJ meshes, BVH skeletons and sample directories
+"""
+import os
+import numpy as np
+from manifest import write_rows
+
+_FACE_TOKENS = {
+    "v": "%d",
+    "v/vt": "%d/%d",
+    "v//vn": "%d//%d",
+    "v/vt/vn": "%d/%d/%d",
+}
+
+
+def make_obj(path, n_vertices=100000, n_faces=200000, polygon_size=3, tokens="v", seed=0):
+    """Write a random OBJ mesh.
+
+    Args:
+        path (str): output file.
+        n_vertices (int): number of `v` records, as many `vt` and `vn` records are written when the tokens use them.
+        n_faces (int): number of `f` records.
+        polygon_size (int): vertices per face, larger polygons are fan triangulated by the parser.
+        tokens (str): face token layout, one of "v", "v/vt", "v//vn" or "v/vt/vn".
+        seed (int): random seed, the same arguments always write the same file.
+    """
+    rng = np.random.default_rng(seed)
+    fields = _FACE_TOKENS[tokens].count("%d")
+    indices = rng.integers(1, n_vertices + 1, (n_faces, polygon_size))
+
+    with open(path, 'w') as f:
+        f.write(f"# synthetic mesh, seed {seed}\n")
+        write_rows(f, rng.standard_normal((n_vertices, 3)), "v %.6f %.6f %.6f\n")
+        if "vt" in tokens:
+            write_rows(f, rng.random((n_vertices, 2)), "vt %.6f %.6f\n")
+        if "vn" in tokens:
+            write_rows(f, rng.standard_normal((n_vertices, 3)), "vn %.6f %.6f %.6f\n")
+        # Texture and normal indices reuse the vertex index
+        corners = np.repeat(indices, fields, axis=1)
+        write_rows(f, corners, "f" + (" " + _FACE_TOKENS[tokens]) * polygon_size + "\n")
+
+
+def make_parents(n_joints, depth, seed=0):
+    """Random parent table of n_joints joints with a longest chain of `depth` joints.
+
+    Joints are numbered so that parents precede their children.
+    """
+    rng = np.random.default_rng(seed)
+    depth = max(1, min(depth, n_joints))
+    parents = np.full(n_joints, -1, dtype=int)
+    depths = np.zeros(n_joints, dtype=int)
+    parents[1:depth] = np.arange(depth - 1)
+    depths[:depth] = np.arange(depth)
+    for joint in range(depth, n_joints):
+        candidates = np.flatnonzero(depths[:joint] < depth - 1)
+        parents[joint] = rng.choice(candidates)
+        depths[joint] = depths[parents[joint]] + 1
+    return parents
+
+
+def make_bvh(path, n_joints=60, depth=8, n_frames=1000, seed=0):
+    """Write a random BVH skeleton with n_frames frames of motion.
+
+    The root has 6 channels, every other joint 3 rotation channels.
+    """
+    rng = np.random.default_rng(seed)
+    parents = make_parents(n_joints, depth, seed)
+    children = [[] for _ in range(n_joints)]
+    for joint, parent in enumerate(parents):
+        if parent != -1:
+            children[parent].append(joint)
+    offsets = rng.standard_normal((n_joints, 3))
+
+    lines = ["HIERARCHY"]
+    stack = [(0, 0, False)]
+    while stack:
+        joint, level, closing = stack.pop()
+        indent = "\t" * level
+        if closing:
+            if not children[joint]:
+                lines += [f"{indent}\tEnd Site", f"{indent}\t{{", f"{indent}\t\tOFFSET 0.0 0.0 1.0", f"{indent}\t}}"]
+            lines.append(f"{indent}}}")
+            continue
+        lines += [f"{indent}{'ROOT' if joint == 0 else 'JOINT'} joint{joint}", f"{indent}{{",
+                  f"{indent}\tOFFSET {offsets[joint, 0]:.6f} {offsets[joint, 1]:.6f} {offsets[joint, 2]:.6f}"]
+        if joint == 0:
+            lines.append(f"{indent}\tCHANNELS 6 Xposition Yposition Zposition Zrotation Xrotation Yrotation")
+        else:
+            lines.append(f"{indent}\tCHANNELS 3 Zrotation Xrotation Yrotation")
+        stack.append((joint, level, True))
+        stack += [(child, level + 1, False) for child in reversed(children[joint])]
+
+    motion = rng.uniform(-180, 180, (n_frames, 3 + 3 * n_joints))
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+        f.write(f"MOTION\nFrames: {n_frames}\nFrame Time: 0.033333\n")
+        write_rows(f, motion, " ".join(["%.4f"] * motion.shape[1]) + "\n")
+
+
+def make_dataset(root_dir, n_samples=200, n_vertices=5000, n_joints=60, seed=0):
+    """Write n_samples sample directories in the layout of obj2npy.py and bvh2npy.py."""
+    rng = np.random.default_rng(seed)
+    for i in range(n_samples):
+        name = f"{i:06d}"
+        sample_dir = os.path.join(root_dir, name)
+        os.makedirs(sample_dir, exist_ok=True)
+        vertices = int(rng.integers(n_vertices // 2, n_vertices * 3 // 2))
+        parents = make_parents(n_joints, 8, seed + i)
+        path = os.path.join(sample_dir, name)
+        np.save(f"{path}_vertices.npy", rng.standard_normal((vertices, 3)).astype(np.float32))
+        np.save(f"{path}_faces.npy", rng.integers(0, vertices, (vertices * 2, 3)).astype(np.int32))
+        np.save(f"{path}_skel.npy", rng.standard_normal((n_joints, 3)))
+        np.save(f"{path}_link.npy", np.stack([parents[1:], np.arange(1, n_joints)], axis=1))
+        np.save(f"{path}_names.npy", np.array([f"joint{j}" for j in range(n_joints)]))
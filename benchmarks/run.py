@@ -0,0 +1,193 @@
+"""Benchmarks of the parsers, exporters, forward kinematics and dataset loader
+
+Usage:
+    python benchmarks/run.py [--quick] [--output results.json] [--baseline baseline.json] [--tolerance 0.2]
+
+Inputs are generated deterministically into a temporary directory. Every
+benchmark reports the median and minimum wall time per call over --repeat
+runs, and the OBJ parser also its peak traced memory. With --baseline, the
+minimums and peaks are compared against a stored results file and the exit
+code is 1 when any benchmark got slower, or used more memory, by more than
+--tolerance.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import contextlib
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(_ROOT, 'scripts'))
+sys.path.insert(0, os.path.join(_ROOT, 'dataset'))
+from generators import make_bvh, make_dataset, make_obj
+from obj2npy import OBJData
+from bvh2npy import BVHData
+
+CONFIGS = {
+    "quick": {"obj_vertices": 20000, "obj_faces": 40000, "bvh_joints": 60, "bvh_depth": 8, "bvh_frames": 300,
+              "dataset_samples": 50, "dataset_vertices": 2000},
+    "full": {"obj_vertices": 500000, "obj_faces": 1000000, "bvh_joints": 150, "bvh_depth": 16, "bvh_frames": 5000,
+             "dataset_samples": 500, "dataset_vertices": 10000},
+}
+
+
+def measure(func, repeat, min_seconds=0.05):
+    """Median and minimum wall time of one func() call over `repeat` runs.
+
+    Fast functions are called in a loop of at least min_seconds per run, as
+    timeit does, so that timer resolution doesn't dominate.
+    """
+    times = []
+    # The converters' progress messages are not part of the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        func()
+        number = max(1, int(np.ceil(min_seconds / max(time.perf_counter() - start, 1e-9))))
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            times.append((time.perf_counter() - start) / number)
+    return float(np.median(times)), float(np.min(times))
+
+
+def measure_peak(func):
+    """Peak memory traced during one func() call in bytes, NumPy arrays included."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+def run_benchmarks(work_dir, config, repeat=3):
+    results = {}
+
+    def record(name, func, items, unit):
+        median, best = measure(func, repeat)
+        results[name] = {"seconds": median, "min_seconds": best, "throughput": items / median, "unit": unit}
+        print(f"{name:<28} {median * 1000:10.2f} ms {items / median:14.0f} {unit}")
+
+    def record_peak(name, func, output_bytes):
+        peak = measure_peak(func)
+        results[name] = {"peak_bytes": peak, "output_bytes": output_bytes, "unit": "MiB"}
+        print(f"{name:<28} {peak / 2 ** 20:10.2f} MiB peak, {peak / output_bytes:9.1f}x the output")
+
+    # OBJ parsing, one file per face token layout
+    for tokens, polygon_size in (("v", 3), ("v/vt/vn", 3), ("v//vn", 4)):
+        obj_path = os.path.join(work_dir, f"mesh_{tokens.replace('/', '_')}_{polygon_size}.obj")
+        make_obj(obj_path, config["obj_vertices"], config["obj_faces"], polygon_size, tokens)
+        name = f"obj_load[{tokens},{polygon_size}]"
+        record(name, lambda: OBJData(obj_path), os.path.getsize(obj_path) / 2 ** 20, "MiB/s")
+
+    # Peak memory of the parser, set by its block size rather than the file size
+    obj_path = os.path.join(work_dir, "mesh_v_vt_vn_3.obj")
+    obj_data = OBJData(obj_path)
+    record_peak("obj_load_peak[v/vt/vn,3]", lambda: OBJData(obj_path), obj_data.vertices.nbytes + obj_data.faces.nbytes)
+
+    obj_data = OBJData(os.path.join(work_dir, "mesh_v_3.obj"))
+    out_prefix = os.path.join(work_dir, "export", "mesh")
+    os.makedirs(os.path.dirname(out_prefix), exist_ok=True)
+    record("obj_export_npy", lambda: obj_data.export(out_prefix), len(obj_data.faces), "faces/s")
+    record("obj_export_to_obj", lambda: obj_data.export_to_obj(out_prefix + ".obj"), len(obj_data.faces), "faces/s")
+
+    # BVH parsing, forward kinematics and export
+    bvh_path = os.path.join(work_dir, "skeleton.bvh")
+    make_bvh(bvh_path, config["bvh_joints"], config["bvh_depth"], config["bvh_frames"])
+    record("bvh_load", lambda: BVHData(bvh_path), config["bvh_frames"], "frames/s")
+    bvh_data = BVHData(bvh_path)
+    record("bvh_fk_rest", lambda: bvh_data.compute_global_positions(), 1, "poses/s")
+    record("bvh_fk_motion", lambda: bvh_data.compute_global_positions(slice(None)), config["bvh_frames"], "frames/s")
+    record("bvh_export_npy", lambda: bvh_data.export(out_prefix), config["bvh_joints"], "joints/s")
+    record("bvh_export_to_bvh", lambda: bvh_data.export_to_bvh(out_prefix + ".bvh"), config["bvh_frames"], "frames/s")
+
+    # Dataset indexing and iteration
+    from rig_dataset import BVHDataset
+
+    dataset_dir = os.path.join(work_dir, "dataset")
+    make_dataset(dataset_dir, config["dataset_samples"], config["dataset_vertices"])
+    record("dataset_index_build", lambda: BVHDataset(dataset_dir, rebuild_index=True),
+           config["dataset_samples"], "samples/s")
+    record("dataset_index_load", lambda: BVHDataset(dataset_dir), config["dataset_samples"], "samples/s")
+
+    def iterate(**kwargs):
+        dataset = BVHDataset(dataset_dir, **kwargs)
+        for i in range(len(dataset)):
+            dataset[i]
+
+    record("dataset_iterate", lambda: iterate(), config["dataset_samples"], "samples/s")
+    record("dataset_iterate_skel", lambda: iterate(fields=["skel", "link"]), config["dataset_samples"], "samples/s")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the time or peak memory ratio of every benchmark against the baseline, return the regressions."""
+    regressions = []
+    print(f"\n{'benchmark':<28} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        if "peak_bytes" in result:
+            key, scale, unit = "peak_bytes", 1 / 2 ** 20, "MiB"
+        else:
+            # The fastest run is the least affected by other load on the machine
+            key, scale, unit = "min_seconds", 1000, "ms"
+        ratio = result[key] / baseline[name][key]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<28} {baseline[name][key] * scale:10.2f}{unit:<3}{result[key] * scale:10.2f}{unit:<3}"
+              f"{ratio:8.2f}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the converters and the dataset loader.')
+    parser.add_argument('--quick', action='store_true', help='Small inputs, for a fast check.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark, the median and the minimum are reported and the minimum is '
+                        'compared against --baseline.')
+    parser.add_argument('--output', type=str, default=None, help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', type=str, default=None, help='Results JSON file to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against the baseline.')
+    parser.add_argument('--work-dir', type=str, default=None, help='Directory for the generated inputs, kept after the run.')
+    args = parser.parse_args()
+
+    preset = "quick" if args.quick else "full"
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="rigdataset_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        results = run_benchmarks(work_dir, CONFIGS[preset], args.repeat)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {"preset": preset, "config": CONFIGS[preset], "repeat": args.repeat,
+                 "python": platform.python_version(), "numpy": np.__version__,
+                 "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline["meta"]["preset"] != preset:
+            print(f"Baseline preset {baseline['meta']['preset']} differs from {preset}, ratios are not comparable")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmarks worse than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
@@ -0,0 +1,128 @@
+"""Padded collate and size-bucketed batch sampling for variable-size rigs
+"""
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+
+def pad_collate(batch, pad_value=0):
+    """Collate samples whose arrays differ in their first dimension.
+
+    Every array field is padded into one preallocated (B, max_len, ...) tensor.
+    For each field `f`, `f_lengths` holds the valid length of every sample
+    and `f_mask` is True on the valid rows. Non-array fields, e.g. joint
+    names, are returned as lists. Samples missing a field get length 0.
+    Integer fields are collated as int64 whatever their on-disk dtype, so
+    compact uint16 / int32 indices of different samples batch together.
+    """
+    keys = []
+    for sample in batch:
+        keys += [key for key in sample if key not in keys]
+
+    data = {}
+    for key in keys:
+        values = [sample.get(key) for sample in batch]
+        arrays = [v for v in values if v is not None]
+        if not all(isinstance(v, np.ndarray) and v.dtype.kind in 'biuf' and v.ndim > 0 for v in arrays):
+            data[key] = values
+            continue
+
+        lengths = np.array([len(v) if v is not None else 0 for v in values], dtype=np.int64)
+        dtype = np.result_type(*arrays)
+        if dtype.kind in 'iu':
+            # torch has little support for unsigned types, and indices are int64 there
+            dtype = np.dtype(np.int64)
+        tail = arrays[0].shape[1:]
+        padded = np.full((len(batch), lengths.max(initial=0)) + tail, pad_value, dtype=dtype)
+        for i, v in enumerate(values):
+            if v is not None:
+                padded[i, :len(v)] = v
+
+        data[key] = torch.from_numpy(padded)
+        data[f"{key}_lengths"] = torch.from_numpy(lengths)
+        data[f"{key}_mask"] = torch.arange(padded.shape[1])[None, :] < data[f"{key}_lengths"][:, None]
+    return data
+
+
+class BucketBatchSampler(Sampler):
+    """Batches samples of similar size to bound the padding overhead.
+
+    Samples are shuffled, split into pools of `pool_batches` batches, and
+    every pool is sorted by size and cut greedily into batches. A batch is
+    closed before its padding overhead, 1 - sum(sizes) / (len * max(sizes)),
+    exceeds `max_padding` for any size column, or before len * max(sizes)
+    of the first column exceeds `max_tokens`.
+
+    Args:
+        sizes (np.ndarray): (N,) or (N, k) precomputed sizes, e.g. BVHDataset.sample_sizes().
+        batch_size (int): maximum number of samples per batch.
+        max_padding (float): bound on the padding overhead per batch.
+        max_tokens (int): optional bound on the padded size of a batch.
+        shuffle (bool): shuffle samples and batches, reseeded by set_epoch().
+        pool_batches (int): batches per sorting pool, larger pools bucket tighter.
+        drop_last (bool): drop batches smaller than batch_size.
+        seed (int): base seed of the shuffle.
+    """
+
+    def __init__(self, sizes, batch_size, max_padding=0.1, max_tokens=None, shuffle=True,
+                 pool_batches=100, drop_last=False, seed=0):
+        sizes = np.asarray(sizes, dtype=np.int64)
+        self.sizes = sizes.reshape(len(sizes), -1)
+        self.batch_size = batch_size
+        self.max_padding = max_padding
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.pool_batches = pool_batches
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        self._batches = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        self._batches = None
+
+    def _fits(self, total, largest, count):
+        padded = count * largest
+        if np.any(total < (1 - self.max_padding) * padded):
+            return False
+        return self.max_tokens is None or padded[0] <= self.max_tokens
+
+    def _make_batches(self):
+        rng = np.random.default_rng((self.seed, self.epoch))
+        order = rng.permutation(len(self.sizes)) if self.shuffle else np.arange(len(self.sizes))
+
+        batches = []
+        pool_size = self.batch_size * self.pool_batches
+        for start in range(0, len(order), pool_size):
+            pool = order[start:start + pool_size]
+            # np.lexsort sorts by its last key, reverse the columns so the first one is primary
+            pool = pool[np.lexsort(self.sizes[pool].T[::-1])]
+            batch, total, largest = [], 0, 0
+            for idx in pool:
+                size = self.sizes[idx]
+                new_total, new_largest = total + size, np.maximum(largest, size)
+                if batch and (len(batch) == self.batch_size or not self._fits(new_total, new_largest, len(batch) + 1)):
+                    batches.append(batch)
+                    batch, new_total, new_largest = [], size, size
+                batch.append(int(idx))
+                total, largest = new_total, new_largest
+            if batch:
+                batches.append(batch)
+
+        if self.drop_last:
+            batches = [b for b in batches if len(b) == self.batch_size]
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self):
+        if self._batches is None:
+            self._batches = self._make_batches()
+        batches, self._batches = self._batches, None
+        return iter(batches)
+
+    def __len__(self):
+        if self._batches is None:
+            self._batches = self._make_batches()
+        return len(self._batches)
@@ -0,0 +1,135 @@
+"""Fixed-length motion windows over memory-mapped per-take frame arrays
+"""
+import os
+import sys
+from collections import OrderedDict
+import numpy as np
+from torch.utils.data import Dataset
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from schema import load_names
+from sample_index import open_sample_index
+
+
+class MotionClipDataset(Dataset):
+    def __init__(self, root_dir, window, stride=None, fps=None, resample="nearest", index_path=None,
+                 rebuild_index=False, max_open=1024):
+        """
+        Args:
+            root_dir (string): Directory written by `bvh2npy.py --motion`, one subdirectory per take.
+            window (int): Frames per clip, at `fps` if given.
+            stride (int): Frames between the starts of consecutive clips of a take, defaults to `window`.
+            fps (float): Resample every take to this frame rate, None keeps the native rate of each take.
+            resample (string): 'nearest' picks the closest source frame, 'linear' blends the two
+                closest ones. Blending Euler angles is only correct away from their wrap around.
+            index_path (string): Sidecar index file, defaults to <root_dir>/.bvhdataset_index.npz.
+            rebuild_index (bool): Rescan root_dir even if a valid index exists.
+            max_open (int): Takes kept memory-mapped at once.
+
+        Takes are never loaded whole. A clip maps the take's _motion.npy and
+        reads only the rows of the window, so random access costs one small
+        read per clip. Frame counts come from the sample index, only the
+        frame times are read when resampling.
+        """
+        if resample not in ("nearest", "linear"):
+            raise ValueError(f"Unknown resample mode: {resample}")
+        self.root_dir = root_dir
+        self.window = window
+        self.stride = stride or window
+        self.fps = fps
+        self.resample = resample
+        self.max_open = max_open
+        self._maps = OrderedDict()
+
+        index = open_sample_index(root_dir, index_path, rebuild_index)
+        file_sample = np.repeat(np.arange(len(index["samples"])), np.diff(index["sample_offsets"]))
+        is_motion = index["fields"] == "motion"
+        self.takes = index["samples"][file_sample[is_motion]]
+        self.paths = [os.path.join(root_dir, take, name) for take, name in zip(self.takes, index["files"][is_motion])]
+        self.frames = np.maximum(index["shapes"][is_motion, 0], 0)
+
+        # Source frames per clip frame, 1 at the native rate
+        self.steps = np.ones(len(self.takes))
+        if fps is not None:
+            frame_times = np.array([self.frame_time(take) for take in range(len(self.takes))])
+            if np.any(frame_times <= 0):
+                raise ValueError(f"Takes without a frame time can't be resampled: {self.takes[frame_times <= 0]}")
+            steps = 1 / (fps * frame_times)
+            # BVH frame times are rounded, e.g. 0.008333 for 120 fps, snap to whole steps
+            self.steps = np.where(np.isclose(steps, np.rint(steps), rtol=1e-3), np.rint(steps), steps)
+        clip_frames = np.where(self.frames > 0, np.floor((self.frames - 1) / self.steps).astype(np.int64) + 1, 0)
+
+        # Clips of every take and their flat index offsets, clips themselves are never listed
+        counts = np.maximum((clip_frames - window) // self.stride + 1, 0)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, idx):
+        return self.clip(*self.locate(idx))
+
+    def locate(self, idx):
+        """(take, start) of clip idx, start counted in frames at the dataset rate."""
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Clip {idx} out of range for {len(self)} clips")
+        take = int(np.searchsorted(self.offsets, idx, side='right')) - 1
+        return take, int(idx - self.offsets[take]) * self.stride
+
+    def motion(self, take):
+        """Read-only memory map of the (frames, channels) array of a take."""
+        # Every step is a single dict operation, safe with the threads of PrefetchIterableDataset
+        motion = self._maps.get(take)
+        if motion is not None:
+            try:
+                self._maps.move_to_end(take)
+            except KeyError:
+                pass
+            return motion
+        # Mapped lazily, so the dataset can be created before DataLoader workers fork
+        motion = np.load(self.paths[take], mmap_mode='r')
+        self._maps[take] = motion
+        while len(self._maps) > self.max_open:
+            try:
+                self._maps.popitem(last=False)
+            except KeyError:
+                break
+        return motion
+
+    def frame_time(self, take):
+        path = self.paths[take][:-len("_motion.npy")] + "_frame_time.npy"
+        return float(np.load(path))
+
+    def channels(self, take):
+        """(channels, 2) joint name and channel name of every column of a take."""
+        path = self.paths[take][:-len("_motion.npy")] + "_channels.npy"
+        return np.load(path)
+
+    def joint_names(self, take):
+        return load_names(self.paths[take][:-len("_motion.npy")] + "_names.npy")
+
+    def clip(self, take, start, window=None):
+        """(window, channels) float32 frames of a take from frame `start` at the dataset rate."""
+        window = window or self.window
+        motion = self.motion(take)
+        step = self.steps[take]
+        if step == 1:
+            return np.array(motion[start:start + window], dtype=np.float32)
+        if step == int(step):
+            # Integer downsampling is a strided view, no index array
+            begin = start * int(step)
+            return np.array(motion[begin:begin + window * int(step):int(step)], dtype=np.float32)
+
+        positions = (start + np.arange(window)) * step
+        if self.resample == "nearest":
+            rows = np.minimum(np.rint(positions).astype(np.int64), len(motion) - 1)
+            return np.array(motion[rows], dtype=np.float32)
+        low = np.minimum(np.floor(positions).astype(np.int64), len(motion) - 1)
+        high = np.minimum(low + 1, len(motion) - 1)
+        # One read of the covered rows, then blend
+        block = np.asarray(motion[low[0]:high[-1] + 1], dtype=np.float32)
+        weight = (positions - low)[:, None].astype(np.float32)
+        return block[low - low[0]] * (1 - weight) + block[high - low[0]] * weight
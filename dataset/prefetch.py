@@ -0,0 +1,131 @@
+"""Iterable datasets that shard samples across ranks and DataLoader workers and prefetch them with threads
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+class PrefetchIterableDataset(IterableDataset):
+    """Iterates a map-style dataset with sharding, thread-pool prefetch and shuffle buffers.
+
+    Every epoch the sample order is a permutation of blocks of
+    `shuffle_block` consecutive indices, seeded by (seed, epoch) and thus
+    the same in every process. Rank r takes every world_size-th sample of
+    it and DataLoader worker w of that rank every num_workers-th sample of
+    those. Each worker loads its samples on `threads` threads, keeping up to
+    `prefetch` loads in flight, so per-file latency overlaps instead of
+    adding up. Loaded samples optionally pass through a shuffle buffer of
+    `shuffle_buffer` samples, which randomizes the order of block shuffled
+    streams while the reads stay sequential within a block.
+
+    The threads call dataset[i] concurrently and in no fixed order, so
+    transforms must not share random state across samples. SurfaceSampler
+    seeds every sample by its index and receives set_epoch() from here.
+
+    Args:
+        dataset (Dataset): map-style dataset, e.g. BVHDataset, PackedBVHDataset or MotionClipDataset.
+            dataset[i] is called from several threads at once.
+        threads (int): loader threads per DataLoader worker.
+        prefetch (int): samples loaded ahead of the consumer, bounds the memory in flight.
+        shuffle (bool): shuffle the order, reseeded by set_epoch().
+        shuffle_block (int): consecutive indices kept together by the shuffle, 1 shuffles samples.
+        shuffle_buffer (int): samples in the shuffle buffer, 0 disables it.
+        seed (int): base seed of the shuffles.
+        rank (int): rank of this process, defaults to torch.distributed's or 0.
+        world_size (int): number of ranks, defaults to torch.distributed's or 1.
+        drop_last (bool): drop the tail that doesn't split evenly across ranks instead of
+            repeating samples to pad it, every rank always gets the same number of samples.
+    """
+
+    def __init__(self, dataset, threads=8, prefetch=32, shuffle=True, shuffle_block=1, shuffle_buffer=0, seed=0,
+                 rank=None, world_size=None, drop_last=False):
+        if rank is None or world_size is None:
+            distributed = dist.is_available() and dist.is_initialized()
+            rank = rank if rank is not None else (dist.get_rank() if distributed else 0)
+            world_size = world_size if world_size is not None else (dist.get_world_size() if distributed else 1)
+        if not 0 <= rank < world_size:
+            raise ValueError(f"Rank {rank} out of range for world size {world_size}")
+        self.dataset = dataset
+        self.threads = threads
+        self.prefetch = max(prefetch, threads)
+        self.shuffle = shuffle
+        self.shuffle_block = shuffle_block
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        # Also reseeds per-sample transforms, e.g. SurfaceSampler
+        transform = getattr(self.dataset, "transform", None)
+        if hasattr(transform, "set_epoch"):
+            transform.set_epoch(epoch)
+
+    def _order(self):
+        n = len(self.dataset)
+        order = np.arange(n)
+        if self.shuffle:
+            rng = np.random.default_rng((self.seed, self.epoch))
+            blocks = rng.permutation(-(-n // self.shuffle_block))
+            starts = blocks * self.shuffle_block
+            # Indices of the blocks in permuted order, the last block may be short
+            order = (starts[:, None] + np.arange(self.shuffle_block)).ravel()
+            order = order[order < n]
+        if self.drop_last:
+            return order[:n - n % self.world_size]
+        # Pad with the first samples like DistributedSampler, so no rank runs out early
+        padding = -n % self.world_size
+        return np.concatenate([order, np.resize(order, padding)]) if n and padding else order
+
+    def shard(self):
+        """Indices read by this rank and DataLoader worker in this epoch."""
+        order = self._order()[self.rank::self.world_size]
+        worker = get_worker_info()
+        if worker is not None:
+            order = order[worker.id::worker.num_workers]
+        return order
+
+    def __len__(self):
+        # Samples of this rank, over all its workers
+        return len(self._order()[self.rank::self.world_size])
+
+    def _load(self, indices):
+        executor = ThreadPoolExecutor(self.threads, thread_name_prefix="prefetch")
+        pending = deque()
+        try:
+            for idx in indices:
+                if len(pending) >= self.prefetch:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(self.dataset.__getitem__, int(idx)))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Also reached when the consumer stops early
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def __iter__(self):
+        samples = self._load(self.shard())
+        if not self.shuffle or self.shuffle_buffer <= 1:
+            yield from samples
+            return
+
+        worker = get_worker_info()
+        rng = np.random.default_rng((self.seed, self.epoch, self.rank, worker.id if worker is not None else 0))
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            # Emit a random buffered sample and keep the new one in its place
+            i = rng.integers(len(buffer))
+            buffer[i], sample = sample, buffer[i]
+            yield sample
+        rng.shuffle(buffer)
+        yield from buffer
@@ -1,34 +1,232 @@
 import os
+import sys
 import torch
 import numpy as np
 from torch.utils.data import Dataset
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from kinematics import forward_kinematics, offsets_from_positions, parents_from_links
+from pack import PackedShards
+from schema import FEATURE_FIELDS, LOD_FIELDS, SKIN_CSR_FIELDS, SKIN_TOPK_FIELDS, lod_field, upcast
+from mesh_features import compute_mesh_features
+from sample_index import INDEX_FILE, open_sample_index
+
+# Data of the full-resolution mesh, not served next to a level of detail unless requested
+FULL_RESOLUTION_FIELDS = FEATURE_FIELDS + SKIN_CSR_FIELDS + SKIN_TOPK_FIELDS
+
 class BVHDataset(Dataset):
-    def __init__(self, root_dir):
+    def __init__(self, root_dir, fields=None, mmap_mode=None, upcast=False, index_path=None, rebuild_index=False,
+                 features=False, transform=None, lod=None):
         """
         Args:
             root_dir (string): Directory with all the subdirectories containing numpy files.
+            fields (list): Fields to load, e.g. ['skel', 'link']. None loads every .npy of a sample.
+            mmap_mode (string): Passed to np.load to memory-map the arrays instead of reading them.
+            upcast (bool): Widen compact arrays to float64 / int64 after loading.
+            index_path (string): Sidecar index file, defaults to <root_dir>/.bvhdataset_index.npz.
+            rebuild_index (bool): Rescan root_dir even if a valid index exists.
+            features (bool): Add the mesh features of mesh_features(idx) to every sample.
+            transform (callable): Applied to every sample dict, e.g. sampling.SurfaceSampler.
+                Transforms with `indexed = True` are called as transform(sample, idx).
+            lod (int): Serve level `lod` written by scripts/lod.py as vertices, faces and remap
+                instead of the full-resolution mesh, None for the full mesh.
         """
+        if lod and features:
+            raise ValueError("Mesh features are only available for the full-resolution mesh")
         self.root_dir = root_dir
-        self.data_paths = []
-        for subdir in os.listdir(root_dir):
-            subdir_path = os.path.join(root_dir, subdir)
-            if os.path.isdir(subdir_path):
-                data_files = [os.path.join(subdir_path, f) for f in os.listdir(subdir_path) if f.endswith('.npy')]
-                if data_files:
-                    self.data_paths.append(data_files)
+        self.fields = fields
+        self.mmap_mode = mmap_mode
+        self.upcast = upcast
+        self.index_path = index_path or os.path.join(root_dir, INDEX_FILE)
+        self.index = open_sample_index(root_dir, self.index_path, rebuild_index)
+        self.features = features
+        self.transform = transform
+        self.lod = lod
+        self._data_paths = None
+        self._features_current = None
+
+    @property
+    def data_paths(self):
+        # Full path lists are only built on demand, the index keeps flat arrays
+        if self._data_paths is None:
+            self._data_paths = [self.sample_files(i) for i in range(len(self))]
+        return self._data_paths
+
+    def sample_files(self, idx):
+        """Paths of the .npy files of one sample."""
+        begin, end = self.index["sample_offsets"][idx], self.index["sample_offsets"][idx + 1]
+        subdir_path = os.path.join(self.root_dir, self.index["samples"][idx])
+        return [os.path.join(subdir_path, f) for f in self.index["files"][begin:end]]
 
     def __len__(self):
-        return len(self.data_paths)
+        return len(self.index["samples"])
+
+    def sample_sizes(self, fields=('vertices', 'skel')):
+        """(N, len(fields)) leading dimension of every sample's field, 0 if missing.
+
+        Read from the index, no file is opened. Used by BucketBatchSampler.
+        With `lod` set, vertices and faces are those of the level.
+        """
+        counts = np.diff(self.index["sample_offsets"])
+        file_sample = np.repeat(np.arange(len(counts)), counts)
+        sizes = np.zeros((len(counts), len(fields)), dtype=np.int64)
+        for column, field in enumerate(fields):
+            if self.lod and field in LOD_FIELDS:
+                field = lod_field(field, self.lod)
+            is_field = self.index["fields"] == field
+            sizes[file_sample[is_field], column] = np.maximum(self.index["shapes"][is_field, 0], 0)
+        return sizes
 
     def __getitem__(self, idx):
-        data_files = self.data_paths[idx]
+        data = self.load(idx, self.fields, self.lod)
+        if self.features:
+            data.update(self.mesh_features(idx))
+        if self.transform is not None:
+            data = self.transform(data, idx) if getattr(self.transform, "indexed", False) else self.transform(data)
+        return data
+
+    def load(self, idx, fields=None, lod=None):
+        """Load the requested fields of one sample, only reading their files.
+
+        Files are mapped to fields by their suffix (see scripts/schema.py),
+        files outside the schema are keyed by their name without the sample
+        prefix and only loaded when all fields are requested. With `lod`, the
+        level's files are loaded as vertices, faces and remap. Other levels
+        are only loaded when requested by name, e.g. 'lod2_vertices', and so
+        are the per-vertex data of the full-resolution mesh, mesh features and
+        skinning weights, which remap carries over to the level.
+        """
+        begin, end = self.index["sample_offsets"][idx], self.index["sample_offsets"][idx + 1]
+        sample = str(self.index["samples"][idx])
+        # Level fields -> the names they are served under
+        served = {lod_field(field, lod): field for field in LOD_FIELDS} if lod else {}
         data = {}
-        for f in data_files:
-            key = os.path.basename(f).split('_')[0]  # Extract key from file name
-            data[key] = np.load(f)
+        has_mesh = has_level = False
+        for i in range(begin, end):
+            filename = str(self.index["files"][i])
+            field = str(self.index["fields"][i])
+            if lod and field in ("vertices", "faces"):
+                has_mesh = True
+                continue
+            has_level = has_level or field in served
+            field = served.get(field, field)
+            if not field:
+                if fields is not None:
+                    continue
+                stem = filename[:-len('.npy')]
+                field = stem[len(sample) + 1:] if stem.startswith(sample + '_') else stem
+            elif fields is not None and field not in fields:
+                continue
+            elif fields is None and (field.startswith("lod") or lod and field in FULL_RESOLUTION_FIELDS):
+                continue
+
+            path = os.path.join(self.root_dir, sample, filename)
+            if self.index["dtypes"][i] == '|O':
+                # Pickled arrays can't be memory-mapped
+                data[field] = np.load(path, allow_pickle=True)
+            else:
+                data[field] = np.load(path, mmap_mode=self.mmap_mode)
+                if self.upcast:
+                    data[field] = upcast(data[field])
+        if has_mesh and not has_level:
+            raise FileNotFoundError(f"Sample {sample} has no level {lod}, run scripts/lod.py")
         return data
 
+    def skinning(self, idx):
+        """Skinning weights of one sample, memory-mapped.
+
+        Returns the CSR fields skin_indptr, skin_joints and skin_weights, or
+        skin_topk_joints and skin_topk_weights, whichever the sample has. No
+        dense (V, J) matrix is built and only the rows that are read get
+        paged in, e.g. data['skin_joints'][indptr[v]:indptr[v + 1]].
+        """
+        begin, end = self.index["sample_offsets"][idx], self.index["sample_offsets"][idx + 1]
+        sample = str(self.index["samples"][idx])
+        data = {}
+        for i in range(begin, end):
+            field = str(self.index["fields"][i])
+            if field in SKIN_CSR_FIELDS or field in SKIN_TOPK_FIELDS:
+                data[field] = np.load(os.path.join(self.root_dir, sample, str(self.index["files"][i])), mmap_mode='r')
+        return data
+
+    def mesh_features(self, idx):
+        """Normals, CSR adjacency, bounds and normalization of a sample's mesh.
+
+        Read from the files written by scripts/mesh_features.py. When they are
+        missing or older than the sample's _vertices.npy / _faces.npy, the
+        features are computed from the mesh instead, rerun mesh_features.py to
+        cache them again. Paths and file times come from the sample index, so
+        no directory is listed per sample.
+        """
+        begin, end = self.index["sample_offsets"][idx], self.index["sample_offsets"][idx + 1]
+        sample_dir = os.path.join(self.root_dir, str(self.index["samples"][idx]))
+        files = {}
+        for i in range(begin, end):
+            field = str(self.index["fields"][i])
+            if field in ("vertices", "faces") or field in FEATURE_FIELDS:
+                files[field] = os.path.join(sample_dir, str(self.index["files"][i]))
+        if "vertices" not in files or "faces" not in files:
+            return {}
+        if self.features_current[idx]:
+            return {field: np.load(files[field], mmap_mode=self.mmap_mode) for field in FEATURE_FIELDS}
+        return compute_mesh_features(np.load(files["vertices"]), np.load(files["faces"]))
+
+    @property
+    def features_current(self):
+        """(N,) bool, whether every feature file of a sample is newer than its mesh, per the index."""
+        if self._features_current is None:
+            counts = np.diff(self.index["sample_offsets"])
+            file_sample = np.repeat(np.arange(len(counts)), counts)
+            fields, mtimes = self.index["fields"], self.index["mtimes"]
+            is_mesh = np.isin(fields, ["vertices", "faces"])
+            is_feature = np.isin(fields, list(FEATURE_FIELDS))
+            newest_mesh = np.full(len(counts), np.iinfo(np.int64).min)
+            np.maximum.at(newest_mesh, file_sample[is_mesh], mtimes[is_mesh])
+            oldest_feature = np.full(len(counts), np.iinfo(np.int64).max)
+            np.minimum.at(oldest_feature, file_sample[is_feature], mtimes[is_feature])
+            n_features = np.bincount(file_sample[is_feature], minlength=len(counts))
+            self._features_current = (n_features == len(FEATURE_FIELDS)) & (oldest_feature >= newest_mesh)
+        return self._features_current
+
+    def pose(self, idx, rotations, translations=None):
+        """Posed global joint positions of a sample's skeleton.
+
+        Args:
+            idx (int): sample index.
+            rotations (np.ndarray): (..., J, 3, 3) local joint rotations, e.g. (batch, frames, J, 3, 3).
+            translations (np.ndarray): optional (..., J, 3) local translations, defaults to the rest offsets.
+
+        Returns:
+            np.ndarray: (..., J, 3) global joint positions.
+        """
+        data = self.load(idx, ['skel', 'link'])
+        if 'skel' not in data or 'link' not in data:
+            raise FileNotFoundError("Required _skel.npy and _link.npy files not found for the sample.")
+        rest_positions = data['skel']
+        parents = parents_from_links(data['link'], len(rest_positions))
+        offsets = offsets_from_positions(rest_positions, parents)
+        global_positions, _ = forward_kinematics(parents, offsets, rotations, translations)
+        return global_positions
+
+class PackedBVHDataset(Dataset):
+    def __init__(self, root_dir, fields=None):
+        """
+        Args:
+            root_dir (string): Directory written by scripts/pack.py.
+            fields (list): Fields to return, defaults to all of vertices, faces, skel, link and names.
+        """
+        self.root_dir = root_dir
+        self.fields = fields
+        self.shards = PackedShards(root_dir)
+
+    def __len__(self):
+        return len(self.shards)
+
+    def __getitem__(self, idx):
+        # Read-only views into the memory-mapped shards, no file is opened per sample
+        return self.shards.get(idx, self.fields)
+
 # Example usage:
 # dataset = BVHDataset('path/to/root_dir')
 # data = dataset[0]  # Get the first data point
@@ -0,0 +1,125 @@
+"""Persistent index of the sample directories under a dataset root
+"""
+import os
+import numpy as np
+from schema import field_of
+
+INDEX_FILE = ".bvhdataset_index.npz"
+INDEX_VERSION = 6
+
+
+def read_npy_header(path):
+    """Shape and dtype of a .npy file, read from its header only."""
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    return shape, dtype
+
+
+def build_sample_index(root_dir):
+    """Scan root_dir once and describe every .npy file of every sample directory.
+
+    Returns a dict of flat arrays: `samples` (subdirectory names), `sample_offsets`
+    (CSR offsets into the file arrays), and per file `files`, `fields` (schema
+    field, empty outside the schema), `sizes`, `mtimes`, `dtypes` and `shapes` (padded with -1).
+    `dirs` and `dir_mtimes` stamp every subdirectory for load_sample_index().
+    """
+    samples, offsets = [], [0]
+    files, fields, sizes, mtimes, dtypes, shapes = [], [], [], [], [], []
+    dirs, dir_mtimes = [], []
+    subdirs = sorted((entry for entry in os.scandir(root_dir) if entry.is_dir()), key=lambda e: e.name)
+    for subdir in subdirs:
+        # Taken before the listing, a change during the scan leaves the stamp stale
+        dirs.append(subdir.name)
+        dir_mtimes.append(os.stat(subdir.path).st_mtime_ns)
+        npy_files = sorted((entry for entry in os.scandir(subdir.path)
+                            if entry.name.endswith('.npy') and entry.is_file()), key=lambda e: e.name)
+        if not npy_files:
+            continue
+        for entry in npy_files:
+            shape, dtype = read_npy_header(entry.path)
+            files.append(entry.name)
+            fields.append(field_of(entry.name) or "")
+            stat = entry.stat()
+            sizes.append(stat.st_size)
+            mtimes.append(stat.st_mtime_ns)
+            dtypes.append(dtype.str)
+            shapes.append(shape)
+        samples.append(subdir.name)
+        offsets.append(len(files))
+
+    max_ndim = max((len(shape) for shape in shapes), default=0)
+    padded = np.full((len(shapes), max_ndim), -1, dtype=np.int64)
+    for i, shape in enumerate(shapes):
+        padded[i, :len(shape)] = shape
+
+    return {
+        "samples": np.array(samples, dtype=str),
+        "sample_offsets": np.array(offsets, dtype=np.int64),
+        "files": np.array(files, dtype=str),
+        "fields": np.array(fields, dtype=str),
+        "sizes": np.array(sizes, dtype=np.int64),
+        "mtimes": np.array(mtimes, dtype=np.int64),
+        "dtypes": np.array(dtypes, dtype=str),
+        "shapes": padded,
+        "dirs": np.array(dirs, dtype=str),
+        "dir_mtimes": np.array(dir_mtimes, dtype=np.int64),
+    }
+
+
+def save_sample_index(index, index_path, root_dir):
+    """Save the index and stamp it with the root directory's mtime.
+
+    The stamp is applied after the file is in place, since writing the
+    sidecar into root_dir itself changes the directory's mtime.
+    """
+    tmp_path = f"{index_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, version=INDEX_VERSION, **index)
+    os.replace(tmp_path, index_path)
+    root_stat = os.stat(root_dir)
+    os.utime(index_path, ns=(root_stat.st_atime_ns, root_stat.st_mtime_ns))
+
+
+def load_sample_index(index_path, root_dir):
+    """Load a saved index, None if it is missing or stale.
+
+    Adding or removing samples changes the mtime of root_dir, and adding,
+    removing or renaming files, including the atomic rewrites of the
+    converters, changes the mtime of their sample directory. Validation costs
+    one stat call per sample directory. A file overwritten in place by other
+    tools changes neither, pass rebuild=True to open_sample_index() then.
+    """
+    try:
+        if os.stat(index_path).st_mtime_ns != os.stat(root_dir).st_mtime_ns:
+            return None
+        with np.load(index_path) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                return None
+            index = {key: data[key] for key in data.files if key != "version"}
+        for name, mtime in zip(index["dirs"], index["dir_mtimes"]):
+            if os.stat(os.path.join(root_dir, name)).st_mtime_ns != mtime:
+                return None
+        return index
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def open_sample_index(root_dir, index_path=None, rebuild=False):
+    """The saved index of root_dir, rebuilt and saved when missing, stale or `rebuild` is set."""
+    index_path = index_path or os.path.join(root_dir, INDEX_FILE)
+    # Scan the tree only when the saved index is missing or stale
+    index = None if rebuild else load_sample_index(index_path, root_dir)
+    if index is None:
+        root_mtime = os.stat(root_dir).st_mtime_ns
+        index = build_sample_index(root_dir)
+        # Samples added or removed during the scan, the index is used but not saved
+        if os.stat(root_dir).st_mtime_ns != root_mtime:
+            return index
+        try:
+            save_sample_index(index, index_path, root_dir)
+        except OSError as e:
+            print(f"Could not save sample index to {index_path}: {e}")
+    return index
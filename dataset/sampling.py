@@ -0,0 +1,147 @@
+"""Area-weighted point sampling on mesh surfaces, vectorized over many meshes at once
+"""
+import os
+import sys
+import threading
+import numpy as np
+from torch.utils.data import get_worker_info
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from mesh_features import face_area_cdf
+
+# Module level, so samplers stay picklable for DataLoader workers
+_THREAD_RNGS_LOCK = threading.Lock()
+
+
+def sample_surfaces(vertices, faces, num_points, seed=None, cdfs=None, return_faces=False):
+    """Sample num_points points uniformly by area from the surface of every mesh.
+
+    The meshes are concatenated, so every step is one NumPy call for the
+    whole batch: areas, one inverse-CDF np.searchsorted of sorted uniform
+    draws over the cumulative areas offset by mesh, a per-mesh shuffle of
+    the picked faces and barycentric coordinates with the square root trick.
+
+    Args:
+        vertices (list): (V_i, 3) vertex arrays.
+        faces (list): (F_i, 3) triangle index arrays.
+        num_points (int): points per mesh.
+        seed (int or np.random.Generator): seed or generator, None for a fresh random state.
+        cdfs (list): optional precomputed face_area_cdf() per mesh, e.g. the `area_cdf` field
+            written by mesh_features.py, None entries are computed.
+        return_faces (bool): also return the face index of every point.
+
+    Returns:
+        (M, num_points, 3) float32 points, and (M, num_points) int64 face indices into
+        each mesh's faces if return_faces is set.
+    """
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    n_meshes = len(vertices)
+    cdfs = cdfs if cdfs is not None else [None] * n_meshes
+    cdfs = [face_area_cdf(v, f) if cdf is None else np.asarray(cdf, dtype=np.float64)
+            for v, f, cdf in zip(vertices, faces, cdfs)]
+    for i, (f, cdf) in enumerate(zip(faces, cdfs)):
+        if len(f) == 0 or cdf[-1] <= 0:
+            raise ValueError(f"Mesh {i} has no surface to sample")
+
+    # Faces and cumulative areas of all meshes end to end
+    vertex_offsets = np.cumsum([0] + [len(v) for v in vertices[:-1]])
+    face_offsets = np.cumsum([0] + [len(f) for f in faces])
+    all_vertices = np.concatenate([np.asarray(v, dtype=np.float32) for v in vertices])
+    all_faces = np.concatenate([np.asarray(f, dtype=np.int64) + offset for f, offset in zip(faces, vertex_offsets)])
+    totals = np.array([cdf[-1] for cdf in cdfs])
+    area_offsets = np.concatenate([[0.0], np.cumsum(totals)[:-1]])
+    all_cdf = np.concatenate([cdf + offset for cdf, offset in zip(cdfs, area_offsets)])
+
+    # Inverse CDF: a uniform draw within each mesh's area range picks the face. Sorted draws
+    # make the search sequential, the faces are shuffled within each mesh afterwards.
+    draws = rng.random((n_meshes, num_points))
+    draws.sort(axis=1)
+    targets = area_offsets[:, None] + draws * totals[:, None]
+    face_index = np.searchsorted(all_cdf, targets.ravel(), side='right')
+    # Guard the upper end of every mesh against rounding
+    face_index = np.minimum(face_index, np.repeat(face_offsets[1:] - 1, num_points))
+    order = rng.permuted(np.broadcast_to(np.arange(num_points), (n_meshes, num_points)), axis=1)
+    face_index = np.take(face_index, (order + np.arange(n_meshes)[:, None] * num_points).ravel())
+
+    # Barycentric weights with the square root trick, uniform over each triangle
+    r1 = np.sqrt(rng.random(len(face_index), dtype=np.float32))
+    r2 = rng.random(len(face_index), dtype=np.float32)
+    weights = np.empty((len(face_index), 3), dtype=np.float32)
+    weights[:, 0] = 1 - r1
+    weights[:, 1] = r1 * (1 - r2)
+    weights[:, 2] = r1 * r2
+    triangles = np.take(all_vertices, np.take(all_faces, face_index, axis=0), axis=0)
+    points = np.einsum('nk,nkd->nd', weights, triangles)
+    points = points.reshape(n_meshes, num_points, 3)
+    if return_faces:
+        return points, (face_index - np.repeat(face_offsets[:-1], num_points)).reshape(n_meshes, num_points)
+    return points
+
+
+def sample_surface(vertices, faces, num_points, seed=None, cdf=None, return_faces=False):
+    """sample_surfaces() for a single mesh, (num_points, 3) points."""
+    result = sample_surfaces([vertices], [faces], num_points, seed, [cdf], return_faces)
+    if return_faces:
+        return result[0][0], result[1][0]
+    return result[0]
+
+
+class SurfaceSampler:
+    """Dataset transform adding `points` sampled from a sample's `vertices` and `faces`.
+
+    Use as BVHDataset(root_dir, features=True, transform=SurfaceSampler(2048, seed=0)).
+    The precomputed `area_cdf` feature of the sample is used when present.
+
+    BVHDataset passes the sample index to the transform, and every sample draws
+    from its own generator seeded with (seed, epoch, index). The points then
+    don't depend on the worker or thread that loads the sample, e.g. under
+    PrefetchIterableDataset, and no generator is shared between threads. Call
+    set_epoch() for new points every epoch. Called without an index, each
+    thread draws from its own generator, reproducible on a single thread only.
+
+    Args:
+        num_points (int): points per sample.
+        seed (int): base seed, None for a fresh random state.
+        return_faces (bool): add the source face index of every point as `point_faces`.
+        keep_mesh (bool): keep `vertices` and `faces` in the sample.
+    """
+    # Called as transform(sample, idx) by BVHDataset
+    indexed = True
+
+    def __init__(self, num_points, seed=None, return_faces=False, keep_mesh=True):
+        self.num_points = num_points
+        self.seed = seed
+        self.return_faces = return_faces
+        self.keep_mesh = keep_mesh
+        self.epoch = 0
+        # Fallback generators of calls without an index, per thread
+        self._thread_rngs = {}
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _rng(self, idx):
+        if idx is not None:
+            return np.random.default_rng(None if self.seed is None else (self.seed, self.epoch, idx))
+        thread = threading.get_ident()
+        if thread not in self._thread_rngs:
+            # Created on first use, i.e. inside the DataLoader worker
+            worker = get_worker_info()
+            worker_id = worker.id if worker is not None else 0
+            with _THREAD_RNGS_LOCK:
+                seed = None if self.seed is None else (self.seed, worker_id, len(self._thread_rngs))
+                self._thread_rngs[thread] = np.random.default_rng(seed)
+        return self._thread_rngs[thread]
+
+    def __call__(self, sample, idx=None):
+        result = sample_surface(sample["vertices"], sample["faces"], self.num_points, self._rng(idx),
+                                sample.get("area_cdf"), self.return_faces)
+        sample = dict(sample)
+        if self.return_faces:
+            sample["points"], sample["point_faces"] = result
+        else:
+            sample["points"] = result
+        if not self.keep_mesh:
+            sample.pop("vertices")
+            sample.pop("faces")
+        return sample
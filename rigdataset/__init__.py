@@ -0,0 +1,77 @@
+"""Rig dataset conversion and loading
+
+Importing the package only sets up the module path. The converters, the
+datasets (torch) and the plotting helpers (matplotlib) are imported on first
+attribute access, e.g. `rigdataset.OBJData` or `rigdataset.BVHDataset`.
+
+The tools import each other as top-level modules with plain names (`schema`,
+`utils`, `pack`, ...), so their directories go to the front of sys.path and
+take precedence over installed modules of the same name, e.g. PyPI `schema`.
+Such a module imported before rigdataset keeps its place in sys.modules and
+is reported with a warning.
+"""
+import os
+import sys
+import warnings
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_DIRS = []
+for _name in ("dataset", "scripts"):
+    # Installed inside the package, or the source tree next to it
+    for _path in (os.path.join(_HERE, _name), os.path.join(_HERE, "..", _name)):
+        if os.path.isdir(_path):
+            _path = os.path.normpath(_path)
+            if _path in sys.path:
+                sys.path.remove(_path)
+            # scripts ends up first, it holds the modules the datasets import
+            sys.path.insert(0, _path)
+            _DIRS.append(_path)
+            break
+
+for _path in _DIRS:
+    for _file in os.listdir(_path):
+        _module = sys.modules.get(os.path.splitext(_file)[0]) if _file.endswith(".py") else None
+        _origin = getattr(_module, "__file__", None)
+        if _origin is not None and os.path.dirname(os.path.abspath(_origin)) != _path:
+            warnings.warn(f"Module {_module.__name__!r} was imported from {_origin} before rigdataset, its tools "
+                          f"need {os.path.join(_path, _file)} under that name. Import rigdataset first.",
+                          RuntimeWarning, stacklevel=2)
+
+# Public name -> module defining it
+_EXPORTS = {
+    "OBJData": "obj2npy",
+    "process_obj_files": "obj2npy",
+    "BVHData": "bvh2npy",
+    "process_bvh_files": "bvh2npy",
+    "forward_kinematics": "kinematics",
+    "compute_mesh_features": "mesh_features",
+    "cluster_vertices": "lod",
+    "find_duplicates": "dedup",
+    "load_exclusions": "dedup",
+    "pack_dataset": "pack",
+    "PackedShards": "pack",
+    "inspect_path": "inspect_dataset",
+    "render_thumbnails": "utils",
+    "BVHDataset": "rig_dataset",
+    "PackedBVHDataset": "rig_dataset",
+    "MotionClipDataset": "motion_dataset",
+    "PrefetchIterableDataset": "prefetch",
+    "SurfaceSampler": "sampling",
+    "sample_surfaces": "sampling",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,3 @@
+from rigdataset.cli import main
+
+main()
@@ -0,0 +1,46 @@
+"""`rigdataset` command line entry point
+
+Only the module of the requested subcommand is imported, so converting never
+loads matplotlib or torch.
+"""
+import sys
+import argparse
+import importlib
+
+import rigdataset  # noqa: F401, sets up the module path
+
+# Subcommand -> (module, argument builder, runner, description)
+COMMANDS = {
+    "obj2npy": ("obj2npy", "add_arguments", "main", "Convert a directory of OBJ files to numpy arrays."),
+    "bvh2npy": ("bvh2npy", "add_arguments", "main", "Convert a directory of BVH files to numpy arrays."),
+    "features": ("mesh_features", "add_arguments", "main",
+                 "Precompute normals, adjacency, bounds, normalization and area CDFs of converted meshes."),
+    "lod": ("lod", "add_arguments", "main", "Build vertex clustering levels of detail of converted meshes."),
+    "dedup": ("dedup", "add_arguments", "main", "Find duplicate samples by geometric fingerprints."),
+    "pack": ("pack", "add_arguments", "main", "Pack per-sample numpy directories into shard files."),
+    "inspect": ("inspect_dataset", "add_arguments", "main",
+                "Summarize converted samples, packed shards or single files."),
+    "show": ("utils", "add_show_arguments", "show_main", "Display a sample directory or render it to a PNG file."),
+    "thumbnails": ("utils", "add_arguments", "main", "Render PNG thumbnails of every sample without a display."),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    epilog = "commands:\n" + "\n".join(f"  {name:<12} {command[3]}" for name, command in COMMANDS.items())
+    parser = argparse.ArgumentParser(prog="rigdataset", usage="%(prog)s [-h] command [args ...]",
+                                     description="Rig dataset conversion tools, see rigdataset <command> -h.",
+                                     epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=COMMANDS, metavar="command", help="one of: " + ", ".join(COMMANDS))
+    # Only the command name is parsed here, its arguments by the command's own parser
+    args = parser.parse_args(argv[:1])
+
+    module_name, add_arguments, run, description = COMMANDS[args.command]
+    module = importlib.import_module(module_name)
+    command_parser = argparse.ArgumentParser(prog=f"rigdataset {args.command}", description=description)
+    getattr(module, add_arguments)(command_parser)
+    getattr(module, run)(command_parser.parse_args(argv[1:]))
+
+
+if __name__ == '__main__':
+    main()
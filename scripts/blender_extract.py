@@ -0,0 +1,208 @@
+"""Direct extraction of rig arrays from Blender data blocks
+
+Reads mesh and armature data with bulk `foreach_get` into NumPy buffers and
+writes the `_vertices/_faces/_skel/_link/_names` files of obj2npy.py and
+bvh2npy.py, without the OBJ/BVH text round-trip. The functions only take
+scene objects as arguments and never import bpy, so they also run on a fake
+data model outside Blender.
+"""
+import os
+import numpy as np
+from manifest import atomic_save
+from schema import compact_indices, compact_positions, topk_from_csr
+
+# Blender is Z-up, the OBJ exporter's default output is Y-up with -Z forward: (x, y, z) -> (x, z, -y)
+Y_UP = np.array([[1, 0, 0],
+                 [0, 0, 1],
+                 [0, -1, 0]], dtype=np.float64)
+# global_scale of convert.py's BVH export
+BVH_SCALE = 0.01
+
+
+def _transform(points, matrix, axes=Y_UP):
+    """Apply a 4x4 world matrix, then the axis conversion, to (N, 3) points."""
+    matrix = np.asarray(matrix, dtype=np.float64).reshape(4, 4)
+    linear = axes @ matrix[:3, :3]
+    return points @ linear.T + axes @ matrix[:3, 3]
+
+
+def mesh_arrays(objects, axes=Y_UP):
+    """World-space vertices and triangles of all mesh objects, concatenated.
+
+    Meshes are triangulated through their loop triangles, modifiers are not
+    applied, matching convert.py's OBJ export.
+
+    Returns:
+        (V, 3) float32 vertices and (F, 3) int32 faces
+    """
+    vertices, faces = [], []
+    offset = 0
+    for obj in objects:
+        if obj.type != 'MESH':
+            continue
+        mesh = obj.data
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+
+        mesh.calc_loop_triangles()
+        tris = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("vertices", tris)
+
+        vertices.append(_transform(co.reshape(-1, 3), obj.matrix_world, axes))
+        faces.append(tris.reshape(-1, 3) + offset)
+        offset += len(mesh.vertices)
+
+    if not vertices:
+        return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.int32)
+    return np.concatenate(vertices).astype(np.float32), np.concatenate(faces)
+
+
+def armature_arrays(obj, axes=Y_UP, frame="mesh"):
+    """Rest-pose bone heads, parent indices and names of an armature object.
+
+    With frame "mesh", heads are taken in world space with the same axis
+    conversion as the mesh, so joints and vertices share one frame. With
+    frame "bvh", they match the _skel.npy of the text path: Blender's BVH
+    export writes the heads in armature space, without the object transform
+    or an axis conversion, scaled by BVH_SCALE, and bvh2npy.py sums the
+    offsets back to these positions. Bones are ordered as stored in the
+    armature, where parents precede their children.
+
+    Returns:
+        (J, 3) float64 positions, (J,) int64 parents with -1 for roots, list of names
+    """
+    bones = obj.data.bones
+    heads = np.empty(len(bones) * 3, dtype=np.float32)
+    bones.foreach_get("head_local", heads)
+
+    names = [bone.name for bone in bones]
+    index = {name: i for i, name in enumerate(names)}
+    # Pointer properties have no foreach_get, parents are resolved by name
+    parents = np.array([index[bone.parent.name] if bone.parent is not None else -1 for bone in bones],
+                       dtype=np.int64)
+    # Same names as bvh2npy.py, without the namespace prefix
+    names = [name[name.find(':') + 1:] for name in names]
+    if frame == "bvh":
+        return heads.reshape(-1, 3).astype(np.float64) * BVH_SCALE, parents, names
+    if frame != "mesh":
+        raise ValueError(f"Unknown skeleton frame: {frame}")
+    return _transform(heads.reshape(-1, 3), obj.matrix_world, axes), parents, names
+
+
+def skin_arrays(objects, bone_names):
+    """Per-vertex bone weights of all mesh objects as CSR arrays.
+
+    Vertices are numbered as in mesh_arrays(). Vertex groups are matched to
+    bones by name, groups without a bone and zero weights are dropped, and
+    every vertex's weights are normalized to sum to 1.
+
+    Returns:
+        (V + 1,) int64 indptr, (nnz,) int64 joint indices, (nnz,) float32 weights
+    """
+    bone_index = {name: i for i, name in enumerate(bone_names)}
+    vertex_ids, groups, weights = [], [], []
+    offset = 0
+    for obj in objects:
+        if obj.type != 'MESH':
+            continue
+        group_joint = np.array([bone_index.get(group.name, -1) for group in obj.vertex_groups] + [-1],
+                               dtype=np.int64)
+        # Group memberships are per-vertex collections, out of reach of foreach_get
+        mesh_vertices, mesh_groups, mesh_weights = [], [], []
+        for v, vertex in enumerate(obj.data.vertices):
+            for element in vertex.groups:
+                mesh_vertices.append(v)
+                mesh_groups.append(element.group)
+                mesh_weights.append(element.weight)
+        vertex_ids.append(np.array(mesh_vertices, dtype=np.int64) + offset)
+        groups.append(group_joint[np.array(mesh_groups, dtype=np.int64)])
+        weights.append(np.array(mesh_weights, dtype=np.float32))
+        offset += len(obj.data.vertices)
+
+    vertex_ids = np.concatenate(vertex_ids) if vertex_ids else np.empty(0, dtype=np.int64)
+    joints = np.concatenate(groups) if groups else np.empty(0, dtype=np.int64)
+    weights = np.concatenate(weights) if weights else np.empty(0, dtype=np.float32)
+    keep = (joints >= 0) & (weights > 0)
+    vertex_ids, joints, weights = vertex_ids[keep], joints[keep], weights[keep]
+
+    totals = np.bincount(vertex_ids, weights=weights, minlength=offset)
+    weights = (weights / totals[vertex_ids]).astype(np.float32)
+    indptr = np.zeros(offset + 1, dtype=np.int64)
+    np.cumsum(np.bincount(vertex_ids, minlength=offset), out=indptr[1:])
+    # Entries are already grouped by vertex in increasing order
+    return indptr, joints, weights
+
+
+def export_arrays(path, vertices=None, faces=None, skel=None, parents=None, names=None, skin=None,
+                  skin_format="csr", topk=4, compact=False):
+    """Write the sample files of obj2npy.py and bvh2npy.py from in-memory arrays.
+
+    Args:
+        path (str): output path prefix, files are named `<path>_<field>.npy`.
+        vertices, faces: mesh arrays, skipped if None.
+        skel, parents, names: skeleton arrays, skipped if None.
+        skin: (indptr, joints, weights) CSR skinning weights, skipped if None.
+        skin_format (str): "csr" to store skin as is, "topk" for the `topk` largest weights per vertex.
+        compact (bool): float32 positions and the smallest integer index types.
+
+    Returns:
+        list of written files
+    """
+    outputs = []
+    if vertices is not None:
+        if compact:
+            vertices, faces = compact_positions(vertices), compact_indices(faces)
+        outputs += [atomic_save(f"{path}_vertices.npy", vertices),
+                    atomic_save(f"{path}_faces.npy", faces)]
+
+    if skel is not None:
+        links = np.stack([parents, np.arange(len(parents))], axis=1)[parents != -1].astype(np.int64)
+        if compact:
+            skel, links = compact_positions(skel), compact_indices(links)
+        outputs += [atomic_save(f"{path}_skel.npy", skel),
+                    atomic_save(f"{path}_link.npy", links),
+                    atomic_save(f"{path}_names.npy", np.array(names, dtype=str), allow_pickle=False)]
+
+    if skin is not None:
+        indptr, joints, weights = skin
+        if skin_format == "topk":
+            topk_joints, topk_weights = topk_from_csr(indptr, joints, weights, topk)
+            outputs += [atomic_save(f"{path}_skin_topk_joints.npy", topk_joints),
+                        atomic_save(f"{path}_skin_topk_weights.npy", topk_weights)]
+        else:
+            if compact:
+                indptr, joints, weights = compact_indices(indptr), compact_indices(joints), weights.astype(np.float16)
+            outputs += [atomic_save(f"{path}_skin_indptr.npy", indptr),
+                        atomic_save(f"{path}_skin_joints.npy", joints),
+                        atomic_save(f"{path}_skin_weights.npy", weights)]
+    return outputs
+
+
+def extract_scene(objects, output_dir, target_base_path, export_mesh=True, export_skeleton=True,
+                  skin_format="csr", topk=4, compact=False, skeleton_frame="mesh"):
+    """Extract the first armature and all meshes of a scene into a sample directory.
+
+    Skinning weights are exported with both the mesh and the skeleton,
+    unless skin_format is "none". skeleton_frame is passed to armature_arrays().
+
+    Files go to <output_dir>/<target_base_path>/<name>_<field>.npy, the
+    layout written by obj2npy.py and bvh2npy.py.
+
+    Returns:
+        list of written files
+    """
+    objects = list(objects)
+    sample_dir = os.path.join(output_dir, target_base_path)
+    os.makedirs(sample_dir, exist_ok=True)
+    path = os.path.join(sample_dir, os.path.basename(target_base_path))
+
+    arrays = {}
+    if export_mesh:
+        arrays["vertices"], arrays["faces"] = mesh_arrays(objects)
+    if export_skeleton:
+        armature = next((obj for obj in objects if obj.type == 'ARMATURE'), None)
+        if armature is not None:
+            arrays["skel"], arrays["parents"], arrays["names"] = armature_arrays(armature, frame=skeleton_frame)
+            if export_mesh and skin_format != "none":
+                arrays["skin"] = skin_arrays(objects, [bone.name for bone in armature.data.bones])
+    return export_arrays(path, skin_format=skin_format, topk=topk, compact=compact, **arrays)
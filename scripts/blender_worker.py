@@ -0,0 +1,46 @@
+"""Long-lived conversion worker started inside Blender by farm.py
+
+Receives batches of (position, relpath) over a pipe and runs the `process`
+function of convert.py (or convert2.py) on each of them.
+"""
+import os
+import sys
+import importlib
+import traceback
+from multiprocessing.connection import Connection
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from manifest import file_signature
+from instrument import instrumented
+
+
+def main(argv):
+    read_fd, write_fd, script, *convert_args = argv
+    inbox = Connection(int(read_fd), writable=False)
+    outbox = Connection(int(write_fd), readable=False)
+
+    convert = importlib.import_module(script)
+    opts = convert.argparser.parse_args(convert_args)
+
+    outbox.send(("ready",))
+    while True:
+        message = inbox.recv()
+        if message[0] == "stop":
+            break
+        for position, relpath in message[1]:
+            # Lets the driver start the per-file timeout
+            outbox.send(("start", position))
+            try:
+                signature = file_signature(os.path.join(opts.dataset_dir, relpath))
+                process = instrumented(lambda item: convert.process(position, opts.dataset_dir, opts.output_dir, item, opts),
+                                       opts.dataset_dir, opts.profile, opts.trace_memory)
+                outputs = process(relpath)
+                outbox.send(("done", position, signature, outputs, None))
+            except Exception:
+                outbox.send(("done", position, None, None, traceback.format_exc()))
+        outbox.send(("ready",))
+
+
+if __name__ == '__main__':
+    # Blender passes the script arguments after "--"
+    main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:])
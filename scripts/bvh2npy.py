@@ -1,71 +1,92 @@
 import re
 import os
-import sys
 import argparse
+import functools
 import numpy as np
-import tqdm
-from matplotlib import pyplot as plt
+from kinematics import forward_kinematics, joint_depths, motion_to_local, offsets_from_positions, parents_from_links
+from parallel import output_subdir, run_tasks, write_error_report
+from manifest import Manifest, atomic_save, atomic_write, run_tracked, write_rows
+from schema import compact_indices, compact_positions, load_names, upcast
+from instrument import instrumented, stage, start_events, summarize
+
+# Channels written for skeletons without a channel layout, e.g. after load_from
+DEFAULT_ROOT_CHANNELS = ("Xposition", "Yposition", "Zposition", "Zrotation", "Xrotation", "Yrotation")
+DEFAULT_CHANNELS = ("Zrotation", "Xrotation", "Yrotation")
 
 class BVHData:
-    def __init__(self, file_path):
-        # load in the static and motion data from indicated bvh file
-        self.file_path = file_path
-        self.load(file_path)
-        
+    def __init__(self, file_path=None):
         # For export to bvh
         self.joint_names = []
         self.joint_parents = []
         self.joint_offsets = []
 
-    def load(self, filename):
-        f = open(filename, "r")
-
-        i = 0
-        active = -1
-        end_site = False
-
-        names = []
-        offsets = np.array([]).reshape((0, 3))
-        parents = np.array([], dtype=int)
+        # Motion data, one column per channel and one row per frame
+        self.joint_channels = []
+        self.channel_offsets = np.array([], dtype=int)
+        self.motion = np.zeros((0, 0), dtype=np.float32)
+        self.frame_time = 0.0
 
-        for line in f:
-            if "HIERARCHY" in line or "MOTION" in line:
-                continue
-
-            rmatch = re.match(r"ROOT (\w+:?\w+)", line)
-            if rmatch:
-                names.append(rmatch.group(1))
-                offsets = np.append(offsets, np.array([[0, 0, 0]]), axis=0)
-                parents = np.append(parents, active)
-                active = len(parents) - 1
-                continue
-
-            if "{" in line or "}" in line:
-                if "}" in line and end_site:
-                    end_site = False
-                elif "}" in line:
-                    active = parents[active]
-                continue
-
-            offmatch = re.match(r"\s*OFFSET\s+([\-\d\.e]+)\s+([\-\d\.e]+)\s+([\-\d\.e]+)", line)
-            if offmatch:
-                if not end_site:
-                    offsets[active] = np.array([list(map(float, offmatch.groups()))])
-                continue
-
-            jmatch = re.match(r"\s*JOINT\s+(\w+:?\w+)", line)
-            if jmatch:
-                names.append(jmatch.group(1))
-                offsets = np.append(offsets, np.array([[0, 0, 0]]), axis=0)
-                parents = np.append(parents, active)
-                active = len(parents) - 1
-                continue
+        # load in the static and motion data from indicated bvh file
+        self.file_path = file_path
+        if file_path is not None:
+            self.load(file_path)
 
-            if "End Site" in line:
-                end_site = True
-                continue
+    def load(self, filename):
+        with stage("read"), open(filename, "r") as f:
+            text = f.read()
+        with stage("parse"):
+            self._parse(text)
+
+    def _parse(self, text):
+        motion_match = re.search(r"^\s*MOTION\b", text, re.MULTILINE)
+        if motion_match:
+            hierarchy, motion = text[:motion_match.start()], text[motion_match.end():]
+        else:
+            hierarchy, motion = text, ""
 
-        f.close()
+        # Single pass over the hierarchy tokens with preallocated joint tables
+        tokens = hierarchy.split()
+        n_joints = tokens.count("ROOT") + tokens.count("JOINT")
+        names = []
+        offsets = np.zeros((n_joints, 3))
+        parents = np.full(n_joints, -1, dtype=int)
+        channels = []
+
+        # Joint opened by every pending "{", END_SITE for End Site blocks
+        END_SITE = -2
+        stack = []
+        opening = END_SITE
+        i = 0
+        n_tokens = len(tokens)
+        while i < n_tokens:
+            token = tokens[i]
+            if token == "ROOT" or token == "JOINT":
+                active = len(names)
+                names.append(tokens[i + 1])
+                parents[active] = stack[-1] if stack else -1
+                channels.append(())
+                opening = active
+                i += 2
+            elif token == "{":
+                stack.append(opening)
+                i += 1
+            elif token == "}":
+                stack.pop()
+                i += 1
+            elif token == "OFFSET":
+                if stack and stack[-1] != END_SITE:
+                    offsets[stack[-1]] = [float(v) for v in tokens[i + 1:i + 4]]
+                i += 4
+            elif token == "CHANNELS":
+                count = int(tokens[i + 1])
+                channels[stack[-1]] = tuple(tokens[i + 2:i + 2 + count])
+                i += 2 + count
+            elif token == "End":
+                # "End Site"
+                opening = END_SITE
+                i += 2
+            else:
+                i += 1
 
         # delete ":" from joint name
         names = [name[name.find(':') + 1 :] if ':' in name else name for name in names]
@@ -75,33 +96,90 @@ class BVHData:
         self.joint_parents = parents
         self.joint_offsets = offsets
 
-    def compute_global_positions(self):
-        global_positions = np.zeros_like(self.joint_offsets)
-        for i, offset in enumerate(self.joint_offsets):
-            if self.joint_parents[i] == -1:
-                global_positions[i] = offset
-            else:
-                parent_global_position = global_positions[self.joint_parents[i]]
-                global_positions[i] = offset + parent_global_position
+        # channel layout, joint i owns columns [channel_offsets[i], channel_offsets[i] + len(joint_channels[i]))
+        counts = np.array([len(c) for c in channels], dtype=int)
+        self.joint_channels = channels
+        self.channel_offsets = np.cumsum(counts) - counts
+        self.motion, self.frame_time = self._parse_motion(motion, int(counts.sum()))
+
+    @staticmethod
+    def _parse_motion(motion, n_channels):
+        if not motion.strip():
+            return np.zeros((0, n_channels), dtype=np.float32), 0.0
+
+        _, _, rest = motion.partition("Frames:")
+        frames, _, rest = rest.partition("\n")
+        _, _, rest = rest.partition("Frame Time:")
+        frame_time, _, rest = rest.partition("\n")
+        n_frames = int(frames)
+
+        # Bulk parse the frame block into one contiguous array
+        values = np.fromstring(rest, dtype=np.float32, sep=" ")
+        if len(values) != n_frames * n_channels:
+            raise ValueError(f"Expected {n_frames} frames of {n_channels} channels, found {len(values)} values")
+        return values.reshape(n_frames, n_channels), float(frame_time)
+
+    def compute_global_positions(self, frames=None):
+        """Global joint positions.
+
+        Args:
+            frames: None for the rest pose (J, 3), otherwise an index or slice
+                into self.motion returning (..., J, 3) posed positions.
+        """
+        if frames is None:
+            global_positions, _ = forward_kinematics(self.joint_parents, self.joint_offsets)
+            return global_positions
+
+        rotations, translations = motion_to_local(
+            self.motion[frames], self.joint_channels, self.channel_offsets, self.joint_offsets)
+        global_positions, _ = forward_kinematics(self.joint_parents, self.joint_offsets, rotations, translations)
         return global_positions
 
-    def export(self, path):
-        global_positions = self.compute_global_positions()
+    def export(self, path, compact=False, motion=False):
+        with stage("fk"):
+            global_positions = self.compute_global_positions()
 
-        # Export joint information
-        np.save(f"{path}_skel.npy", global_positions)
+        # Generate link information
+        links = np.array([[parent, child] for child, parent in enumerate(self.joint_parents) if parent != -1],
+                         dtype=int).reshape(-1, 2)
+        if compact:
+            # float32 positions and the smallest integer type holding the joint indices
+            global_positions, links = compact_positions(global_positions), compact_indices(links)
 
-        # Generate and export link information
-        links = np.array([[parent, child] for child, parent in enumerate(self.joint_parents) if parent != -1])
-        np.save(f"{path}_link.npy", links)
+        with stage("write"):
+            # Export joint information
+            skel_file = atomic_save(f"{path}_skel.npy", global_positions)
 
-        # Export joint names
-        np.save(f"{path}_names.npy", self.joint_names, allow_pickle=True)
+            # Export link information
+            link_file = atomic_save(f"{path}_link.npy", links)
+
+            # Export joint names as a fixed-width unicode array, readable without pickle
+            names_file = atomic_save(f"{path}_names.npy", np.array(self.joint_names, dtype=str), allow_pickle=False)
+            outputs = [skel_file, link_file, names_file]
+
+            if motion:
+                outputs += self.export_motion(path)
 
         print(f"Exported to {path}_skel.npy, {path}_link.npy, {path}_names.npy")
         print(f"Exported skel shape: {global_positions.shape}")
         print(f"Exported link shape: {links.shape}")
         print(f"Exported names shape: {len(self.joint_names)}")
+        return outputs
+
+    def export_motion(self, path):
+        """Save the frames of the take as one contiguous (frames, channels) float32 array.
+
+        The frame time and the (channels, 2) joint name / channel name layout
+        of the columns are saved next to it, see dataset/motion_dataset.py.
+        """
+        channels = [(self.joint_names[joint], channel)
+                    for joint in range(len(self.joint_channels)) for channel in self.joint_channels[joint]]
+        outputs = [atomic_save(f"{path}_motion.npy", np.ascontiguousarray(self.motion, dtype=np.float32)),
+                   atomic_save(f"{path}_frame_time.npy", np.array(self.frame_time, dtype=np.float64)),
+                   atomic_save(f"{path}_channels.npy", np.array(channels, dtype=str).reshape(-1, 2),
+                               allow_pickle=False)]
+        print(f"Exported motion shape: {self.motion.shape}")
+        return outputs
 
     @staticmethod
     def show(directory):
@@ -137,32 +215,9 @@ class BVHData:
 
         # Load data from numpy files
         if skel_file and link_file and names_file:
-            global_positions = np.load(skel_file)
-            links = np.load(link_file)
-            joint_names = np.load(names_file, allow_pickle=True)
-
-            # Plotting
-            fig = plt.figure(figsize=(8, 8))
-            ax = fig.add_subplot(111, projection='3d')
-
-            # Plot joints
-            ax.scatter(global_positions[:, 0], global_positions[:, 1], global_positions[:, 2], marker='o', c='r', label='Joints')
-
-            # Plot links
-            for link in links:
-                start_pos, end_pos = global_positions[link[0]], global_positions[link[1]]
-                ax.plot([start_pos[0], end_pos[0]], [start_pos[1], end_pos[1]], [start_pos[2], end_pos[2]], 'black')
-
-            # Annotate joint names
-            for i, name in enumerate(joint_names):
-                ax.text(global_positions[i, 0], global_positions[i, 1], global_positions[i, 2], name)
-
-            ax.set_xlabel('X')
-            ax.set_ylabel('Y')
-            ax.set_zlabel('Z')
-
-            plt.legend()
-            plt.show()
+            # Imported here so that converting never loads matplotlib
+            from utils import show
+            show(np.load(skel_file), np.load(link_file), load_names(names_file))
         else:
             print("Required numpy files not found in the directory.")
 
@@ -184,59 +239,145 @@ class BVHData:
 
         # Load data from numpy files
         if skel_file and link_file and names_file:
-            self.joint_offsets = np.load(skel_file)
+            global_positions = upcast(np.load(skel_file))
             links = np.load(link_file)
-            self.joint_names = np.load(names_file, allow_pickle=True)
+            self.joint_names = load_names(names_file)
 
-            # Reconstruct parents array from links
-            self.joint_parents = np.full(len(self.joint_names), -1, dtype=int)
-            for child, parent in links:
-                self.joint_parents[child] = parent
+            # Reconstruct parents array from (parent, child) links
+            self.joint_parents = parents_from_links(links, len(self.joint_names))
+            # The skeleton file holds global rest positions, offsets are relative to the parent
+            self.joint_offsets = offsets_from_positions(global_positions, self.joint_parents)
+
+            # No motion is stored, export_to_bvh writes the default channels
+            self.joint_channels = []
+            self.channel_offsets = np.array([], dtype=int)
+            self.motion = np.zeros((0, 0), dtype=np.float32)
         else:
             raise FileNotFoundError("Required numpy files not found in the directory.")
 
-    def export_to_bvh(self, output_path):
-        with open(output_path, 'w') as f:
-            f.write("HIERARCHY\n")
-            for i, name in enumerate(self.joint_names):
-                if self.joint_parents[i] == -1:
-                    f.write(f"ROOT {name}\n")
-                else:
-                    f.write(f"\t" * self._get_indent_level(i) + f"JOINT {name}\n")
-                f.write(f"\t" * self._get_indent_level(i) + "{\n")
-                offset = self.joint_offsets[i]
-                f.write(f"\t" * (self._get_indent_level(i) + 1) + f"OFFSET {offset[0]} {offset[1]} {offset[2]}\n")
-                if i == len(self.joint_names) - 1 or self.joint_parents[i + 1] != i:
-                    f.write(f"\t" * self._get_indent_level(i) + "}\n")
-            f.write("MOTION\nFrames: 1\nFrame Time: 0.033333\n")
-            f.write("0.000000 " * (len(self.joint_names) * 3) + "\n")
-
-    def _get_indent_level(self, index):
-        indent_level = 0
-        while self.joint_parents[index] != -1:
-            indent_level += 1
-            index = self.joint_parents[index]
-        return indent_level
-
-def process_bvh_files(input_dir, output_dir):
-    bvh_files = [f for f in os.listdir(input_dir) if f.endswith('.bvh')]
-    for bvh_file in tqdm.tqdm(bvh_files, desc="Processing BVH files"):
-        file_path = os.path.join(input_dir, bvh_file)
-        bvh_data = BVHData(file_path)
-        output_subdir = os.path.join(output_dir, os.path.splitext(bvh_file)[0])
-        os.makedirs(output_subdir, exist_ok=True)
-        bvh_data.export(os.path.join(output_subdir, os.path.splitext(bvh_file)[0]))
-
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Process multiple BVH files and export to numpy format.')
+    def export_to_bvh(self, output_path, motion=None, frame_time=None):
+        """Write the skeleton and a MOTION block as a BVH file.
+
+        Joints are written depth first with correctly nested braces, whatever
+        their order in the joint tables, and leaves get a zero End Site.
+
+        Args:
+            output_path (str): path of the BVH file.
+            motion (np.ndarray): (frames, C) channel values in the column layout of
+                self.joint_channels. Defaults to self.motion, or one frame of zeros.
+            frame_time (float): seconds per frame, defaults to self.frame_time or 1/30.
+        """
+        n_joints = len(self.joint_names)
+        parents = np.asarray(self.joint_parents, dtype=int)
+        channels = self.joint_channels
+        if len(channels) != n_joints:
+            channels = [DEFAULT_ROOT_CHANNELS if parent == -1 else DEFAULT_CHANNELS for parent in parents]
+        counts = np.array([len(c) for c in channels], dtype=int)
+        column_starts = np.cumsum(counts) - counts
+
+        if motion is None:
+            motion = self.motion if len(self.motion) and self.motion.shape[1] == counts.sum() else None
+        if motion is None:
+            motion = np.zeros((1, counts.sum()), dtype=np.float32)
+        motion = np.asarray(motion).reshape(len(motion), -1)
+        if motion.shape[1] != counts.sum():
+            raise ValueError(f"Motion has {motion.shape[1]} channels, the skeleton {counts.sum()}")
+        frame_time = frame_time or self.frame_time or 1 / 30
+
+        # Depths and children in one pass, then an iterative depth first walk
+        depths = joint_depths(parents)
+        children = [[] for _ in range(n_joints)]
+        for joint, parent in enumerate(parents):
+            if parent != -1:
+                children[parent].append(joint)
+        roots = [joint for joint in range(n_joints) if parents[joint] == -1]
+
+        lines = ["HIERARCHY"]
+        columns = []
+        stack = [(root, False) for root in reversed(roots)]
+        while stack:
+            joint, closing = stack.pop()
+            indent = "\t" * depths[joint]
+            if closing:
+                if not children[joint]:
+                    lines += [f"{indent}\tEnd Site", f"{indent}\t{{",
+                              f"{indent}\t\tOFFSET 0.000000 0.000000 0.000000", f"{indent}\t}}"]
+                lines.append(f"{indent}}}")
+                continue
+            offset = self.joint_offsets[joint]
+            lines += [f"{indent}{'ROOT' if parents[joint] == -1 else 'JOINT'} {self.joint_names[joint]}",
+                      f"{indent}{{",
+                      f"{indent}\tOFFSET {offset[0]:.6f} {offset[1]:.6f} {offset[2]:.6f}",
+                      f"{indent}\tCHANNELS {len(channels[joint])} {' '.join(channels[joint])}"]
+            columns.append(np.arange(column_starts[joint], column_starts[joint] + counts[joint]))
+            stack.append((joint, True))
+            stack += [(child, False) for child in reversed(children[joint])]
+
+        # Reorder the motion columns to the order the joints were written in
+        motion = motion[:, np.concatenate(columns)] if columns else motion
+
+        def write(f):
+            f.write("\n".join(lines) + "\n")
+            f.write(f"MOTION\nFrames: {len(motion)}\nFrame Time: {frame_time:.6f}\n")
+            write_rows(f, motion, " ".join(["%.6f"] * motion.shape[1]) + "\n")
+
+        atomic_write(output_path, write, mode='w')
+
+def convert_bvh_file(input_dir, output_dir, bvh_file, compact=False, motion=False):
+    file_path = os.path.join(input_dir, bvh_file)
+    bvh_data = BVHData(file_path)
+    name = os.path.splitext(bvh_file)[0]
+    with output_subdir(os.path.join(output_dir, name)) as subdir:
+        return bvh_data.export(os.path.join(subdir, name), compact=compact, motion=motion)
+
+def process_bvh_files(input_dir, output_dir, workers=1, chunksize=None, resume=False, force=False, compact=False,
+                      profile=None, trace_memory=False, motion=False):
+    bvh_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.bvh'))
+
+    # Skip files that did not change since they were last converted
+    manifest = Manifest(output_dir, "bvh2npy", options={"compact": compact, "motion": motion}, resume=resume)
+    pending = [f for f in bvh_files if force or not manifest.is_current(f, os.path.join(input_dir, f))]
+    if len(pending) < len(bvh_files):
+        print(f"Skipping {len(bvh_files) - len(pending)} unchanged files")
+
+    convert = functools.partial(convert_bvh_file, input_dir, output_dir, compact=compact, motion=motion)
+    if profile is not None:
+        start_events(profile)
+    convert = instrumented(convert, input_dir, profile, trace_memory)
+    try:
+        errors = run_tasks(functools.partial(run_tracked, convert, input_dir), pending,
+                           workers=workers, chunksize=chunksize, desc="Processing BVH files",
+                           on_result=lambda f, result: manifest.record(f, *result))
+    finally:
+        manifest.close()
+    write_error_report(output_dir, errors, "bvh2npy")
+    if profile is not None:
+        summarize(profile)
+    return errors
+
+def add_arguments(parser):
     parser.add_argument('input_dir', type=str, help='Input directory containing BVH files.')
     parser.add_argument('output_dir', type=str, help='Output directory for numpy files.')
-    args = parser.parse_args()
-    
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, 0 for all cores.')
+    parser.add_argument('--chunksize', type=int, default=None, help='Files handed to a worker at once.')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run.')
+    parser.add_argument('--force', action='store_true', help='Convert all files, including unchanged ones.')
+    parser.add_argument('--compact', action='store_true', help='Store float32 positions and the smallest integer type for indices.')
+    parser.add_argument('--motion', action='store_true', help='Also export the frames of every take for motion datasets.')
+    parser.add_argument('--profile', type=str, default=None, help='Write per-file stage timings to this JSONL file.')
+    parser.add_argument('--trace-memory', action='store_true', help='Record the peak traced memory of every file with --profile.')
+
+def main(args):
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir, exist_ok=True)
 
-    process_bvh_files(args.input_dir, args.output_dir)
+    return process_bvh_files(args.input_dir, args.output_dir, args.workers, args.chunksize, args.resume, args.force,
+                             args.compact, args.profile, args.trace_memory, args.motion)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Process multiple BVH files and export to numpy format.')
+    add_arguments(parser)
+    main(parser.parse_args())
 
 # Export bvh example usage
 # bvh_data = BVHData()
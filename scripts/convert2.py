@@ -4,9 +4,15 @@ import os
 import sys
 import shutil
 import argparse
+from typing import List, Optional
 import bpy
 import tqdm
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from manifest import Manifest, atomic_export, file_signature
+from blender_extract import extract_scene
+from instrument import instrumented, stage, start_events, summarize
+
 
 argparser = argparse.ArgumentParser(description="Extract rig dataset")
 argparser.add_argument("dataset_dir", type=str)
@@ -27,19 +33,41 @@ argparser.add_argument("--only-has-skeleton", action="store_true",
                        help="Only export files that have skeleton")
 argparser.add_argument("--number", type=int, default=0,
                        help="Name files with numbers, 0 for original names")
-
-
-def process(index: int, dataset_dir: str, output_dir: str, relpath: str, opts: argparse.Namespace) -> bool:
+argparser.add_argument("--format", type=str, default="text", choices=["text", "npy", "both"],
+                       help="Export OBJ/BVH text files, numpy sample files read directly from Blender, or both")
+argparser.add_argument("--skin-weights", type=str, default="csr", choices=["none", "csr", "topk"],
+                       help="Skinning weights of the npy format, as sparse CSR arrays or the top k per vertex")
+argparser.add_argument("--skin-topk", type=int, default=4,
+                       help="Weights kept per vertex with --skin-weights topk")
+argparser.add_argument("--skeleton-frame", type=str, default="mesh", choices=["mesh", "bvh"],
+                       help="Joints of the npy format in the mesh's world frame, or in the frame of the BVH export")
+argparser.add_argument("--compact", action="store_true",
+                       help="Store numpy files with float32 positions and compact index types")
+argparser.add_argument("--resume", action="store_true",
+                       help="Continue an interrupted run")
+argparser.add_argument("--force", action="store_true",
+                       help="Convert all files, including unchanged ones")
+argparser.add_argument("--profile", type=str, default=None,
+                       help="Write per-file stage timings to this JSONL file")
+argparser.add_argument("--trace-memory", action="store_true",
+                       help="Record the peak traced memory of every file with --profile")
+
+
+def process(index: int, dataset_dir: str, output_dir: str, relpath: str, opts: argparse.Namespace) -> Optional[List[str]]:
     """Process a single file
 
     opts:
         dataset_dir (str): dataset directory
         output_dir (str): output directory
         relpath (str): relative path to the file
+
+    Returns:
+        list of written files, None if the file was skipped
     """
     print(f"Processing: {relpath}")
     bpy.ops.wm.read_factory_settings(use_empty=True)
-    bpy.ops.import_scene.fbx(filepath=os.path.join(dataset_dir, relpath))
+    with stage("import"):
+        bpy.ops.import_scene.fbx(filepath=os.path.join(dataset_dir, relpath))
     # Apply all transformations
     # bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
     # # Clear parent and keep transformation
@@ -57,15 +85,19 @@ def process(index: int, dataset_dir: str, output_dir: str, relpath: str, opts: a
         target_base_path = f"{index:d}"
         target_base_path = target_base_path.zfill(opts.number)
 
+    outputs = []
     if opts.save_orig:
         original_path = os.path.join(
             output_dir, target_base_path+"_orig" + ext)
-        shutil.copyfile(os.path.join(dataset_dir, relpath), original_path)
+        atomic_export(original_path, lambda path: shutil.copyfile(os.path.join(dataset_dir, relpath), path))
+        outputs.append(original_path)
         print(f"Copied: {original_path}")
 
     if opts.save_blend:
         blend_path = os.path.join(output_dir, target_base_path + ".blend")
-        bpy.ops.wm.save_as_mainfile(filepath=blend_path)
+        with stage("save_blend"):
+            atomic_export(blend_path, lambda path: bpy.ops.wm.save_as_mainfile(filepath=path))
+        outputs.append(blend_path)
         print(f"Saved: {blend_path}")
 
     obj_path = os.path.join(output_dir, target_base_path + ".obj")
@@ -81,27 +113,40 @@ def process(index: int, dataset_dir: str, output_dir: str, relpath: str, opts: a
 
     if opts.only_has_skeleton and not has_skeleton:
         print(f"Skipping: {relpath}, no skeleton found")
-        return False
+        return None
 
     bpy.ops.object.select_all(action='DESELECT')
-    if opts.export_mesh:
-        bpy.ops.wm.obj_export(filepath=obj_path, export_materials=False,
-                              export_normals=opts.export_normals, export_uv=opts.export_uv,
-                              export_triangulated_mesh=True, apply_modifiers=False)
+    if opts.format != "text":
+        with stage("extract_npy"):
+            outputs += extract_scene(bpy.context.scene.objects, output_dir, target_base_path,
+                                     export_mesh=opts.export_mesh, export_skeleton=opts.export_skeleton,
+                                     skin_format=opts.skin_weights, topk=opts.skin_topk, compact=opts.compact,
+                                     skeleton_frame=opts.skeleton_frame)
+        print(f"Exported: {os.path.join(output_dir, target_base_path)}")
+
+    if opts.export_mesh and opts.format != "npy":
+        with stage("export_obj"):
+            atomic_export(obj_path, lambda path: bpy.ops.wm.obj_export(
+                filepath=path, export_materials=False,
+                export_normals=opts.export_normals, export_uv=opts.export_uv,
+                export_triangulated_mesh=True, apply_modifiers=False))
+        outputs.append(obj_path)
         print(f"Exported: {obj_path}")
 
-    if opts.export_skeleton:
+    if opts.export_skeleton and opts.format != "npy":
         for obj in bpy.context.scene.objects:
             if obj.type == 'ARMATURE':
                 bpy.ops.object.select_all(action='DESELECT')
                 obj.select_set(True)
                 bpy.context.view_layer.objects.active = obj
-                bpy.ops.export_anim.bvh(
-                    filepath=bvh_path, frame_start=1, frame_end=1, global_scale=0.01, rotate_mode='XYZ')
+                with stage("export_bvh"):
+                    atomic_export(bvh_path, lambda path: bpy.ops.export_anim.bvh(
+                        filepath=path, frame_start=1, frame_end=1, global_scale=0.01, rotate_mode='XYZ'))
+                outputs.append(bvh_path)
                 print(f"Exported: {bvh_path}")
                 break
 
-    return True
+    return outputs
 
 
 def extract(dataset_dir: str, output_dir: str, opts: argparse.Namespace):
@@ -119,15 +164,42 @@ def extract(dataset_dir: str, output_dir: str, opts: argparse.Namespace):
             relpath = os.path.relpath(path, dataset_dir)
             if relpath.endswith(".fbx"):
                 allfiles.append(relpath)
+    # Sorted so numbered outputs don't depend on the directory listing order
+    allfiles.sort()
 
     tqdm.tqdm.write(f"Extracting {len(allfiles)} files")
+    options = {k: v for k, v in vars(opts).items() if k not in ("dataset_dir", "output_dir", "resume", "force",
+                                                                "profile", "trace_memory")}
+    manifest = Manifest(output_dir, "convert", options=options, resume=opts.resume)
+    if opts.profile is not None:
+        start_events(opts.profile)
     exported = 0
-    for relpath in tqdm.tqdm(allfiles):
-        if process(exported, dataset_dir, output_dir, relpath, opts):
-            exported += 1
+    try:
+        for relpath in tqdm.tqdm(allfiles):
+            path = os.path.join(dataset_dir, relpath)
+            # Skip unchanged files, numbered outputs only if they keep their number
+            if not opts.force and manifest.is_current(relpath, path):
+                index = manifest.get(relpath)["index"]
+                if index is None:
+                    continue
+                if index == exported or opts.number == 0:
+                    exported += 1
+                    continue
+
+            signature = file_signature(path)
+            convert = instrumented(lambda item: process(exported, dataset_dir, output_dir, item, opts),
+                                   dataset_dir, opts.profile, opts.trace_memory)
+            outputs = convert(relpath)
+            manifest.record(relpath, signature, outputs or [], index=exported if outputs is not None else None)
+            if outputs is not None:
+                exported += 1
+    finally:
+        manifest.close()
 
     tqdm.tqdm.write("Done")
     tqdm.tqdm.write(f"Exported {exported} files")
+    if opts.profile is not None:
+        summarize(opts.profile)
 
 
 if __name__ == '__main__':
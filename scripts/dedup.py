@@ -0,0 +1,261 @@
+"""Find duplicate samples in the output of obj2npy.py / bvh2npy.py by geometric fingerprints
+
+Every sample gets a fingerprint that ignores file names, joint order, position
+and scale: rotation invariant moments of the mesh vertices and of the
+skeleton's rest joints, the shape of the bounding box along the principal
+axes and a hash of the skeleton topology. Samples sharing the topology key and
+a coarse cell of the box shape land in one bucket of a hash index, and only
+samples within a bucket and its neighbouring cells whose moments agree are
+compared, so the search stays near linear in the number of samples.
+"""
+import os
+import json
+import hashlib
+import argparse
+import itertools
+from collections import defaultdict
+import numpy as np
+from parallel import run_tasks, write_error_report
+from manifest import atomic_write
+from kinematics import joint_levels, parents_from_links
+from schema import field_of, upcast
+
+
+def point_moments(points):
+    """(5,) moments of a point set invariant to translation, rotation and scale.
+
+    The covariance eigenvalues over their sum, then the mean and the cube root
+    of the third moment of the distances to the centroid in units of the RMS
+    distance. Zeros for fewer than two distinct points.
+    """
+    points = upcast(np.asarray(points)).reshape(-1, 3)
+    centered = points - points.mean(axis=0) if len(points) else points
+    covariance = centered.T @ centered / max(len(points), 1)
+    total = np.trace(covariance)
+    if total <= 0:
+        return np.zeros(5)
+    eigenvalues = np.linalg.eigvalsh(covariance)[::-1] / total
+    radii = np.sqrt(np.einsum('ij,ij->i', centered, centered) / total)
+    return np.concatenate([eigenvalues, [radii.mean(), np.cbrt(np.mean(radii ** 3))]])
+
+
+def box_shape(points):
+    """(2,) bounding box extents along the principal axes, sorted and relative to the longest one.
+
+    The box is taken in the frame of the covariance eigenvectors, so a rotated
+    copy has the same shape as long as the principal axes are distinct.
+    Zeros for fewer than two distinct points.
+    """
+    points = upcast(np.asarray(points)).reshape(-1, 3)
+    if not len(points):
+        return np.zeros(2)
+    centered = points - points.mean(axis=0)
+    _, axes = np.linalg.eigh(centered.T @ centered)
+    projected = centered @ axes
+    extents = np.sort(projected.max(axis=0) - projected.min(axis=0))[::-1]
+    if extents[0] <= 0:
+        return np.zeros(2)
+    return extents[1:] / extents[0]
+
+
+def topology_hash(parents):
+    """Hash of the joint hierarchy that ignores joint order and names.
+
+    Every joint is labelled with the hash of its children's sorted labels,
+    deepest level first, and the hierarchy with the sorted root labels.
+    """
+    parents = np.asarray(parents, dtype=int)
+    labels = [b""] * len(parents)
+    children = defaultdict(list)
+    for level in reversed(joint_levels(parents)):
+        for joint in level:
+            labels[joint] = hashlib.blake2b(b"(" + b"".join(sorted(children[joint])) + b")", digest_size=8).digest()
+            if parents[joint] >= 0:
+                children[parents[joint]].append(labels[joint])
+    roots = sorted(labels[joint] for joint in np.flatnonzero(parents < 0))
+    return hashlib.blake2b(b"".join(roots), digest_size=8).hexdigest()
+
+
+def sample_fingerprint(sample_dir):
+    """Fingerprint of one sample directory.
+
+    Returns:
+        dict: `key`, the exact part compared through the hash index, and
+        `moments` and `box`, the box_shape() of the mesh or else the skeleton,
+        compared with a tolerance within a bucket. Also the vertex and joint
+        counts, used to pick the sample kept of a duplicate cluster.
+    """
+    files = {}
+    for entry in os.scandir(sample_dir):
+        field = field_of(entry.name)
+        if field in ("vertices", "skel", "link"):
+            files[field] = entry.path
+    moments, key, box = [], [], np.zeros(0)
+    n_vertices = n_joints = 0
+    if "vertices" in files:
+        vertices = np.load(files["vertices"], mmap_mode='r')
+        n_vertices = len(vertices)
+        moments.append(point_moments(vertices))
+        key.append("mesh")
+        box = box_shape(vertices)
+    if "skel" in files:
+        joints = np.load(files["skel"], mmap_mode='r')
+        n_joints = len(joints)
+        links = np.load(files["link"]) if "link" in files else np.zeros((0, 2), dtype=int)
+        moments.append(point_moments(joints))
+        key += ["skeleton", n_joints, topology_hash(parents_from_links(links, n_joints))]
+        if "vertices" not in files:
+            box = box_shape(joints)
+    return {"key": tuple(key), "moments": np.concatenate(moments) if moments else np.zeros(0), "box": box,
+            "vertices": n_vertices, "joints": n_joints}
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _link_close(members, neighbours, moments, boxes, parent, tolerance, box_tolerance):
+    """Union the samples whose moments and boxes are within tolerance.
+
+    Compares the pairs within the index array `members`, or with `neighbours`
+    given, only the pairs of one sample from each.
+    """
+    if neighbours is not None:
+        side = np.repeat([False, True], [len(members), len(neighbours)])
+        members = np.concatenate([members, neighbours])
+    order = np.argsort(moments[members, 0], kind='stable')
+    members = members[order]
+    first_moments = moments[members, 0]
+    # Candidate pairs (i, j > i) within tolerance of each other on the first moment
+    ends = np.searchsorted(first_moments, first_moments + tolerance, side='right')
+    counts = ends - np.arange(len(members)) - 1
+    first = np.repeat(np.arange(len(members)), counts)
+    second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    if neighbours is not None:
+        side = side[order]
+        keep = side[first] != side[second]
+        first, second = first[keep], second[keep]
+    first, second = members[first], members[second]
+    close = np.abs(moments[second] - moments[first]).max(axis=1) <= tolerance
+    if boxes.shape[1]:
+        close &= np.abs(boxes[second] - boxes[first]).max(axis=1) <= box_tolerance
+    for i, j in zip(first[close], second[close]):
+        parent[_find(parent, j)] = _find(parent, i)
+
+
+def duplicate_clusters(fingerprints, tolerance=1e-3, box_tolerance=0.05):
+    """Groups of two or more samples whose fingerprints match.
+
+    Samples match when their keys are equal, no moment differs by more than
+    `tolerance` and no relative box extent by more than `box_tolerance`.
+    Samples of one key are bucketed by cells of `box_tolerance` over the box
+    shape, and every cell is compared with itself and its neighbouring cells.
+    Within those, samples are swept in order of their first moment, so only
+    those within `tolerance` of each other on it are compared.
+
+    Args:
+        fingerprints (dict): sample name -> sample_fingerprint().
+
+    Returns:
+        list: sorted lists of sample names, the clusters sorted by their first name.
+    """
+    by_key = defaultdict(list)
+    for sample, fingerprint in fingerprints.items():
+        by_key[fingerprint["key"]].append(sample)
+    clusters = []
+    for samples in by_key.values():
+        if len(samples) < 2:
+            continue
+        moments = np.stack([fingerprints[sample]["moments"] for sample in samples])
+        if not moments.shape[1]:
+            continue
+        boxes = np.stack([fingerprints[sample]["box"] for sample in samples])
+        if box_tolerance > 0:
+            cells = np.floor(boxes / box_tolerance).astype(np.int64)
+        else:
+            cells = np.zeros((len(samples), 0), dtype=np.int64)
+        buckets = defaultdict(list)
+        for i, cell in enumerate(map(tuple, cells.tolist())):
+            buckets[cell].append(i)
+        buckets = {cell: np.array(members) for cell, members in buckets.items()}
+        # The cell itself and the neighbours after it, so every pair of cells is visited once
+        offsets = [offset for offset in itertools.product((-1, 0, 1), repeat=cells.shape[1])
+                   if offset > (0,) * cells.shape[1]]
+        parent = list(range(len(samples)))
+        for cell, members in buckets.items():
+            if len(members) > 1:
+                _link_close(members, None, moments, boxes, parent, tolerance, box_tolerance)
+            for offset in offsets:
+                neighbours = buckets.get(tuple(c + o for c, o in zip(cell, offset)))
+                if neighbours is not None:
+                    _link_close(members, neighbours, moments, boxes, parent, tolerance, box_tolerance)
+        groups = defaultdict(list)
+        for i, sample in enumerate(samples):
+            groups[_find(parent, i)].append(sample)
+        clusters.extend(sorted(group) for group in groups.values() if len(group) > 1)
+    return sorted(clusters)
+
+
+def exclusions(clusters, fingerprints):
+    """Samples to drop, all but the most detailed sample of every cluster (ties go to the first name)."""
+    excluded = []
+    for cluster in clusters:
+        keep = min(cluster, key=lambda s: (-fingerprints[s]["vertices"], -fingerprints[s]["joints"], s))
+        excluded.extend(sample for sample in cluster if sample != keep)
+    return sorted(excluded)
+
+
+def load_exclusions(path):
+    """Set of sample names of an exclusion list written by find_duplicates()."""
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def find_duplicates(root_dir, output=None, workers=1, chunksize=None, tolerance=1e-3, box_tolerance=0.05):
+    """Fingerprint every sample directory of root_dir and write the duplicates.
+
+    Writes the exclusion list, one sample name per line, to `output` (defaults
+    to <root_dir>/duplicates.txt) and the clusters next to it as .json.
+
+    Returns:
+        list: the duplicate clusters.
+    """
+    output = output or os.path.join(root_dir, "duplicates.txt")
+    samples = sorted(entry.name for entry in os.scandir(root_dir) if entry.is_dir())
+    fingerprints = {}
+    errors = run_tasks(sample_fingerprint, [os.path.join(root_dir, sample) for sample in samples], workers=workers,
+                       chunksize=chunksize, desc="Fingerprinting samples",
+                       on_result=lambda path, result: fingerprints.__setitem__(os.path.basename(path), result))
+    write_error_report(root_dir, errors, "dedup")
+
+    clusters = duplicate_clusters(fingerprints, tolerance, box_tolerance)
+    excluded = exclusions(clusters, fingerprints)
+    atomic_write(output, lambda f: f.writelines(f"{sample}\n" for sample in excluded), mode='w')
+    atomic_write(os.path.splitext(output)[0] + ".json", lambda f: json.dump(clusters, f, indent=2), mode='w')
+    print(f"{len(clusters)} duplicate clusters, {len(excluded)} of {len(fingerprints)} samples excluded: {output}")
+    return clusters
+
+
+def add_arguments(parser):
+    parser.add_argument('root_dir', type=str, help='obj2npy / bvh2npy output directory, one subdirectory per sample.')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Exclusion list to write, defaults to <root_dir>/duplicates.txt.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, 0 for all cores.')
+    parser.add_argument('--chunksize', type=int, default=None, help='Samples handed to a worker at once.')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='Largest moment difference of duplicates.')
+    parser.add_argument('--box-tolerance', type=float, default=0.05,
+                        help='Largest difference of the relative bounding box extents of duplicates.')
+
+
+def main(args):
+    return find_duplicates(args.root_dir, args.output, args.workers, args.chunksize, args.tolerance,
+                           args.box_tolerance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find duplicate samples by geometric fingerprints.')
+    add_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,314 @@
+"""Convert an FBX dataset with a farm of long-lived Blender workers
+
+Usage:
+    python farm.py <dataset_dir> <output_dir> --workers 8 [--blender blender] [convert.py options]
+
+Each worker is one Blender process running blender_worker.py, fed with
+batches of files over a pipe. A worker that crashes or exceeds the per-file
+timeout is killed and restarted, and its file is retried. Workers that keep
+dying before they ask for work, e.g. a bad Blender path or a missing addon,
+abort the run. With --number,
+outputs are staged under their position in the sorted file list and renamed
+once every file is done, so numbering matches a serial convert.py run.
+
+Workers can be started with a plain Python interpreter (--python-workers)
+when `bpy` is importable there, e.g. a stub module for testing.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+from collections import deque
+from multiprocessing.connection import Connection, wait
+import tqdm
+from manifest import Manifest
+from parallel import write_error_report
+from instrument import start_events, summarize
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blender_worker.py")
+STAGING_DIR = ".farm_staging"
+
+
+def find_fbx_files(dataset_dir):
+    allfiles = []
+    for root, _dirs, files in os.walk(dataset_dir):
+        for file in files:
+            relpath = os.path.relpath(os.path.join(root, file), dataset_dir)
+            if relpath.endswith(".fbx"):
+                allfiles.append(relpath)
+    return sorted(allfiles)
+
+
+class Worker:
+    """One Blender process and the pipes to talk to it."""
+
+    def __init__(self, command, log_path):
+        # driver -> worker and worker -> driver pipes, inherited by the child
+        to_worker_read, to_worker_write = os.pipe()
+        from_worker_read, from_worker_write = os.pipe()
+        self.log_path = log_path
+        self.log = open(log_path, 'a')
+        self.proc = subprocess.Popen(
+            command(to_worker_read, from_worker_write),
+            pass_fds=(to_worker_read, from_worker_write),
+            stdin=subprocess.DEVNULL, stdout=self.log, stderr=subprocess.STDOUT)
+        os.close(to_worker_read)
+        os.close(from_worker_write)
+        self.inbox = Connection(from_worker_read, writable=False)
+        self.outbox = Connection(to_worker_write, readable=False)
+        self.batch = deque()
+        self.current = None
+        self.deadline = None
+        self.stopped = False
+        # Set by the first message, a worker dying before it never got to work
+        self.started = False
+
+    def send_batch(self, batch):
+        self.batch = deque(batch)
+        self.outbox.send(("batch", list(batch)))
+
+    def stop(self):
+        self.stopped = True
+        try:
+            self.outbox.send(("stop",))
+        except OSError:
+            pass
+
+    def kill(self):
+        self.proc.kill()
+        self.close()
+
+    def close(self):
+        self.proc.wait()
+        self.inbox.close()
+        self.outbox.close()
+        self.log.close()
+
+    def log_tail(self, lines=20):
+        with open(self.log_path, 'r', errors='replace') as f:
+            return "".join(f.readlines()[-lines:])
+
+
+class Farm:
+    def __init__(self, tasks, command, workers, batch_size, timeout, retries, log_dir, startup_retries=3):
+        self.pending = deque(tasks)
+        self.command = command
+        self.n_workers = workers
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.retries = retries
+        self.log_dir = log_dir
+        self.startup_retries = startup_retries
+        # Consecutive worker deaths before their first message, across all slots
+        self.startup_failures = 0
+        self.attempts = {}
+        self.results = {}
+        self.errors = {}
+
+    def _spawn(self, slot):
+        return Worker(self.command, os.path.join(self.log_dir, f"worker-{slot}.log"))
+
+    def _fail(self, worker, reason):
+        """Handle a crashed or hung worker: retry its file, requeue the rest of its batch.
+
+        Raises RuntimeError with the worker's log once `startup_retries`
+        workers in a row died before their first message.
+        """
+        if not worker.started:
+            worker.kill()
+            self.startup_failures += 1
+            if self.startup_failures >= self.startup_retries:
+                raise RuntimeError(f"{self.startup_failures} workers in a row failed to start ({reason}), "
+                                   f"last output in {worker.log_path}:\n{worker.log_tail()}")
+            return
+        position = worker.current
+        if position is None and worker.batch:
+            # Died between two files, the next one is charged
+            position = worker.batch[0][0]
+        if position is not None:
+            self.attempts[position] = self.attempts.get(position, 0) + 1
+            if self.attempts[position] > self.retries:
+                self.errors[position] = reason
+                worker.batch.popleft()
+            tqdm.tqdm.write(f"Worker failed on file {position}: {reason}")
+        self.pending.extendleft(reversed(worker.batch))
+        worker.kill()
+
+    def _handle(self, worker, message, progress):
+        worker.started = True
+        self.startup_failures = 0
+        kind = message[0]
+        if kind == "ready":
+            if self.pending:
+                batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+                worker.send_batch(batch)
+            else:
+                worker.stop()
+        elif kind == "start":
+            worker.current = message[1]
+            worker.deadline = time.monotonic() + self.timeout
+        elif kind == "done":
+            position, signature, outputs, error = message[1:]
+            worker.batch.popleft()
+            worker.current, worker.deadline = None, None
+            if error is not None:
+                self.errors[position] = error
+            else:
+                self.results[position] = (signature, outputs)
+            progress.update(1)
+
+    def run(self):
+        total = len(self.pending)
+        workers = {slot: self._spawn(slot) for slot in range(min(self.n_workers, total))}
+        try:
+            with tqdm.tqdm(total=total, desc="Converting FBX files") as progress:
+                while workers:
+                    deadlines = [w.deadline for w in workers.values() if w.deadline is not None]
+                    timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                    ready = wait([w.inbox for w in workers.values()], timeout)
+
+                    for slot, worker in list(workers.items()):
+                        if worker.inbox in ready:
+                            try:
+                                self._handle(worker, worker.inbox.recv(), progress)
+                            except EOFError:
+                                if worker.stopped:
+                                    worker.close()
+                                    del workers[slot]
+                                    continue
+                                self._fail(worker, f"worker exited with code {worker.proc.wait()}")
+                                progress.update(len(self.errors) + len(self.results) - progress.n)
+                                workers[slot] = self._spawn(slot)
+                        elif worker.deadline is not None and time.monotonic() > worker.deadline:
+                            self._fail(worker, f"timed out after {self.timeout}s")
+                            progress.update(len(self.errors) + len(self.results) - progress.n)
+                            workers[slot] = self._spawn(slot)
+        except BaseException:
+            # Killing an already failed worker again is harmless
+            for worker in workers.values():
+                worker.kill()
+            raise
+        return self.results, self.errors
+
+
+def finalize_numbering(tasks, results, staging_dir, output_dir, digits):
+    """Rename staged outputs from their file position to their export number.
+
+    Numbers are assigned in file order to exported files only, as in a
+    serial convert.py run.
+    """
+    exported = 0
+    for position, _relpath in tasks:
+        if position not in results or results[position][1] is None:
+            continue
+        signature, outputs = results[position]
+        staged_name, final_name = f"{position:d}".zfill(digits), f"{exported:d}".zfill(digits)
+        renamed = []
+        for path in outputs:
+            # Numpy outputs are named after their sample directory, rename every component
+            parts = os.path.relpath(path, staging_dir).split(os.sep)
+            parts = [final_name + part[len(staged_name):] if part.startswith(staged_name) else part
+                     for part in parts]
+            final_path = os.path.join(output_dir, *parts)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(path, final_path)
+            renamed.append(final_path)
+        results[position] = (signature, renamed)
+        exported += 1
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    return exported
+
+
+def run_farm(args, convert_args):
+    allfiles = find_fbx_files(args.dataset_dir)
+    tasks = list(enumerate(allfiles))
+    numbered = args.number > 0
+
+    # Numbered outputs depend on every earlier file, so only unnumbered runs can skip files
+    manifest = Manifest(args.output_dir, "farm", options={"script": args.script, "args": convert_args,
+                                                          "number": args.number})
+    if not numbered and not args.force:
+        tasks = [(i, f) for i, f in tasks if not manifest.is_current(f, os.path.join(args.dataset_dir, f))]
+        if len(tasks) < len(allfiles):
+            print(f"Skipping {len(allfiles) - len(tasks)} unchanged files")
+
+    staging_dir = os.path.join(args.output_dir, STAGING_DIR)
+    worker_output = staging_dir if numbered else args.output_dir
+    log_dir = os.path.join(args.output_dir, "farm_logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    script = os.path.splitext(os.path.basename(args.script))[0]
+    if args.python_workers:
+        prefix = [sys.executable, WORKER_SCRIPT]
+    else:
+        prefix = [args.blender, "--background", "--factory-startup", "--python", WORKER_SCRIPT, "--"]
+
+    profile_args = []
+    if args.profile is not None:
+        # Workers append to the same events file
+        start_events(args.profile)
+        profile_args = ["--profile", os.path.abspath(args.profile)] + (["--trace-memory"] if args.trace_memory else [])
+
+    def command(read_fd, write_fd):
+        return prefix + [str(read_fd), str(write_fd), script, args.dataset_dir, worker_output,
+                         "--number", str(args.number)] + profile_args + convert_args
+
+    farm = Farm(tasks, command, args.workers, args.batch_size, args.timeout, args.retries, log_dir,
+                args.startup_retries)
+    try:
+        results, errors = farm.run()
+    except BaseException:
+        manifest.close()
+        raise
+
+    exported = sum(1 for _signature, outputs in results.values() if outputs is not None)
+    if numbered:
+        exported = finalize_numbering(tasks, results, staging_dir, args.output_dir, args.number)
+
+    try:
+        for position, relpath in tasks:
+            if position in results:
+                signature, outputs = results[position]
+                manifest.record(relpath, signature, outputs or [])
+    finally:
+        manifest.close()
+
+    write_error_report(args.output_dir, {allfiles[p]: e for p, e in errors.items()}, "farm")
+    print(f"Exported {exported} files, {len(errors)} failed")
+    if args.profile is not None:
+        summarize(args.profile)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert an FBX dataset with a farm of Blender workers.")
+    parser.add_argument("dataset_dir", type=str)
+    parser.add_argument("output_dir", type=str)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of Blender workers")
+    parser.add_argument("--blender", type=str, default="blender", help="Blender executable")
+    parser.add_argument("--script", type=str, default="convert.py", help="Conversion script, convert.py or convert2.py")
+    parser.add_argument("--batch-size", type=int, default=4, help="Files handed to a worker at once")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-file timeout in seconds")
+    parser.add_argument("--retries", type=int, default=2, help="Retries of a file after a crash or timeout")
+    parser.add_argument("--startup-retries", type=int, default=3,
+                        help="Abort after this many workers in a row die before starting to work")
+    parser.add_argument("--number", type=int, default=0, help="Name files with numbers, 0 for original names")
+    parser.add_argument("--force", action="store_true", help="Convert all files, including unchanged ones")
+    parser.add_argument("--python-workers", action="store_true",
+                        help="Run workers with this Python interpreter instead of Blender")
+    parser.add_argument("--profile", type=str, default=None, help="Write per-file stage timings to this JSONL file")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record the peak traced memory of every file with --profile")
+    args, convert_args = parser.parse_known_args()
+
+    if not os.path.isdir(args.dataset_dir):
+        print(f"Dataset directory not found: {args.dataset_dir}")
+        sys.exit(1)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    try:
+        run_farm(args, convert_args)
+    except RuntimeError as e:
+        print(f"Farm aborted: {e}")
+        sys.exit(1)
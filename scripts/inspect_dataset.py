@@ -0,0 +1,98 @@
+"""Summarize converted samples, packed shards or single files without loading the arrays
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset'))
+from schema import field_of
+from sample_index import INDEX_FILE, build_sample_index, load_sample_index, read_npy_header
+import pack
+
+
+def _mib(size):
+    return f"{size / 2 ** 20:.1f} MiB"
+
+
+def inspect_npy(path):
+    shape, dtype = read_npy_header(path)
+    print(f"{os.path.basename(path)}: field {field_of(path) or '-'}, shape {shape}, dtype {dtype}, "
+          f"{_mib(os.path.getsize(path))}")
+
+
+def inspect_obj(path):
+    from obj2npy import OBJData
+
+    data = OBJData(path)
+    print(f"{os.path.basename(path)}: {len(data.vertices)} vertices, {len(data.faces)} triangles")
+
+
+def inspect_bvh(path):
+    from bvh2npy import BVHData
+
+    data = BVHData(path)
+    print(f"{os.path.basename(path)}: {len(data.joint_names)} joints, {data.motion.shape[1]} channels, "
+          f"{len(data.motion)} frames at {data.frame_time:g} s")
+
+
+def inspect_packed(root_dir):
+    shards = pack.PackedShards(root_dir)
+    sizes = [os.path.getsize(os.path.join(root_dir, shard["file"])) for shard in shards.shards]
+    print(f"{root_dir}: {len(shards)} packed samples in {len(sizes)} shards, {_mib(sum(sizes))}")
+    for field, spec in shards.fields.items():
+        column = shards._columns[field]
+        counts = np.asarray(shards.offsets[:, column + 1])
+        present = counts[counts >= 0]
+        print(f"  {field:<20} {len(present):>8} samples {int(present.sum()):>12} rows "
+              f"of {tuple(spec['shape'])} {spec['dtype']}")
+
+
+def inspect_samples(root_dir):
+    # The saved index if it is current, a read-only scan otherwise
+    index = load_sample_index(os.path.join(root_dir, INDEX_FILE), root_dir)
+    if index is None:
+        index = build_sample_index(root_dir)
+    print(f"{root_dir}: {len(index['samples'])} samples, {len(index['files'])} files, "
+          f"{_mib(int(index['sizes'].sum()))}")
+    print(f"  {'field':<20} {'samples':>8} {'dtypes':>16} {'min':>8} {'median':>8} {'max':>8} {'size':>12}")
+    for field in dict.fromkeys(index["fields"]):
+        is_field = index["fields"] == field
+        rows = index["shapes"][is_field, 0]
+        dtypes = ",".join(sorted(set(index["dtypes"][is_field])))
+        print(f"  {field or '(other)':<20} {int(is_field.sum()):>8} {dtypes:>16} {rows.min():>8} "
+              f"{int(np.median(rows)):>8} {rows.max():>8} {_mib(int(index['sizes'][is_field].sum())):>12}")
+
+
+def inspect_path(path):
+    """Print a summary of a .npy/.obj/.bvh file, a sample directory, a dataset root or a packed directory."""
+    if os.path.isfile(path):
+        extension = os.path.splitext(path)[1].lower()
+        inspectors = {".npy": inspect_npy, ".obj": inspect_obj, ".bvh": inspect_bvh}
+        if extension not in inspectors:
+            raise ValueError(f"Unsupported file type: {path}")
+        inspectors[extension](path)
+    elif os.path.exists(os.path.join(path, pack.INDEX_FILE)):
+        inspect_packed(path)
+    elif any(entry.is_dir() for entry in os.scandir(path)):
+        inspect_samples(path)
+    else:
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.npy'):
+                inspect_npy(os.path.join(path, name))
+
+
+def add_arguments(parser):
+    parser.add_argument('paths', type=str, nargs='+',
+                        help='Files, sample directories, dataset roots or packed directories.')
+
+
+def main(args):
+    for path in args.paths:
+        inspect_path(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize converted samples, packed shards or single files.')
+    add_arguments(parser)
+    main(parser.parse_args())
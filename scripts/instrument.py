@@ -0,0 +1,132 @@
+"""Opt-in per-file, per-stage timing and memory instrumentation of the converters
+
+Converters mark their stages with `with stage("parse"):`, which costs nothing
+unless the file is converted through profiled(). Every profiled file appends
+one JSON line to an events file, from any number of processes, and
+summarize() reports p50/p95 per stage and the slowest files.
+"""
+import os
+import json
+import time
+import functools
+import contextlib
+import tracemalloc
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stage times of the file being converted in this process, None when not profiling
+_stages = None
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Add the wall time of the block to stage `name` of the current file."""
+    if _stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stages[name] = _stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def _max_rss():
+    if resource is None:
+        return None
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _output_bytes(outputs):
+    if not isinstance(outputs, (list, tuple)):
+        return 0
+    return sum(os.path.getsize(path) for path in outputs if isinstance(path, str) and os.path.exists(path))
+
+
+def start_events(events_path):
+    """Truncate the events file at the start of a run."""
+    os.makedirs(os.path.dirname(os.path.abspath(events_path)), exist_ok=True)
+    open(events_path, 'w').close()
+
+
+def profiled(events_path, trace_memory, convert, input_dir, item):
+    """Run convert(item) and append its timings to events_path.
+
+    The event holds the wall time of every stage and of the whole file, the
+    input and output sizes, the process' peak RSS and, with trace_memory,
+    the tracemalloc peak of the file. Failed files are recorded with their
+    error and the exception is re-raised.
+    """
+    global _stages
+    event = {"file": item, "pid": os.getpid(), "stages": {}}
+    input_path = os.path.join(input_dir, item)
+    event["bytes_read"] = os.path.getsize(input_path) if os.path.exists(input_path) else 0
+
+    _stages = event["stages"]
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        outputs = convert(item)
+        event["bytes_written"] = _output_bytes(outputs)
+        return outputs
+    except Exception as e:
+        event["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        event["seconds"] = time.perf_counter() - start
+        _stages = None
+        if trace_memory:
+            event["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        event["max_rss_bytes"] = _max_rss()
+        # Short single writes in append mode don't interleave between processes
+        with open(events_path, 'a') as f:
+            f.write(json.dumps(event) + "\n")
+
+
+def instrumented(convert, input_dir, events_path=None, trace_memory=False):
+    """convert wrapped with profiled() when events_path is set, else convert itself."""
+    if events_path is None:
+        return convert
+    return functools.partial(profiled, events_path, trace_memory, convert, input_dir)
+
+
+def load_events(events_path):
+    with open(events_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(events_path, top=10):
+    """Print p50/p95 wall time per stage and the slowest files of a run."""
+    events = load_events(events_path)
+    if not events:
+        print(f"No events in {events_path}")
+        return
+
+    rows = {"total": [event["seconds"] for event in events]}
+    for event in events:
+        for name, seconds in event["stages"].items():
+            rows.setdefault(name, []).append(seconds)
+
+    print(f"\nProfile of {len(events)} files ({events_path})")
+    print(f"{'stage':<16} {'files':>6} {'p50 ms':>10} {'p95 ms':>10} {'total s':>10}")
+    for name, values in rows.items():
+        p50, p95 = np.percentile(values, [50, 95])
+        print(f"{name:<16} {len(values):>6} {p50 * 1000:>10.1f} {p95 * 1000:>10.1f} {sum(values):>10.2f}")
+
+    read = sum(event.get("bytes_read", 0) for event in events)
+    written = sum(event.get("bytes_written", 0) for event in events)
+    print(f"Read {read / 2 ** 20:.1f} MiB, wrote {written / 2 ** 20:.1f} MiB")
+
+    print("Slowest files:")
+    for event in sorted(events, key=lambda e: e["seconds"], reverse=True)[:top]:
+        memory = event.get("peak_traced_bytes", event.get("max_rss_bytes"))
+        memory = f", peak {memory / 2 ** 20:.0f} MiB" if memory else ""
+        error = " (failed)" if "error" in event else ""
+        print(f"  {event['seconds']:8.2f} s  {event['bytes_read'] / 2 ** 20:8.1f} MiB{memory}  {event['file']}{error}")
@@ -0,0 +1,188 @@
+"""Batched forward kinematics for skeletons given as parent/offset tables
+"""
+import numpy as np
+
+_AXES = {'X': 0, 'Y': 1, 'Z': 2}
+
+
+def joint_depths(parents):
+    """Depth of every joint in the hierarchy, 0 for roots.
+
+    Works for any joint ordering, with one vectorized pass per tree level.
+    """
+    parents = np.asarray(parents, dtype=int)
+    depths = np.zeros(len(parents), dtype=int)
+    ancestors = parents.copy()
+    while True:
+        has_parent = ancestors >= 0
+        if not has_parent.any():
+            return depths
+        if depths.max() > len(parents):
+            raise ValueError("Joint hierarchy contains a cycle")
+        depths[has_parent] += 1
+        ancestors[has_parent] = parents[ancestors[has_parent]]
+
+
+def joint_levels(parents):
+    """Group joints into topological levels.
+
+    Returns a list of index arrays, level k holding every joint at depth k.
+    All parents of level k are contained in earlier levels.
+    """
+    depths = joint_depths(parents)
+    if len(depths) == 0:
+        return []
+    order = np.argsort(depths, kind='stable')
+    bounds = np.searchsorted(depths[order], np.arange(depths.max() + 2))
+    return [order[bounds[k]:bounds[k + 1]] for k in range(depths.max() + 1)]
+
+
+def parents_from_links(links, n_joints):
+    """Rebuild the parent table from (parent, child) link pairs."""
+    parents = np.full(n_joints, -1, dtype=int)
+    links = np.asarray(links, dtype=int).reshape(-1, 2)
+    parents[links[:, 1]] = links[:, 0]
+    return parents
+
+
+def offsets_from_positions(positions, parents):
+    """Local joint offsets from global rest positions."""
+    positions = np.asarray(positions)
+    parents = np.asarray(parents, dtype=int)
+    offsets = positions.copy()
+    has_parent = parents >= 0
+    offsets[has_parent] -= positions[parents[has_parent]]
+    return offsets
+
+
+def euler_to_matrix(angles, order='ZXY', degrees=True):
+    """Rotation matrices from Euler angles.
+
+    Args:
+        angles (np.ndarray): (..., 3) angles, angles[..., k] rotates about order[k].
+        order (str): axis order as listed in the BVH CHANNELS, e.g. 'ZXY'.
+        degrees (bool): angles are given in degrees.
+
+    Returns:
+        np.ndarray: (..., 3, 3) matrices R = R_order[0] @ R_order[1] @ R_order[2].
+    """
+    angles = np.asarray(angles)
+    if not np.issubdtype(angles.dtype, np.floating):
+        angles = angles.astype(np.float64)
+    if degrees:
+        angles = np.deg2rad(angles)
+    cos = np.cos(angles)
+    sin = np.sin(angles)
+
+    result = None
+    for k, axis in enumerate(order.upper()):
+        a = _AXES[axis]
+        b, c = (a + 1) % 3, (a + 2) % 3
+        matrix = np.zeros(angles.shape[:-1] + (3, 3), dtype=angles.dtype)
+        matrix[..., a, a] = 1
+        matrix[..., b, b] = cos[..., k]
+        matrix[..., c, c] = cos[..., k]
+        matrix[..., b, c] = -sin[..., k]
+        matrix[..., c, b] = sin[..., k]
+        result = matrix if result is None else result @ matrix
+    return result
+
+
+def motion_to_local(motion, joint_channels, channel_offsets, offsets):
+    """Split BVH channel data into local joint rotations and translations.
+
+    Args:
+        motion (np.ndarray): (..., channels) frame data, e.g. (frames, C) or (batch, frames, C).
+        joint_channels (list): channel names of every joint, as in BVHData.joint_channels.
+        channel_offsets (np.ndarray): first motion column of every joint.
+        offsets (np.ndarray): (J, 3) rest offsets, used for joints without position channels.
+
+    Returns:
+        (np.ndarray, np.ndarray): (..., J, 3, 3) rotations and (..., J, 3) translations.
+    """
+    motion = np.asarray(motion)
+    dtype = motion.dtype if np.issubdtype(motion.dtype, np.floating) else np.float64
+    lead = motion.shape[:-1]
+    n_joints = len(joint_channels)
+
+    rotations = np.empty(lead + (n_joints, 3, 3), dtype=dtype)
+    rotations[...] = np.eye(3, dtype=dtype)
+    translations = np.empty(lead + (n_joints, 3), dtype=dtype)
+    translations[...] = np.asarray(offsets, dtype=dtype)
+
+    # Group joints sharing a rotation order so each group is one batched conversion
+    rotation_groups = {}
+    position_joints, position_columns = [], []
+    for joint, channels in enumerate(joint_channels):
+        order, rotation_columns, columns = '', [], [None] * 3
+        for k, channel in enumerate(channels):
+            axis, kind = channel[0].upper(), channel[1:].lower()
+            column = channel_offsets[joint] + k
+            if kind == 'rotation':
+                order += axis
+                rotation_columns.append(column)
+            elif kind == 'position':
+                columns[_AXES[axis]] = column
+        if len(order) == 3:
+            joints, cols = rotation_groups.setdefault(order, ([], []))
+            joints.append(joint)
+            cols.append(rotation_columns)
+        if all(c is not None for c in columns):
+            position_joints.append(joint)
+            position_columns.append(columns)
+
+    for order, (joints, cols) in rotation_groups.items():
+        rotations[..., joints, :, :] = euler_to_matrix(motion[..., np.array(cols)], order)
+    if position_joints:
+        translations[..., position_joints, :] = motion[..., np.array(position_columns)]
+    return rotations, translations
+
+
+def forward_kinematics(parents, offsets, rotations=None, translations=None, levels=None):
+    """Global joint transforms for a whole block of poses.
+
+    The hierarchy is processed level by level, with one batched matrix
+    multiply per level over all leading (batch, frames) dimensions.
+
+    Args:
+        parents (np.ndarray): (J,) parent index of every joint, -1 for roots.
+        offsets (np.ndarray): (J, 3) rest offsets relative to the parent.
+        rotations (np.ndarray): (..., J, 3, 3) local rotations, None for the rest pose.
+        translations (np.ndarray): (..., J, 3) local translations, defaults to the offsets.
+        levels (list): precomputed joint_levels(parents).
+
+    Returns:
+        (np.ndarray, np.ndarray): (..., J, 3) global positions and (..., J, 3, 3) global rotations.
+    """
+    parents = np.asarray(parents, dtype=int)
+    offsets = np.asarray(offsets)
+    if levels is None:
+        levels = joint_levels(parents)
+
+    if translations is None:
+        lead = rotations.shape[:-3] if rotations is not None else ()
+        translations = np.broadcast_to(offsets, lead + offsets.shape)
+    if rotations is None:
+        rotations = np.broadcast_to(np.eye(3, dtype=translations.dtype), translations.shape + (3,))
+
+    lead = np.broadcast_shapes(rotations.shape[:-3], translations.shape[:-2])
+    dtype = np.result_type(rotations.dtype, translations.dtype)
+    n_joints = len(parents)
+
+    # Work joint-major so every per-joint block is contiguous for the gathers
+    rotations = np.moveaxis(np.broadcast_to(rotations, lead + (n_joints, 3, 3)), -3, 0)
+    translations = np.moveaxis(np.broadcast_to(translations, lead + (n_joints, 3)), -2, 0)
+    global_rotations = np.empty((n_joints,) + lead + (3, 3), dtype=dtype)
+    global_positions = np.empty((n_joints,) + lead + (3,), dtype=dtype)
+
+    for depth, joints in enumerate(levels):
+        if depth == 0:
+            global_rotations[joints] = rotations[joints]
+            global_positions[joints] = translations[joints]
+            continue
+        parent_rotations = global_rotations[parents[joints]]
+        global_rotations[joints] = parent_rotations @ rotations[joints]
+        global_positions[joints] = global_positions[parents[joints]] + \
+            (parent_rotations @ translations[joints][..., None])[..., 0]
+
+    return np.moveaxis(global_positions, 0, -2), np.moveaxis(global_rotations, 0, -3)
@@ -0,0 +1,208 @@
+"""Content-hash manifest and atomic writes for incremental, resumable conversion
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_signature(path):
+    """Size, mtime and content hash of an input file."""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": file_hash(path)}
+
+
+def atomic_write(path, write, mode='wb'):
+    """Call write(f) on a temporary file next to `path` and rename it into place.
+
+    Readers never observe a partially written file, a crash leaves at most a
+    stray `.tmp` file behind.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def atomic_save(path, array, **kwargs):
+    """np.save into `path` through atomic_write."""
+    return atomic_write(path, lambda f: np.save(f, array, **kwargs))
+
+
+def write_rows(f, rows, row_format, chunk_rows=1 << 16):
+    """Write a 2d array as text, formatting whole blocks of rows at once.
+
+    row_format is a %-format string for one row, e.g. "v %r %r %r\n".
+    """
+    rows = np.asarray(rows)
+    for start in range(0, len(rows), chunk_rows):
+        block = rows[start:start + chunk_rows]
+        f.write((row_format * len(block)) % tuple(block.ravel().tolist()))
+
+
+class NpyAppender:
+    """Writes a .npy file whose length is only known at the end.
+
+    Rows are appended to a temporary file behind a fixed-size header, which
+    is rewritten with the final shape on close() before the file is renamed
+    into place. Memory use is bounded by the appended blocks.
+    """
+
+    HEADER_BYTES = 128
+
+    def __init__(self, path, dtype, row_shape=()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(self._header())
+
+    def _header(self):
+        header = repr({'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+                       'shape': (self.rows,) + self.row_shape})
+        # Magic string, version 1.0 and the header length take 10 bytes, the header ends with a newline
+        header = header.ljust(self.HEADER_BYTES - 11) + '\n'
+        if len(header) != self.HEADER_BYTES - 10:
+            raise ValueError(f"npy header too long for shape {(self.rows,) + self.row_shape}")
+        return np.lib.format.magic(1, 0) + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+    def append(self, block):
+        block = np.ascontiguousarray(block, dtype=self.dtype)
+        if block.shape[1:] != self.row_shape:
+            raise ValueError(f"Rows of shape {block.shape[1:]} appended to {self.path}, expected {self.row_shape}")
+        self.file.write(block.tobytes())
+        self.rows += len(block)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(self._header())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def atomic_export(path, export):
+    """Atomic variant for exporters that only take a file path, e.g. Blender operators.
+
+    export(tmp_path) writes to a temporary path with the same extension,
+    which is then renamed to `path`.
+    """
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.{os.getpid()}.tmp{ext}"
+    try:
+        export(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def run_tracked(convert, input_dir, item):
+    """Convert one input and return its signature with the written outputs.
+
+    The signature is taken before converting, so a file modified during the
+    conversion is picked up again by the next run.
+    """
+    signature = file_signature(os.path.join(input_dir, item))
+    return signature, convert(item)
+
+
+class Manifest:
+    """Maps every converted input to its size, mtime, content hash and outputs.
+
+    Stored as <output_dir>/<name>_manifest.json. Entries of the running
+    conversion are appended to a journal next to it, which is merged when the
+    run finishes, or by the next run with `resume=True` after a crash.
+    """
+
+    def __init__(self, output_dir, name, options=None, resume=False):
+        # The manifest is opened before anything is converted into output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, f"{name}_manifest.json")
+        self.journal_path = self.path + ".journal"
+        self.options = options or {}
+        self.entries = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                manifest = json.load(f)
+            # Outputs depend on the conversion options, start over when they change
+            if manifest.get("options", {}) == self.options:
+                self.entries = manifest.get("files", {})
+
+        if os.path.exists(self.journal_path):
+            if resume:
+                self._replay_journal()
+            else:
+                os.remove(self.journal_path)
+        self.journal = open(self.journal_path, 'a')
+
+    def _replay_journal(self):
+        with open(self.journal_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line cut short by the crash
+                    break
+                if record.pop("options", None) == self.options:
+                    self.entries[record.pop("key")] = record
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def is_current(self, key, path):
+        """True if `path` is unchanged since it was recorded and its outputs still exist."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if not all(os.path.exists(os.path.join(self.output_dir, o)) for o in entry["outputs"]):
+            return False
+
+        st = os.stat(path)
+        if st.st_size != entry["size"]:
+            return False
+        if st.st_mtime_ns == entry["mtime_ns"]:
+            return True
+
+        # Touched but possibly unchanged, fall back to the content hash
+        if file_hash(path) != entry["hash"]:
+            return False
+        entry["mtime_ns"] = st.st_mtime_ns
+        return True
+
+    def record(self, key, signature, outputs, **extra):
+        entry = dict(signature, outputs=[os.path.relpath(o, self.output_dir) for o in outputs], **extra)
+        self.entries[key] = entry
+        self.journal.write(json.dumps(dict(entry, key=key, options=self.options)) + "\n")
+        self.journal.flush()
+
+    def close(self):
+        self.journal.close()
+        atomic_write(self.path, lambda f: json.dump({"options": self.options, "files": self.entries}, f), mode='w')
+        os.remove(self.journal_path)
+
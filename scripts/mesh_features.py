@@ -0,0 +1,168 @@
+"""Precompute per-sample mesh features from the output of obj2npy.py
+
+Vertex normals, CSR vertex adjacency, bounding box, unit-cube
+normalization and cumulative face areas are stored next to _vertices.npy /
+_faces.npy, so training pays for them once per dataset build instead of
+once per epoch.
+"""
+import os
+import argparse
+import functools
+import numpy as np
+from parallel import run_tasks, write_error_report
+from manifest import Manifest, atomic_save, file_signature
+from schema import FEATURE_FIELDS, FIELDS, field_of, upcast
+
+
+def vertex_normals(vertices, faces):
+    """(V, 3) float32 unit vertex normals, the area-weighted sum of the adjacent face normals."""
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    corners = vertices[faces]
+    # Cross products are twice the face area long, so the sum is area-weighted
+    face_normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    targets = faces.ravel()
+    normals = np.empty((len(vertices), 3))
+    for axis in range(3):
+        normals[:, axis] = np.bincount(targets, weights=np.repeat(face_normals[:, axis], 3), minlength=len(vertices))
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return (normals / np.where(lengths > 0, lengths, 1)).astype(np.float32)
+
+
+def vertex_adjacency(faces, n_vertices):
+    """CSR vertex adjacency of the face edges, neighbors of v are indices[indptr[v]:indptr[v + 1]], sorted.
+
+    Returns:
+        (V + 1,) int64 indptr and (E,) int32 (int64 above 2^31 vertices) indices
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    # Both directions of every edge as one sortable key, sorting groups the shared edges
+    keys = np.concatenate([edges[:, 0] * n_vertices + edges[:, 1], edges[:, 1] * n_vertices + edges[:, 0]])
+    keys.sort()
+    # Drop repeats with a neighbor comparison, much faster than np.unique on large arrays
+    keys = keys[np.concatenate([keys[:1] == keys[:1], keys[1:] != keys[:-1]])]
+    rows, cols = np.divmod(keys, n_vertices)
+    indptr = np.zeros(n_vertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_vertices), out=indptr[1:])
+    dtype = np.int32 if n_vertices <= np.iinfo(np.int32).max else np.int64
+    return indptr, cols.astype(dtype)
+
+
+def face_area_cdf(vertices, faces):
+    """(F,) float64 cumulative face areas of a mesh, the last entry is the total area.
+
+    Pass it to sampling.sample_surface(s) as `cdf` to skip the area computation, e.g.
+    when the same mesh is sampled every epoch.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    corners = np.take(vertices, faces, axis=0)
+    areas = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+    return np.cumsum(areas)
+
+
+def bounding_box(vertices):
+    """(2, 3) minimum and maximum corner, zeros for an empty mesh."""
+    vertices = np.asarray(vertices)
+    if not len(vertices):
+        return np.zeros((2, 3))
+    return np.stack([vertices.min(axis=0), vertices.max(axis=0)]).astype(np.float64)
+
+
+def unit_cube_normalization(bounds):
+    """(4,) center and scale mapping the box into [-0.5, 0.5]^3: (vertices - n[:3]) * n[3]."""
+    extent = (bounds[1] - bounds[0]).max()
+    return np.append((bounds[0] + bounds[1]) / 2, 1 / extent if extent > 0 else 1.0)
+
+
+def compute_mesh_features(vertices, faces):
+    """All feature arrays of a mesh, keyed by their schema field."""
+    vertices, faces = upcast(np.asarray(vertices)), upcast(np.asarray(faces))
+    indptr, indices = vertex_adjacency(faces, len(vertices))
+    bounds = bounding_box(vertices)
+    return {
+        "normals": vertex_normals(vertices, faces),
+        "adjacency_indptr": indptr,
+        "adjacency_indices": indices,
+        "bounds": bounds,
+        "normalization": unit_cube_normalization(bounds),
+        "area_cdf": face_area_cdf(vertices, faces),
+    }
+
+
+def mesh_files(sample_dir):
+    """Paths of the mesh and feature files of a sample directory, keyed by field."""
+    files = {}
+    for entry in os.scandir(sample_dir):
+        field = field_of(entry.name)
+        if field in ("vertices", "faces") or field in FEATURE_FIELDS:
+            files[field] = entry.path
+    return files
+
+
+def export_features(sample_dir):
+    """Compute and save the features of one sample directory, return the written files."""
+    files = mesh_files(sample_dir)
+    if "vertices" not in files or "faces" not in files:
+        raise FileNotFoundError(f"No _vertices.npy and _faces.npy in {sample_dir}")
+    features = compute_mesh_features(np.load(files["vertices"]), np.load(files["faces"]))
+    prefix = files["vertices"][:-len(FIELDS["vertices"])]
+    return [atomic_save(prefix + FIELDS[field], array) for field, array in features.items()]
+
+
+def _process_sample(root_dir, sample):
+    sample_dir = os.path.join(root_dir, sample)
+    files = mesh_files(sample_dir)
+    # Signatures of both sources, taken before computing
+    signatures = {field: file_signature(files[field]) for field in ("vertices", "faces")}
+    return signatures, export_features(sample_dir)
+
+
+def process_samples(root_dir, workers=1, chunksize=None, resume=False, force=False):
+    """Add the mesh features to every sample directory of root_dir whose mesh changed."""
+    # Samples without a mesh, e.g. bvh2npy output, are left alone
+    sample_files = {entry.name: mesh_files(entry.path) for entry in os.scandir(root_dir) if entry.is_dir()}
+    samples = sorted(sample for sample, files in sample_files.items() if "vertices" in files and "faces" in files)
+    # Adding a feature invalidates the manifest
+    manifest = Manifest(root_dir, "mesh_features", options={"fields": list(FEATURE_FIELDS)}, resume=resume)
+
+    def is_current(sample):
+        return all(manifest.is_current(f"{sample}/{field}", sample_files[sample][field])
+                   for field in ("vertices", "faces"))
+
+    pending = [sample for sample in samples if force or not is_current(sample)]
+    if len(pending) < len(samples):
+        print(f"Skipping {len(samples) - len(pending)} unchanged samples")
+
+    def record(sample, result):
+        signatures, outputs = result
+        for field, signature in signatures.items():
+            manifest.record(f"{sample}/{field}", signature, outputs)
+
+    try:
+        errors = run_tasks(functools.partial(_process_sample, root_dir), pending, workers=workers,
+                           chunksize=chunksize, desc="Computing mesh features", on_result=record)
+    finally:
+        manifest.close()
+    write_error_report(root_dir, errors, "mesh_features")
+    return errors
+
+
+def add_arguments(parser):
+    parser.add_argument('root_dir', type=str, help='obj2npy output directory, one subdirectory per sample.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, 0 for all cores.')
+    parser.add_argument('--chunksize', type=int, default=None, help='Samples handed to a worker at once.')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run.')
+    parser.add_argument('--force', action='store_true', help='Recompute all samples, including unchanged ones.')
+
+
+def main(args):
+    return process_samples(args.root_dir, args.workers, args.chunksize, args.resume, args.force)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute normals, adjacency, bounds, normalization and area CDFs of meshes.')
+    add_arguments(parser)
+    main(parser.parse_args())
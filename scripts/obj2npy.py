@@ -1,9 +1,150 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 import os
-import tqdm
 import argparse
+import functools
+from parallel import output_subdir, run_tasks, write_error_report
+from manifest import Manifest, NpyAppender, atomic_save, atomic_write, run_tracked, write_rows
+from schema import compact_indices, compact_positions, field_of, index_dtype, upcast
+from instrument import instrumented, stage, start_events, summarize
+
+_SPACE = ord(' ')
+_NEWLINE = ord('\n')
+_SLASH = ord('/')
+_COMMENT = ord('#')
+# Bytes of an OBJ file parsed at once by OBJData.load_obj, bounds the parser's working memory
+PARSE_BLOCK_BYTES = 4 << 20
+
+
+def _blank_ranges(buf, starts, stops):
+    """Set buf[starts[i]:stops[i]] to spaces, for sorted, disjoint ranges with distinct stops."""
+    # +1 at every start and -1 at every stop, the running sum is 1 inside a range
+    inside = np.zeros(len(buf) + 1, dtype=np.int8)
+    inside[starts] = 1
+    inside[stops] -= 1
+    np.cumsum(inside, dtype=np.int8, out=inside)
+    buf[inside[:-1].view(bool)] = _SPACE
+
+
+def _select_records(buf, starts, ends, keep):
+    """Gather the kept lines into one space separated payload buffer.
+
+    The single character record tag at `starts` and the line terminator at
+    `ends` are blanked out. Returns the payload, the offset of every token in
+    it and the number of tokens on every kept line.
+    """
+    lines = np.flatnonzero(keep)
+    if len(lines) == 0:
+        return np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Records of one kind usually come in long runs of consecutive lines,
+    # so copy whole runs instead of single lines
+    breaks = np.flatnonzero(np.diff(lines) != 1) + 1
+    run_first = lines[np.concatenate(([0], breaks))]
+    run_last = lines[np.concatenate((breaks - 1, [len(lines) - 1]))]
+    payload = np.concatenate([buf[s:e + 1] for s, e in zip(starts[run_first], ends[run_last])])
+
+    lengths = ends[lines] - starts[lines] + 1
+    line_offsets = np.cumsum(lengths) - lengths
+    payload[line_offsets] = _SPACE
+    payload[line_offsets + lengths - 1] = _SPACE
+
+    # Tokens start at space -> non-space transitions, the payload starts with a blanked tag
+    is_space = payload == _SPACE
+    token_starts = np.flatnonzero(is_space[:-1] & ~is_space[1:]) + 1
+    counts = np.diff(np.searchsorted(token_starts, np.append(line_offsets, len(payload))))
+    return payload, token_starts, counts
+
+
+def _parse_numbers(payload, count, dtype):
+    # Parses the uint8 buffer in place, without a bytes or str copy
+    values = np.fromstring(payload, dtype=dtype, sep=' ')
+    if len(values) != count:
+        raise ValueError(f"Malformed OBJ records: expected {count} values, parsed {len(values)}")
+    return values
+
+
+def parse_obj_buffer(buf, vertex_base=0):
+    """Parse the raw bytes of an OBJ file into vertex and face arrays.
+
+    Working memory is a small multiple of len(buf), so large files are parsed
+    in blocks of whole lines, see OBJData.load_obj and stream_obj_file.
+
+    Args:
+        buf (np.ndarray): uint8 view of the file contents, or of a run of whole lines.
+        vertex_base (int): vertices defined before `buf`, for negative indices.
+
+    Returns:
+        (np.ndarray, np.ndarray): float32 vertices (V, 3), int32 faces (F, 3).
+    """
+    # Normalize tabs and CRs to spaces and make sure the last line is terminated
+    data = np.empty(len(buf) + 1, dtype=np.uint8)
+    data[:-1] = buf
+    data[-1] = _NEWLINE
+    data[data == ord('\t')] = _SPACE
+    data[data == ord('\r')] = _SPACE
+    buf = data
+
+    ends = np.flatnonzero(buf == _NEWLINE)
+    # Comments run from the first '#' of a line to its end
+    comments = np.flatnonzero(buf == _COMMENT)
+    if len(comments):
+        comment_ends = ends[np.searchsorted(ends, comments)]
+        first = np.concatenate(([True], comment_ends[1:] != comment_ends[:-1]))
+        _blank_ranges(buf, comments[first], comment_ends[first])
+
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    first = buf[starts]
+    second = buf[np.minimum(starts + 1, len(buf) - 1)]
+    is_record = (ends - starts >= 2) & (second == _SPACE)
+    is_vertex = is_record & (first == ord('v'))
+    is_face = is_record & (first == ord('f'))
+
+    # Vertices: the first three coordinates of every `v` record
+    payload, _, counts = _select_records(buf, starts, ends, is_vertex)
+    if np.any(counts < 3):
+        raise ValueError("Malformed OBJ vertex record with less than 3 coordinates")
+    values = _parse_numbers(payload, counts.sum(), np.float32)
+    vertices = np.empty((len(counts), 3), dtype=np.float32)
+    if np.all(counts == 3):
+        vertices[:] = values.reshape(-1, 3)
+    else:
+        offsets = np.cumsum(counts) - counts
+        vertices[:] = values[offsets[:, None] + np.arange(3)]
+    del payload, values
+
+    # Faces: blank each token from its first '/' on (v/vt/vn) up to the next space
+    payload, token_starts, counts = _select_records(buf, starts, ends, is_face)
+    if np.any(counts < 3):
+        raise ValueError("Malformed OBJ face record with less than 3 vertices")
+    slashes = np.flatnonzero(payload == _SLASH)
+    if len(slashes):
+        token = np.searchsorted(token_starts, slashes, side='right') - 1
+        first = np.concatenate(([True], token[1:] != token[:-1]))
+        slashes, token = slashes[first], token[first]
+        # Every token ends before the next token's leading spaces, the payload ends with a blank
+        is_space = payload == _SPACE
+        token_ends = np.flatnonzero(~is_space[:-1] & is_space[1:]) + 1
+        _blank_ranges(payload, slashes, token_ends[token])
+    indices = _parse_numbers(payload, counts.sum(), np.int32)
+    del payload
+
+    # Resolve 1-based and negative (relative to the vertices seen so far) indices
+    vertices_before = np.cumsum(is_vertex)[is_face] + vertex_base
+    relative_base = np.repeat(vertices_before, counts).astype(np.int32)
+    indices = np.where(indices < 0, relative_base + indices, indices - 1).astype(np.int32)
+
+    # Fan triangulation: polygon (a, b, c, d, ...) -> (a, b, c), (a, c, d), ...
+    offsets = np.cumsum(counts) - counts
+    n_triangles = counts - 2
+    anchor = np.repeat(offsets, n_triangles)
+    corner = np.arange(n_triangles.sum()) - np.repeat(np.cumsum(n_triangles) - n_triangles, n_triangles)
+    faces = np.empty((len(anchor), 3), dtype=np.int32)
+    faces[:, 0] = indices[anchor]
+    faces[:, 1] = indices[anchor + corner + 1]
+    faces[:, 2] = indices[anchor + corner + 2]
+
+    return vertices, faces
+
 
 class OBJData:
     def __init__(self, file_path):
@@ -12,7 +153,42 @@ class OBJData:
         self.faces = np.array([])
         self.vertices, self.faces = self.load_obj(file_path)
 
-    def load_obj(self, filename):
+    def load_obj(self, filename, block_bytes=PARSE_BLOCK_BYTES):
+        """Parse an OBJ file with bulk, vectorized NumPy operations.
+
+        Returns float32 vertices of shape (V, 3) and int32 triangle faces of
+        shape (F, 3). `v/vt/vn` face tokens are reduced to the vertex index,
+        negative (relative) indices are resolved and polygons are fan
+        triangulated. The file is parsed in blocks of about `block_bytes` of
+        whole lines, so the parser's working memory doesn't grow with the file.
+        """
+        vertex_blocks, face_blocks = [], []
+        n_vertices = 0
+        with open(filename, 'rb') as file:
+            blocks = iter_line_chunks(file, block_bytes)
+            while True:
+                with stage("read"):
+                    buf = next(blocks, None)
+                if buf is None:
+                    break
+                with stage("parse"):
+                    block_vertices, block_faces = parse_obj_buffer(buf, vertex_base=n_vertices)
+                del buf
+                n_vertices += len(block_vertices)
+                vertex_blocks.append(block_vertices)
+                face_blocks.append(block_faces)
+        if not vertex_blocks:
+            return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.int32)
+        # The totals are only known once parsed, every block is copied once into the result
+        vertices = np.empty((n_vertices, 3), dtype=np.float32)
+        faces = np.empty((sum(len(block) for block in face_blocks), 3), dtype=np.int32)
+        np.concatenate(vertex_blocks, out=vertices)
+        del vertex_blocks
+        np.concatenate(face_blocks, out=faces)
+        return vertices, faces
+
+    def load_obj_reference(self, filename):
+        # Line by line reference parser, kept for equivalence tests
         vertices = []
         faces = []
 
@@ -28,53 +204,23 @@ class OBJData:
 
     @staticmethod
     def show(directory):
-        # Find the numpy files in the directory
-        files = os.listdir(directory)
-        vertices_file = None
-        faces_file = None
-        for file in files:
-            if file.endswith("_vertices.npy"):
-                vertices_file = os.path.join(directory, file)
-            elif file.endswith("_faces.npy"):
-                faces_file = os.path.join(directory, file)
-
-        # Load data from numpy files
-        if vertices_file and faces_file:
-            vertices = np.load(vertices_file)
-            faces = np.load(faces_file)
-
-            # Plotting
-            fig = plt.figure(figsize=(12, 12))
-            ax = fig.add_subplot(111, projection='3d')
-
-            ax.scatter(vertices[:, 0], vertices[:, 1], vertices[:, 2], marker='o', c='b', s=0.05, label='Vertices')
-
-            for face in faces:
-                face_vertices = vertices[face]
-                face_vertices = np.append(face_vertices, [face_vertices[0]], axis=0)
-                ax.plot(face_vertices[:, 0], face_vertices[:, 1], face_vertices[:, 2], color='r', linewidth=0.01, label='Faces')
+        # Imported here so that converting never loads matplotlib
+        from utils import show_mesh_dir
+        show_mesh_dir(directory)
 
-            max_range = np.array([vertices[:, 0].max() - vertices[:, 0].min(), vertices[:, 1].max() - vertices[:, 1].min(), vertices[:, 2].max() - vertices[:, 2].min()]).max() / 2.0
-            mid_x = (vertices[:, 0].max() + vertices[:, 0].min()) * 0.5
-            mid_y = (vertices[:, 1].max() + vertices[:, 1].min()) * 0.5
-            mid_z = (vertices[:, 2].max() + vertices[:, 2].min()) * 0.5
-
-            ax.set_xlim(mid_x - max_range, mid_x + max_range)
-            ax.set_ylim(mid_y - max_range, mid_y + max_range)
-            ax.set_zlim(mid_z - max_range, mid_z + max_range)
-
-            ax.view_init(elev=100., azim=-90)
-            plt.show()
-        else:
-            print("Required numpy files not found in the directory.")
-
-    def export(self, path):
-        np.save(f"{path}_vertices.npy", self.vertices)
-        np.save(f"{path}_faces.npy", self.faces)
+    def export(self, path, compact=False):
+        vertices, faces = self.vertices, self.faces
+        if compact:
+            # float32 positions and the smallest integer type holding the face indices
+            vertices, faces = compact_positions(vertices), compact_indices(faces)
+        with stage("write"):
+            outputs = [atomic_save(f"{path}_vertices.npy", vertices),
+                       atomic_save(f"{path}_faces.npy", faces)]
 
         print(f"Exported to {path}_vertices.npy and {path}_faces.npy")
-        print(f"Exported vertices shape: {self.vertices.shape}")
-        print(f"Exported faces shape: {self.faces.shape}")
+        print(f"Exported vertices shape: {vertices.shape} {vertices.dtype}")
+        print(f"Exported faces shape: {faces.shape} {faces.dtype}")
+        return outputs
 
     def load_from(self, directory):
         # Find the numpy files in the directory
@@ -82,9 +228,11 @@ class OBJData:
         vertices_file = None
         faces_file = None
         for file in files:
-            if file.endswith("_vertices.npy"):
+            # By field, _lod<k>_vertices.npy of lod.py also ends with _vertices.npy
+            field = field_of(file)
+            if field == "vertices":
                 vertices_file = os.path.join(directory, file)
-            elif file.endswith("_faces.npy"):
+            elif field == "faces":
                 faces_file = os.path.join(directory, file)
 
         # Load data from numpy files
@@ -95,32 +243,148 @@ class OBJData:
             raise FileNotFoundError("Required numpy files not found in the directory.")
 
     def export_to_obj(self, output_path):
-        with open(output_path, 'w') as f:
+        vertices = np.asarray(self.vertices).reshape(-1, 3)
+        faces = upcast(np.asarray(self.faces))
+        # Shortest round-trip repr for float64, 9 significant digits are exact for float32
+        coordinate = " %.9g" if vertices.dtype == np.float32 else " %r"
+
+        def write(f):
             f.write("# Exported OBJ file\n")
-            for vertex in self.vertices:
-                f.write(f"v {vertex[0]} {vertex[1]} {vertex[2]}\n")
-            for face in self.faces:
-                f.write("f " + " ".join([str(v + 1) for v in face]) + "\n")
-
-def process_obj_files(input_dir, output_dir):
-    obj_files = [f for f in os.listdir(input_dir) if f.endswith('.obj')]
-    for obj_file in tqdm.tqdm(obj_files, desc="Processing OBJ files"):
-        file_path = os.path.join(input_dir, obj_file)
+            write_rows(f, vertices, "v" + coordinate * 3 + "\n")
+            if len(faces):
+                write_rows(f, faces + 1, "f" + " %d" * faces.shape[1] + "\n")
+
+        atomic_write(output_path, write, mode='w')
+
+def iter_line_chunks(file, chunk_bytes):
+    """Read a file in blocks of about chunk_bytes that end on a line boundary.
+
+    Yields uint8 arrays; the partial last line of a block is carried over to
+    the next one.
+    """
+    tail = b''
+    while True:
+        block = file.read(chunk_bytes)
+        if not block:
+            if tail:
+                yield np.frombuffer(tail, dtype=np.uint8)
+            return
+        block = tail + block
+        cut = block.rfind(b'\n') + 1
+        if cut == 0:
+            # A single line longer than the block, keep reading
+            tail = block
+            continue
+        yield np.frombuffer(block, dtype=np.uint8, count=cut)
+        tail = block[cut:]
+
+
+def stream_obj_file(file_path, path, chunk_bytes=64 << 20, compact=False):
+    """Convert an OBJ file chunk by chunk, with memory bounded by chunk_bytes.
+
+    Every chunk of whole lines is parsed with parse_obj_buffer and appended
+    to the outputs on disk. The outputs are identical to OBJData.export,
+    with compact=True the faces are narrowed in a second chunked pass once
+    the largest index is known.
+    """
+    vertices = NpyAppender(f"{path}_vertices.npy", np.float32, (3,))
+    faces = NpyAppender(f"{path}_faces.npy", np.int32, (3,))
+    max_index = 0
+    try:
+        with open(file_path, 'rb') as f:
+            for buf in iter_line_chunks(f, chunk_bytes):
+                with stage("parse"):
+                    block_vertices, block_faces = parse_obj_buffer(buf, vertex_base=vertices.rows)
+                with stage("write"):
+                    vertices.append(block_vertices)
+                    faces.append(block_faces)
+                max_index = max(max_index, int(block_faces.max(initial=0)))
+        outputs = [vertices.close(), faces.close()]
+    except BaseException:
+        vertices.abort()
+        faces.abort()
+        raise
+
+    dtype = index_dtype(max_index)
+    if compact and dtype != faces.dtype:
+        source = np.load(faces.path, mmap_mode='r')
+        narrowed = NpyAppender(faces.path, dtype, (3,))
+        try:
+            rows = max(1, chunk_bytes // source.strides[0])
+            for start in range(0, len(source), rows):
+                narrowed.append(source[start:start + rows])
+            narrowed.close()
+        except BaseException:
+            narrowed.abort()
+            raise
+        finally:
+            del source
+
+    print(f"Exported to {path}_vertices.npy and {path}_faces.npy")
+    print(f"Exported vertices shape: ({vertices.rows}, 3) float32")
+    print(f"Exported faces shape: ({faces.rows}, 3) {dtype if compact else faces.dtype}")
+    return outputs
+
+def convert_obj_file(input_dir, output_dir, obj_file, compact=False, stream=False, chunk_bytes=64 << 20):
+    file_path = os.path.join(input_dir, obj_file)
+    name = os.path.splitext(obj_file)[0]
+    with output_subdir(os.path.join(output_dir, name)) as subdir:
+        path = os.path.join(subdir, name)
+        if stream:
+            return stream_obj_file(file_path, path, chunk_bytes, compact=compact)
         obj_data = OBJData(file_path)
-        output_subdir = os.path.join(output_dir, os.path.splitext(obj_file)[0])
-        os.makedirs(output_subdir, exist_ok=True)
-        obj_data.export(os.path.join(output_subdir, os.path.splitext(obj_file)[0]))
+        return obj_data.export(path, compact=compact)
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Process multiple OBJ files and export to numpy format.')
+def process_obj_files(input_dir, output_dir, workers=1, chunksize=None, resume=False, force=False, compact=False,
+                      stream=False, chunk_bytes=64 << 20, profile=None, trace_memory=False):
+    obj_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.obj'))
+
+    # Skip files that did not change since they were last converted
+    manifest = Manifest(output_dir, "obj2npy", options={"compact": compact}, resume=resume)
+    pending = [f for f in obj_files if force or not manifest.is_current(f, os.path.join(input_dir, f))]
+    if len(pending) < len(obj_files):
+        print(f"Skipping {len(obj_files) - len(pending)} unchanged files")
+
+    convert = functools.partial(convert_obj_file, input_dir, output_dir, compact=compact,
+                                stream=stream, chunk_bytes=chunk_bytes)
+    if profile is not None:
+        start_events(profile)
+    convert = instrumented(convert, input_dir, profile, trace_memory)
+    try:
+        errors = run_tasks(functools.partial(run_tracked, convert, input_dir), pending,
+                           workers=workers, chunksize=chunksize, desc="Processing OBJ files",
+                           on_result=lambda f, result: manifest.record(f, *result))
+    finally:
+        manifest.close()
+    write_error_report(output_dir, errors, "obj2npy")
+    if profile is not None:
+        summarize(profile)
+    return errors
+
+def add_arguments(parser):
     parser.add_argument('input_dir', type=str, help='Input directory containing OBJ files.')
     parser.add_argument('output_dir', type=str, help='Output directory for numpy files.')
-    args = parser.parse_args()
-    
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, 0 for all cores.')
+    parser.add_argument('--chunksize', type=int, default=None, help='Files handed to a worker at once.')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run.')
+    parser.add_argument('--force', action='store_true', help='Convert all files, including unchanged ones.')
+    parser.add_argument('--compact', action='store_true', help='Store float32 positions and the smallest integer type for indices.')
+    parser.add_argument('--stream', action='store_true', help='Convert in chunks with bounded memory, for very large meshes.')
+    parser.add_argument('--stream-chunk-size', type=int, default=64, help='Chunk size of --stream in MiB.')
+    parser.add_argument('--profile', type=str, default=None, help='Write per-file stage timings to this JSONL file.')
+    parser.add_argument('--trace-memory', action='store_true', help='Record the peak traced memory of every file with --profile.')
+
+def main(args):
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir, exist_ok=True)
 
-    process_obj_files(args.input_dir, args.output_dir)
+    return process_obj_files(args.input_dir, args.output_dir, args.workers, args.chunksize, args.resume, args.force,
+                             args.compact, args.stream, args.stream_chunk_size << 20, args.profile, args.trace_memory)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Process multiple OBJ files and export to numpy format.')
+    add_arguments(parser)
+    main(parser.parse_args())
 
 # Example usage:
 # obj_data = OBJData('./path/to/your.obj')
@@ -0,0 +1,205 @@
+"""Pack per-sample numpy directories into a few large shard files
+"""
+import os
+import json
+import argparse
+import numpy as np
+import tqdm
+from manifest import atomic_save, atomic_write
+from schema import FIELDS, field_of, load_names
+
+# Joint names are variable length strings, packed as utf-8 bytes plus lengths
+_PACKED_FIELDS = ["vertices", "faces", "skel", "link", "names_bytes", "names_lengths",
+                  "skin_indptr", "skin_joints", "skin_weights", "skin_topk_joints", "skin_topk_weights"]
+_ALIGNMENT = 64
+INDEX_FILE = "index.json"
+OFFSETS_FILE = "index.npy"
+
+
+def find_sample_files(directory):
+    """Map field name -> .npy path for the files found in a sample directory."""
+    files = {}
+    for entry in os.scandir(directory):
+        field = field_of(entry.name)
+        if field is not None:
+            files[field] = entry.path
+    return files
+
+
+def _load_sample(files):
+    arrays = {}
+    for field, path in files.items():
+        if field == "names":
+            names = [name.encode('utf-8') for name in load_names(path)]
+            arrays["names_bytes"] = np.frombuffer(b"".join(names), dtype=np.uint8)
+            arrays["names_lengths"] = np.array([len(name) for name in names], dtype=np.int32)
+        elif field in _PACKED_FIELDS:
+            arrays[field] = np.load(path)
+    return arrays
+
+
+class ShardWriter:
+    """Accumulates samples and flushes them into shard files of about `shard_bytes`.
+
+    Every shard is one file holding, per field, the rows of all its samples
+    concatenated into a flat, 64-byte aligned buffer. The row start and row
+    count of every sample and field go into one (samples, 1 + 2 * fields)
+    offset index, column 0 being the shard id. A count of -1 marks a
+    missing field.
+    """
+
+    def __init__(self, output_dir, shard_bytes=512 << 20):
+        self.output_dir = output_dir
+        self.shard_bytes = shard_bytes
+        self.fields = {}
+        self.shards = []
+        self.samples = []
+        self.offsets = []
+        self._pending = []
+        self._pending_bytes = 0
+
+    def add(self, name, arrays):
+        for field, array in arrays.items():
+            if field not in self.fields:
+                # The first sample fixes the dtype and row shape of a field. Compact
+                # index dtypes vary per sample, so integers are widened to int32.
+                dtype = np.dtype(np.int32) if array.dtype.kind in 'iu' and field != "names_bytes" else array.dtype
+                self.fields[field] = {"dtype": dtype.str, "shape": list(array.shape[1:])}
+            spec = self.fields[field]
+            if list(array.shape[1:]) != spec["shape"]:
+                raise ValueError(f"{name}: {field} rows of shape {array.shape[1:]}, expected {tuple(spec['shape'])}")
+            arrays[field] = np.ascontiguousarray(array, dtype=np.dtype(spec["dtype"]))
+
+        self.samples.append(name)
+        self._pending.append(arrays)
+        self._pending_bytes += sum(a.nbytes for a in arrays.values())
+        if self._pending_bytes >= self.shard_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        shard_id = len(self.shards)
+        shard_file = f"shard-{shard_id:05d}.bin"
+        rows = {field: 0 for field in _PACKED_FIELDS}
+        layout = {}
+
+        def write(f):
+            for field in _PACKED_FIELDS:
+                if field not in self.fields:
+                    continue
+                f.write(b"\0" * (-f.tell() % _ALIGNMENT))
+                layout[field] = f.tell()
+                for arrays in self._pending:
+                    if field in arrays:
+                        f.write(arrays[field].tobytes())
+
+        atomic_write(os.path.join(self.output_dir, shard_file), write)
+
+        for arrays in self._pending:
+            row = [shard_id]
+            for field in _PACKED_FIELDS:
+                if field in arrays:
+                    row += [rows[field], len(arrays[field])]
+                    rows[field] += len(arrays[field])
+                else:
+                    row += [0, -1]
+            self.offsets.append(row)
+
+        self.shards.append({"file": shard_file, "fields": layout})
+        self._pending = []
+        self._pending_bytes = 0
+
+    def close(self):
+        self.flush()
+        atomic_save(os.path.join(self.output_dir, OFFSETS_FILE),
+                    np.array(self.offsets, dtype=np.int64).reshape(-1, 1 + 2 * len(_PACKED_FIELDS)))
+        index = {"version": 1, "packed_fields": _PACKED_FIELDS, "fields": self.fields,
+                 "shards": self.shards, "samples": self.samples}
+        atomic_write(os.path.join(self.output_dir, INDEX_FILE), lambda f: json.dump(index, f), mode='w')
+
+
+class PackedShards:
+    """Memory-mapped reader for the output of ShardWriter.
+
+    Samples are returned as zero-copy views into the mapped shard files.
+    Shards are mapped lazily, so the reader can be created before a fork.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        with open(os.path.join(root_dir, INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        self.fields = index["fields"]
+        self.shards = index["shards"]
+        self.samples = index["samples"]
+        self.offsets = np.load(os.path.join(root_dir, OFFSETS_FILE), mmap_mode='r')
+        self._columns = {field: 1 + 2 * i for i, field in enumerate(index["packed_fields"])}
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _shard(self, shard_id):
+        if shard_id not in self._maps:
+            path = os.path.join(self.root_dir, self.shards[shard_id]["file"])
+            self._maps[shard_id] = np.memmap(path, dtype=np.uint8, mode='r')
+        return self._maps[shard_id]
+
+    def _field(self, idx, field):
+        column = self._columns[field]
+        shard_id, start, count = self.offsets[idx, 0], self.offsets[idx, column], self.offsets[idx, column + 1]
+        if count < 0:
+            return None
+        spec = self.fields[field]
+        dtype = np.dtype(spec["dtype"])
+        row_bytes = dtype.itemsize * int(np.prod(spec["shape"], dtype=np.int64))
+        begin = self.shards[shard_id]["fields"][field] + start * row_bytes
+        buf = self._shard(int(shard_id))[begin:begin + count * row_bytes]
+        return buf.view(dtype).reshape((count, *spec["shape"]))
+
+    def get(self, idx, fields=None):
+        """Arrays of one sample as a dict keyed by field name."""
+        data = {}
+        for field in fields or FIELDS:
+            if field == "names":
+                names_bytes = self._field(idx, "names_bytes")
+                if names_bytes is None:
+                    continue
+                ends = np.cumsum(self._field(idx, "names_lengths"))
+                raw = names_bytes.tobytes()
+                data[field] = [raw[e - n:e].decode('utf-8') for e, n in zip(ends, np.diff(ends, prepend=0))]
+            elif field in self._columns:
+                array = self._field(idx, field)
+                if array is not None:
+                    data[field] = array
+        return data
+
+
+def pack_dataset(input_dir, output_dir, shard_bytes=512 << 20):
+    """Pack every sample subdirectory of `input_dir` into shards in `output_dir`."""
+    os.makedirs(output_dir, exist_ok=True)
+    writer = ShardWriter(output_dir, shard_bytes)
+    subdirs = sorted(entry.name for entry in os.scandir(input_dir) if entry.is_dir())
+    for subdir in tqdm.tqdm(subdirs, desc="Packing samples"):
+        files = find_sample_files(os.path.join(input_dir, subdir))
+        if files:
+            writer.add(subdir, _load_sample(files))
+    writer.close()
+    print(f"Packed {len(writer.samples)} samples into {len(writer.shards)} shards in {output_dir}")
+
+
+def add_arguments(parser):
+    parser.add_argument('input_dir', type=str, help='Directory with one subdirectory of numpy files per sample.')
+    parser.add_argument('output_dir', type=str, help='Output directory for the shard files.')
+    parser.add_argument('--shard-size', type=int, default=512, help='Approximate shard size in MiB.')
+
+
+def main(args):
+    pack_dataset(args.input_dir, args.output_dir, args.shard_size << 20)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack per-sample numpy directories into shard files.')
+    add_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,92 @@
+"""Process pool helpers shared by the converters
+"""
+import os
+import json
+import functools
+import contextlib
+import traceback
+import multiprocessing
+import tqdm
+
+
+def _call(func, item):
+    # Runs in the worker, a failing file must not take the whole run down
+    try:
+        return item, func(item), None
+    except Exception:
+        return item, None, traceback.format_exc()
+
+
+def run_tasks(func, items, workers=1, chunksize=None, desc=None, on_result=None):
+    """Run func(item) for every item, optionally over a process pool.
+
+    Args:
+        func (callable): picklable per item function, e.g. a functools.partial of a module level function.
+        items (list): work items, progress is reported in this order.
+        workers (int): number of processes, 1 runs in process, 0 uses all cores.
+        chunksize (int): items handed to a worker at once, None picks one from the workload.
+        desc (str): progress bar description.
+        on_result (callable): called as on_result(item, result) in this process for every successful item.
+
+    Returns:
+        dict: traceback string of every failed item.
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    call = functools.partial(_call, func)
+
+    errors = {}
+    pool = None
+    if workers > 1 and len(items) > 1:
+        if chunksize is None:
+            chunksize = max(1, min(64, len(items) // (workers * 4)))
+        pool = multiprocessing.Pool(min(workers, len(items)))
+        results = pool.imap(call, items, chunksize=chunksize)
+    else:
+        results = map(call, items)
+
+    try:
+        for item, result, error in tqdm.tqdm(results, total=len(items), desc=desc):
+            if error is not None:
+                errors[item] = error
+                tqdm.tqdm.write(f"Failed: {item}")
+            elif on_result is not None:
+                on_result(item, result)
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return errors
+
+
+@contextlib.contextmanager
+def output_subdir(path):
+    """Create the output directory of one item, removed again if the item fails before writing to it."""
+    created = not os.path.isdir(path)
+    os.makedirs(path, exist_ok=True)
+    try:
+        yield path
+    except BaseException:
+        if created and not os.listdir(path):
+            os.rmdir(path)
+        raise
+
+
+def write_error_report(output_dir, errors, name):
+    """Write the failed items to <output_dir>/<name>_errors.json, if any.
+
+    The report of an earlier run is removed when nothing failed.
+    """
+    report_path = os.path.join(output_dir, f"{name}_errors.json")
+    if not errors:
+        if os.path.exists(report_path):
+            os.remove(report_path)
+        return None
+    with open(report_path, 'w') as f:
+        json.dump([{"file": item, "error": error} for item, error in errors.items()], f, indent=2)
+    print(f"{len(errors)} files failed, see {report_path}")
+    return report_path
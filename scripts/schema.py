@@ -0,0 +1,125 @@
+"""Per-sample file layout shared by the exporters and the dataset readers
+"""
+import os
+import re
+import numpy as np
+
+# Field name -> file suffix inside a sample directory
+FIELDS = {
+    "vertices": "_vertices.npy",
+    "faces": "_faces.npy",
+    "skel": "_skel.npy",
+    "link": "_link.npy",
+    "names": "_names.npy",
+    # Skinning weights, CSR over vertices: row v holds joints[indptr[v]:indptr[v + 1]]
+    "skin_indptr": "_skin_indptr.npy",
+    "skin_joints": "_skin_joints.npy",
+    "skin_weights": "_skin_weights.npy",
+    # or the k largest weights of every vertex, zero-padded
+    "skin_topk_joints": "_skin_topk_joints.npy",
+    "skin_topk_weights": "_skin_topk_weights.npy",
+    # Animation of a take: (frames, channels) float32 frames, the frame time in seconds
+    # and the (channels, 2) joint name / channel name of every column
+    "motion": "_motion.npy",
+    "frame_time": "_frame_time.npy",
+    "channels": "_channels.npy",
+    # Mesh features precomputed by mesh_features.py: (V, 3) unit normals, CSR vertex
+    # adjacency, (2, 3) bounding box, (4,) unit-cube center and scale and (F,) cumulative face areas
+    "normals": "_normals.npy",
+    "adjacency_indptr": "_adjacency_indptr.npy",
+    "adjacency_indices": "_adjacency_indices.npy",
+    "bounds": "_bounds.npy",
+    "normalization": "_normalization.npy",
+    "area_cdf": "_area_cdf.npy",
+}
+SKIN_CSR_FIELDS = ("skin_indptr", "skin_joints", "skin_weights")
+SKIN_TOPK_FIELDS = ("skin_topk_joints", "skin_topk_weights")
+FEATURE_FIELDS = ("normals", "adjacency_indptr", "adjacency_indices", "bounds", "normalization", "area_cdf")
+# Levels of detail written by lod.py, _lod<k>_vertices.npy etc. are field lod<k>_vertices. remap
+# is the (V,) LOD vertex of every full-resolution vertex.
+LOD_FIELDS = ("vertices", "faces", "remap")
+_LOD_SUFFIX = re.compile(r"_lod(\d+)_(vertices|faces|remap)\.npy$")
+
+
+def lod_field(field, level):
+    """Field name of `field` ('vertices', 'faces' or 'remap') at LOD `level`, e.g. lod2_faces."""
+    return f"lod{level}_{field}"
+
+
+def lod_suffix(field, level):
+    return f"_lod{level}_{field}.npy"
+
+
+def field_of(filename):
+    """Field stored in `filename`, None for files outside the schema."""
+    basename = os.path.basename(filename)
+    # Checked first, _lod1_vertices.npy also ends with _vertices.npy
+    match = _LOD_SUFFIX.search(basename)
+    if match:
+        return lod_field(match.group(2), int(match.group(1)))
+    for field, suffix in FIELDS.items():
+        if basename.endswith(suffix):
+            return field
+    return None
+
+
+def index_dtype(max_index):
+    """Smallest unsigned integer dtype holding indices up to max_index."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_index <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def compact_positions(array):
+    return np.asarray(array, dtype=np.float32)
+
+
+def compact_indices(array):
+    array = np.asarray(array)
+    return array.astype(index_dtype(array.max(initial=0)), copy=False)
+
+
+def upcast(array):
+    """Widen a compact array for computation: floats to float64, integers to int64."""
+    if array.dtype.kind == 'f':
+        return array.astype(np.float64, copy=False)
+    if array.dtype.kind in 'iu':
+        return array.astype(np.int64, copy=False)
+    return array
+
+
+def load_names(path):
+    """Joint names as a list of str, from fixed-width unicode or legacy pickled files."""
+    try:
+        names = np.load(path, allow_pickle=False)
+    except ValueError:
+        names = np.load(path, allow_pickle=True)
+    return [str(name) for name in names]
+
+
+def topk_from_csr(indptr, joints, weights, k):
+    """Keep the k largest weights of every vertex of CSR skinning weights.
+
+    Kept weights are renormalized to sum to 1. Vertices with fewer than k
+    influences are padded with joint 0 and weight 0.
+
+    Returns:
+        (V, k) joint indices and (V, k) float16 weights
+    """
+    indptr = np.asarray(indptr, dtype=np.int64)
+    counts = np.diff(indptr)
+    rows = np.repeat(np.arange(len(counts)), counts)
+    # Sort every row by decreasing weight, then rank the entries within their row
+    order = np.lexsort((-np.asarray(weights), rows))
+    rank = np.arange(len(order)) - indptr[rows]
+    keep = order[rank < k]
+    kept_rows, kept_rank = rows[rank < k], rank[rank < k]
+
+    topk_joints = np.zeros((len(counts), k), dtype=np.int64)
+    topk_weights = np.zeros((len(counts), k), dtype=np.float32)
+    topk_joints[kept_rows, kept_rank] = np.asarray(joints)[keep]
+    topk_weights[kept_rows, kept_rank] = np.asarray(weights)[keep]
+    totals = topk_weights.sum(axis=1, keepdims=True)
+    np.divide(topk_weights, totals, out=topk_weights, where=totals > 0)
+    return compact_indices(topk_joints), topk_weights.astype(np.float16)
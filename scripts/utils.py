@@ -1,84 +1,190 @@
 import os
+import argparse
+import functools
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
+from parallel import run_tasks, write_error_report
+from schema import field_of, load_names
+
+# Above these sizes, faces and scattered points are decimated before drawing
+MAX_FACES = 20000
+MAX_POINTS = 50000
+
+
+def decimate(array, max_count):
+    """Every k-th row of array, with k chosen to keep at most max_count rows."""
+    if max_count is None or len(array) <= max_count:
+        return array
+    return array[::-(-len(array) // max_count)]
 
-def show(global_positions, links=None, joint_names=None, faces=None):
-    # Plotting
-    fig = plt.figure(figsize=(12, 12))
-    ax = fig.add_subplot(111, projection='3d')
 
-    # Plot joints or vertices
-    ax.scatter(global_positions[:, 0], global_positions[:, 1], global_positions[:, 2], marker='o', c='b', s=0.05, label='Vertices' if faces is not None else 'Joints')
+def draw(ax, global_positions, links=None, joint_names=None, faces=None, max_faces=MAX_FACES, max_points=MAX_POINTS):
+    """Draw points, links and faces on a 3d axis, one artist per kind.
 
-    # Plot links
-    if links is not None:
-        for link in links:
-            start_pos, end_pos = global_positions[link[0]], global_positions[link[1]]
-            ax.plot([start_pos[0], end_pos[0]], [start_pos[1], end_pos[1]], [start_pos[2], end_pos[2]], 'black')
+    Faces and links are added as a single Poly3DCollection / Line3DCollection
+    instead of one line per element, so the artist count doesn't grow with
+    the mesh. Faces above max_faces and points above max_points are decimated.
+    """
+    # matplotlib is only imported by the functions that draw
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection, Poly3DCollection
+
+    points = decimate(global_positions, max_points)
+    ax.scatter(points[:, 0], points[:, 1], points[:, 2], marker='o', c='b', s=0.05,
+               label='Vertices' if faces is not None else 'Joints')
+
+    if links is not None and len(links):
+        ax.add_collection3d(Line3DCollection(global_positions[np.asarray(links)], colors='black', label='Links'))
 
-    # Annotate joint names
     if joint_names is not None:
         for i, name in enumerate(joint_names):
             ax.text(global_positions[i, 0], global_positions[i, 1], global_positions[i, 2], name)
 
-    # Plot faces
-    if faces is not None:
-        for face in faces:
-            face_vertices = global_positions[face]
-            face_vertices = np.append(face_vertices, [face_vertices[0]], axis=0)
-            ax.plot(face_vertices[:, 0], face_vertices[:, 1], face_vertices[:, 2], color='r', linewidth=0.01, label='Faces')
+    if faces is not None and len(faces):
+        triangles = global_positions[decimate(np.asarray(faces), max_faces)]
+        ax.add_collection3d(Poly3DCollection(triangles, facecolors=(1, 0, 0, 0.1), edgecolors='r',
+                                             linewidths=0.05, label='Faces'))
+
+    # Equal scale on all axes, collections don't update the data limits
+    if len(global_positions):
+        low, high = global_positions.min(axis=0), global_positions.max(axis=0)
+        mid, radius = (low + high) / 2, max((high - low).max() / 2, 1e-6)
+        ax.set_xlim(mid[0] - radius, mid[0] + radius)
+        ax.set_ylim(mid[1] - radius, mid[1] + radius)
+        ax.set_zlim(mid[2] - radius, mid[2] + radius)
 
     ax.set_xlabel('X')
     ax.set_ylabel('Y')
     ax.set_zlabel('Z')
 
-    plt.legend()
+
+def show(global_positions, links=None, joint_names=None, faces=None, max_faces=MAX_FACES, max_points=MAX_POINTS):
+    # Imported here so headless rendering never loads a GUI backend
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12, 12))
+    ax = fig.add_subplot(111, projection='3d')
+    draw(ax, global_positions, links, joint_names, faces, max_faces, max_points)
+    ax.legend()
     plt.show()
 
-def show_mesh_dir(directory):
-    # Find the numpy files in the directory
-    files = os.listdir(directory)
-    vertices_file = None
-    faces_file = None
-    for file in files:
-        if file.endswith("_vertices.npy"):
-            vertices_file = os.path.join(directory, file)
-        elif file.endswith("_faces.npy"):
-            faces_file = os.path.join(directory, file)
 
-    # Load data from numpy files
-    if vertices_file and faces_file:
-        vertices = np.load(vertices_file)
-        faces = np.load(faces_file)
+def _find_files(directory, fields):
+    # Matched by schema field, so levels of detail (_lod<k>_vertices.npy) are not taken for the mesh
+    files = {}
+    for file in os.listdir(directory):
+        field = field_of(file)
+        if field in fields:
+            files[field] = os.path.join(directory, file)
+    return files
+
+
+def show_mesh_dir(directory, max_faces=MAX_FACES):
+    files = _find_files(directory, ["vertices", "faces"])
 
-        # Use the show function from utils.py
-        show(vertices, faces=faces)
+    # Load data from numpy files
+    if len(files) == 2:
+        vertices = np.load(files["vertices"])
+        faces = np.load(files["faces"])
+        show(vertices, faces=faces, max_faces=max_faces)
     else:
         print("Required numpy files not found in the directory.")
 
+
 def show_skel_dir(directory):
-    # Find the numpy files in the directory
-    files = os.listdir(directory)
-    skel_file = None
-    link_file = None
-    names_file = None
-    for file in files:
-        if file.endswith("_skel.npy"):
-            skel_file = os.path.join(directory, file)
-        elif file.endswith("_link.npy"):
-            link_file = os.path.join(directory, file)
-        elif file.endswith("_names.npy"):
-            names_file = os.path.join(directory, file)
+    files = _find_files(directory, ["skel", "link", "names"])
 
     # Load data from numpy files
-    if skel_file:
-        global_positions = np.load(skel_file)
-        links = np.load(link_file) if link_file else None
-        joint_names = np.load(names_file, allow_pickle=True) if names_file else None
-
-        # Use the show function from utils.py
+    if "skel" in files:
+        global_positions = np.load(files["skel"])
+        links = np.load(files["link"]) if "link" in files else None
+        joint_names = load_names(files["names"]) if "names" in files else None
         show(global_positions, links, joint_names)
     else:
         print("Required _skel.npy file not found in the directory.")
-        
+
+
+def render_thumbnail(directory, output_path, size=512, max_faces=MAX_FACES, max_points=MAX_POINTS):
+    """Render the mesh and skeleton of a sample directory into a PNG file.
+
+    Draws on an Agg canvas without pyplot, so it needs no display and is
+    safe to run in worker processes.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+    files = _find_files(directory, ["vertices", "faces", "skel", "link"])
+    if not files:
+        raise FileNotFoundError(f"No mesh or skeleton files found in {directory}")
+
+    fig = Figure(figsize=(size / 100, size / 100), dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection='3d')
+    if "vertices" in files:
+        vertices = np.load(files["vertices"], mmap_mode='r')
+        faces = np.load(files["faces"], mmap_mode='r') if "faces" in files else None
+        draw(ax, np.asarray(vertices, dtype=np.float32), faces=faces, max_faces=max_faces, max_points=max_points)
+    if "skel" in files:
+        skel = np.load(files["skel"]).astype(np.float32)
+        links = np.load(files["link"]) if "link" in files else None
+        if "vertices" not in files:
+            draw(ax, skel, links=links, max_points=max_points)
+        else:
+            # Skeleton overlay, the axis limits follow the mesh
+            ax.scatter(skel[:, 0], skel[:, 1], skel[:, 2], c='k', s=4)
+            if links is not None and len(links):
+                ax.add_collection3d(Line3DCollection(skel[links], colors='black'))
+    ax.set_title(os.path.basename(directory), fontsize=8)
+    fig.savefig(output_path)
+    return output_path
+
+
+def render_thumbnails(root_dir, output_dir, workers=1, size=512, max_faces=MAX_FACES):
+    """Render a PNG thumbnail of every sample directory under root_dir in parallel."""
+    os.makedirs(output_dir, exist_ok=True)
+    samples = sorted(entry.name for entry in os.scandir(root_dir) if entry.is_dir())
+
+    render = functools.partial(_render_sample, root_dir, output_dir, size=size, max_faces=max_faces)
+    errors = run_tasks(render, samples, workers=workers, desc="Rendering thumbnails")
+    write_error_report(output_dir, errors, "thumbnails")
+    return errors
+
+
+def _render_sample(root_dir, output_dir, sample, size=512, max_faces=MAX_FACES):
+    return render_thumbnail(os.path.join(root_dir, sample), os.path.join(output_dir, f"{sample}.png"),
+                            size=size, max_faces=max_faces)
+
+
+def add_arguments(parser):
+    parser.add_argument('input_dir', type=str, help='Directory with one subdirectory of numpy files per sample.')
+    parser.add_argument('output_dir', type=str, help='Output directory for the PNG files.')
+    parser.add_argument('--workers', type=int, default=0, help='Number of worker processes, 0 for all cores.')
+    parser.add_argument('--size', type=int, default=512, help='Thumbnail size in pixels.')
+    parser.add_argument('--max-faces', type=int, default=MAX_FACES, help='Faces drawn per mesh before decimating.')
+
+
+def main(args):
+    return render_thumbnails(args.input_dir, args.output_dir, args.workers, args.size, args.max_faces)
+
+
+def add_show_arguments(parser):
+    parser.add_argument('directory', type=str, help='Sample directory with the numpy files.')
+    parser.add_argument('--skeleton', action='store_true', help='Show the skeleton instead of the mesh.')
+    parser.add_argument('--output', type=str, default=None, help='Render into this PNG file instead of opening a window.')
+    parser.add_argument('--size', type=int, default=512, help='Size of --output in pixels.')
+    parser.add_argument('--max-faces', type=int, default=MAX_FACES, help='Faces drawn before decimating.')
+
+
+def show_main(args):
+    if args.output is not None:
+        render_thumbnail(args.directory, args.output, size=args.size, max_faces=args.max_faces)
+        print(f"Rendered {args.output}")
+    elif args.skeleton:
+        show_skel_dir(args.directory)
+    else:
+        show_mesh_dir(args.directory, args.max_faces)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render PNG thumbnails of converted samples without a display.')
+    add_arguments(parser)
+    main(parser.parse_args())
@@ -1,16 +1,27 @@
-from setuptools import setup, find_packages
+from setuptools import setup
 
 setup(
     name="rigdataset",
     version="0.1",
-    packages=find_packages(),
+    # scripts/ and dataset/ are installed inside the package, rigdataset puts them on the module path
+    packages=["rigdataset", "rigdataset.scripts", "rigdataset.dataset"],
+    package_dir={"rigdataset.scripts": "scripts", "rigdataset.dataset": "dataset"},
     install_requires=[
+        'numpy',
+        'tqdm',
         'matplotlib',
     ],
+    extras_require={
+        # BVHDataset, PackedBVHDataset and the batching helpers
+        'torch': ['torch'],
+    },
+    entry_points={
+        'console_scripts': ['rigdataset=rigdataset.cli:main'],
+    },
     author="",
     author_email="",
     description="An package for convert fbx model to bvh and obj file.",
     license="MIT",
     keywords="fbx bvh obj",
     url="",
-)
\ No newline at end of file
+)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT, "scripts")
+DATASET_DIR = os.path.join(ROOT, "dataset")
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+
+for path in (SCRIPTS_DIR, DATASET_DIR, STUBS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,96 @@
+"""Stand-in for Blender's `bpy` module, enough to run convert.py and blender_extract.py without Blender
+
+Operators accept any arguments and write a placeholder file to `filepath`
+when they export. Scenes are lists of the fake objects below, which expose
+the data blocks read by blender_extract.py, including `foreach_get`.
+
+For farm tests, the environment variable STUB_BPY_CRASH=startup makes the
+import itself exit, and importing an FBX file whose name starts with
+`crash` exits the process, like a Blender crash.
+"""
+import os
+import sys
+import numpy as np
+
+if os.environ.get("STUB_BPY_CRASH") == "startup":
+    print("stub bpy: license check failed", file=sys.stderr, flush=True)
+    os._exit(3)
+
+
+class _Operator:
+    def __init__(self, name=""):
+        self.name = name
+
+    def __getattr__(self, name):
+        return _Operator(f"{self.name}.{name}")
+
+    def __call__(self, *args, **kwargs):
+        filepath = kwargs.get("filepath", "")
+        if self.name.endswith("import_scene.fbx") and os.path.basename(filepath).startswith("crash"):
+            os._exit(4)
+        if filepath and not self.name.startswith(".import"):
+            with open(filepath, "w") as f:
+                f.write(self.name)
+        return {"FINISHED"}
+
+
+ops = _Operator()
+
+
+class Collection(list):
+    """List of data blocks with foreach_get over one attribute, like bpy_prop_collection."""
+
+    def foreach_get(self, attribute, buffer):
+        values = np.array([getattr(item, attribute) for item in self], dtype=buffer.dtype)
+        buffer[:] = values.ravel()
+
+
+class Item:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class Mesh:
+    def __init__(self, vertices, triangles, groups=None):
+        """groups: per vertex list of (group index, weight)."""
+        groups = groups or [[] for _ in vertices]
+        self.vertices = Collection(Item(co=tuple(co), groups=[Item(group=g, weight=w) for g, w in vertex_groups])
+                                   for co, vertex_groups in zip(vertices, groups))
+        self.loop_triangles = Collection()
+        self._triangles = triangles
+
+    def calc_loop_triangles(self):
+        self.loop_triangles = Collection(Item(vertices=tuple(t)) for t in self._triangles)
+
+
+class Armature:
+    def __init__(self, heads, parents, names):
+        self.bones = Collection()
+        for head, parent, name in zip(heads, parents, names):
+            self.bones.append(Item(head_local=tuple(head), name=name,
+                                   parent=self.bones[parent] if parent >= 0 else None))
+
+
+class Object:
+    def __init__(self, type, data, matrix_world=None, vertex_groups=()):
+        self.type = type
+        self.data = data
+        self.matrix_world = np.eye(4) if matrix_world is None else np.asarray(matrix_world)
+        self.vertex_groups = [Item(name=name) for name in vertex_groups]
+
+    def select_set(self, state):
+        pass
+
+
+class _Scene:
+    objects = []
+
+
+class _ViewLayer:
+    class objects:
+        active = None
+
+
+class context:
+    scene = _Scene()
+    view_layer = _ViewLayer()
@@ -0,0 +1,64 @@
+import numpy as np
+
+import bpy
+from blender_extract import BVH_SCALE, armature_arrays, extract_scene, mesh_arrays, skin_arrays
+from schema import load_names
+
+
+def quad(offset=(0, 0, 0), groups=None):
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=np.float64) + offset
+    return bpy.Mesh(vertices, [(0, 1, 2), (0, 2, 3)], groups)
+
+
+def scene():
+    translate = np.eye(4)
+    translate[:3, 3] = (0, 0, 2)
+    skin = [[(0, 1.0)], [(0, 0.5), (1, 1.5)], [(1, 2.0), (2, 1.0)], [(0, 0.25), (1, 0.25), (2, 0.25), (3, 0.25)]]
+    mesh = bpy.Object('MESH', quad(groups=skin), vertex_groups=["Root", "mixamorig:Spine", "NoBone", "Root"])
+    other = bpy.Object('MESH', quad(), matrix_world=translate)
+    armature = bpy.Object('ARMATURE', bpy.Armature([(0, 0, 1), (0, 0, 2)], [-1, 0], ["Root", "mixamorig:Spine"]),
+                         matrix_world=translate)
+    return [mesh, armature, other]
+
+
+def test_mesh_arrays_concatenates_world_space_y_up():
+    vertices, faces = mesh_arrays(scene())
+    assert vertices.dtype == np.float32 and faces.shape == (4, 3)
+    np.testing.assert_array_equal(faces[2:], [[4, 5, 6], [4, 6, 7]])
+    # Blender (x, y, z) is written as (x, z, -y), the second mesh is lifted by 2 along z
+    np.testing.assert_allclose(vertices[2], [1, 0, -1])
+    np.testing.assert_allclose(vertices[6], [1, 2, -1])
+
+
+def test_armature_arrays_frames():
+    armature = scene()[1]
+    skel, parents, names = armature_arrays(armature)
+    np.testing.assert_allclose(skel, [[0, 3, 0], [0, 4, 0]])
+    np.testing.assert_array_equal(parents, [-1, 0])
+    assert names == ["Root", "Spine"]
+    skel, _, _ = armature_arrays(armature, frame="bvh")
+    np.testing.assert_allclose(skel, np.array([[0, 0, 1], [0, 0, 2]]) * BVH_SCALE)
+
+
+def test_skin_arrays_csr():
+    objects = scene()
+    indptr, joints, weights = skin_arrays(objects, ["Root", "mixamorig:Spine"])
+    # Groups without a bone are dropped, weights are normalized per vertex, the second mesh has none
+    np.testing.assert_array_equal(indptr, [0, 1, 3, 4, 7, 7, 7, 7, 7])
+    np.testing.assert_array_equal(joints, [0, 0, 1, 1, 0, 1, 0])
+    np.testing.assert_allclose(weights, [1, 0.25, 0.75, 1, 1 / 3, 1 / 3, 1 / 3], rtol=1e-6)
+
+
+def test_extract_scene_topk_and_bvh_frame(tmp_path):
+    outputs = extract_scene(scene(), str(tmp_path), "sample", skin_format="topk", topk=2, skeleton_frame="bvh")
+    prefix = tmp_path / "sample" / "sample"
+    assert {str(prefix) + suffix for suffix in ("_vertices.npy", "_faces.npy", "_skel.npy", "_link.npy", "_names.npy",
+                                                "_skin_topk_joints.npy", "_skin_topk_weights.npy")} == set(outputs)
+    topk_joints = np.load(f"{prefix}_skin_topk_joints.npy")
+    topk_weights = np.load(f"{prefix}_skin_topk_weights.npy")
+    assert topk_joints.shape == (8, 2) and topk_weights.dtype == np.float16
+    np.testing.assert_array_equal(topk_joints[1], [1, 0])
+    np.testing.assert_allclose(topk_weights[1], [0.75, 0.25], rtol=1e-3)
+    np.testing.assert_allclose(topk_weights[4], [0, 0])
+    assert load_names(f"{prefix}_names.npy") == ["Root", "Spine"]
+    np.testing.assert_allclose(np.load(f"{prefix}_skel.npy"), [[0, 0, 0.01], [0, 0, 0.02]])
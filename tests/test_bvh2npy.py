@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from bvh2npy import BVHData
+
+BVH = """HIERARCHY
+ROOT mixamorig:Hips
+{
+\tOFFSET 1.0 2.0 3.0
+\tCHANNELS 6 Xposition Yposition Zposition Zrotation Xrotation Yrotation
+\tJOINT mixamorig:Spine
+\t{
+\t\tOFFSET 0.0 10.0 0.0
+\t\tCHANNELS 3 Zrotation Xrotation Yrotation
+\t\tJOINT Head
+\t\t{
+\t\t\tOFFSET 0.0 5.5 0.5
+\t\t\tCHANNELS 3 Yrotation Xrotation Zrotation
+\t\t\tEnd Site
+\t\t\t{
+\t\t\t\tOFFSET 0.0 2.0 0.0
+\t\t\t}
+\t\t}
+\t}
+\tJOINT LeftLeg
+\t{
+\t\tOFFSET 2.0 -1.0 0.0
+\t\tCHANNELS 3 Zrotation Xrotation Yrotation
+\t\tEnd Site
+\t\t{
+\t\t\tOFFSET 0.0 -9.0 0.0
+\t\t}
+\t}
+}
+MOTION
+Frames: 2
+Frame Time: 0.033333
+0 1 2 3 4 5 6 7 8 9 10 11 12 13 14
+15 16 17 18 19 20 21 22 23 24 25 26 27 28 29
+"""
+
+
+@pytest.fixture
+def bvh_path(tmp_path):
+    path = tmp_path / "skeleton.bvh"
+    path.write_text(BVH)
+    return str(path)
+
+
+def test_hierarchy(bvh_path):
+    bvh = BVHData(bvh_path)
+    assert bvh.joint_names == ["Hips", "Spine", "Head", "LeftLeg"]
+    np.testing.assert_array_equal(bvh.joint_parents, [-1, 0, 1, 0])
+    # End Site offsets don't belong to a joint
+    np.testing.assert_array_equal(bvh.joint_offsets, [[1, 2, 3], [0, 10, 0], [0, 5.5, 0.5], [2, -1, 0]])
+    np.testing.assert_allclose(bvh.compute_global_positions(), [[1, 2, 3], [1, 12, 3], [1, 17.5, 3.5], [3, 1, 3]])
+
+
+def test_motion_channels(bvh_path):
+    bvh = BVHData(bvh_path)
+    assert bvh.joint_channels[0] == ("Xposition", "Yposition", "Zposition", "Zrotation", "Xrotation", "Yrotation")
+    assert bvh.joint_channels[2] == ("Yrotation", "Xrotation", "Zrotation")
+    np.testing.assert_array_equal(bvh.channel_offsets, [0, 6, 9, 12])
+    assert bvh.motion.shape == (2, 15) and bvh.motion.dtype == np.float32
+    np.testing.assert_array_equal(bvh.motion[1], np.arange(15, 30))
+    assert bvh.frame_time == pytest.approx(0.033333)
+
+
+def test_frame_count_mismatch(tmp_path):
+    path = tmp_path / "short.bvh"
+    path.write_text(BVH.replace("Frames: 2", "Frames: 3"))
+    with pytest.raises(ValueError):
+        BVHData(str(path))
+
+
+def test_export_to_bvh_round_trip(bvh_path, tmp_path):
+    bvh = BVHData(bvh_path)
+    bvh.export_to_bvh(str(tmp_path / "exported.bvh"))
+    reloaded = BVHData(str(tmp_path / "exported.bvh"))
+    assert reloaded.joint_names == bvh.joint_names
+    assert reloaded.joint_channels == bvh.joint_channels
+    np.testing.assert_array_equal(reloaded.joint_parents, bvh.joint_parents)
+    np.testing.assert_array_equal(reloaded.joint_offsets, bvh.joint_offsets)
+    np.testing.assert_array_equal(reloaded.motion, bvh.motion)
+    assert reloaded.frame_time == bvh.frame_time
+
+
+def test_export_to_bvh_reorders_joints(bvh_path, tmp_path):
+    # Joint tables listing a child before its parent are written depth first
+    bvh = BVHData(bvh_path)
+    order = [2, 3, 0, 1]
+    rank = np.argsort(order)
+    parents = np.array([rank[bvh.joint_parents[j]] if bvh.joint_parents[j] >= 0 else -1 for j in order])
+    shuffled = BVHData()
+    shuffled.joint_names = [bvh.joint_names[j] for j in order]
+    shuffled.joint_parents = parents
+    shuffled.joint_offsets = bvh.joint_offsets[order]
+    shuffled.joint_channels = [bvh.joint_channels[j] for j in order]
+    counts = np.array([len(c) for c in shuffled.joint_channels])
+    shuffled.channel_offsets = np.cumsum(counts) - counts
+    shuffled.motion = np.concatenate([bvh.motion[:, bvh.channel_offsets[j]:bvh.channel_offsets[j] + counts[i]]
+                                      for i, j in enumerate(order)], axis=1)
+    shuffled.export_to_bvh(str(tmp_path / "shuffled.bvh"), frame_time=bvh.frame_time)
+    reloaded = BVHData(str(tmp_path / "shuffled.bvh"))
+    # Children follow their parent, in the order of the joint table
+    assert reloaded.joint_names == ["Hips", "LeftLeg", "Spine", "Head"]
+    by_name = [bvh.joint_names.index(name) for name in reloaded.joint_names]
+    np.testing.assert_allclose(reloaded.compute_global_positions(slice(None)),
+                               bvh.compute_global_positions(slice(None))[:, by_name])
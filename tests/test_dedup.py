@@ -0,0 +1,59 @@
+import os
+import numpy as np
+from dedup import box_shape, duplicate_clusters, find_duplicates
+
+
+def box_corners(extents):
+    corners = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=np.float64)
+    return corners * extents
+
+
+def rotation(angle_x, angle_z):
+    cx, sx, cz, sz = np.cos(angle_x), np.sin(angle_x), np.cos(angle_z), np.sin(angle_z)
+    return np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]]) @ np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+
+
+def write_sample(root_dir, name, vertices):
+    os.makedirs(os.path.join(root_dir, name))
+    np.save(os.path.join(root_dir, name, f"{name}_vertices.npy"), vertices)
+
+
+def test_box_shape_rotation_invariant():
+    points = np.random.default_rng(0).uniform(size=(500, 3)) * [1.0, 0.5, 0.2]
+    rotated = points @ rotation(0.7, 1.1).T * 3 + [5, -2, 1]
+    np.testing.assert_allclose(box_shape(rotated), box_shape(points), atol=1e-9)
+
+
+def test_find_duplicates(tmp_path):
+    root_dir = str(tmp_path)
+    points = np.random.default_rng(0).uniform(size=(500, 3)) * [1.0, 0.5, 0.2]
+    write_sample(root_dir, "original", points)
+    write_sample(root_dir, "rotated", points @ rotation(0.7, 1.1).T * 3 + [5, -2, 1])
+    # Relative extents on both sides of 0.475, where quantizing to steps of 0.05 rounds apart
+    write_sample(root_dir, "boundary_a", box_corners([1.0, 0.4749, 0.2]))
+    write_sample(root_dir, "boundary_b", box_corners([1.0, 0.4751, 0.2]))
+    write_sample(root_dir, "other", box_corners([1.0, 0.3, 0.2]))
+
+    clusters = find_duplicates(root_dir)
+    assert clusters == [["boundary_a", "boundary_b"], ["original", "rotated"]]
+    with open(os.path.join(root_dir, "duplicates.txt")) as f:
+        assert f.read().split() == ["boundary_b", "rotated"]
+
+
+def test_neighbouring_box_cells():
+    def fingerprint(box, moment=0.5):
+        return {"key": ("mesh",), "moments": np.array([moment, 0.3, 0.2]), "box": np.array(box),
+                "vertices": 10, "joints": 0}
+
+    fingerprints = {
+        # Both extents straddle cell edges at multiples of 0.05, a diagonal neighbour
+        "a": fingerprint([0.4999, 0.2999]),
+        "b": fingerprint([0.5001, 0.3001]),
+        # Two cells away, and one with other moments in the same cell as a
+        "c": fingerprint([0.6, 0.3]),
+        "d": fingerprint([0.4999, 0.2999], moment=0.6),
+        # Anti-diagonal neighbour of c
+        "e": fingerprint([0.5999, 0.3049]),
+        "f": fingerprint([0.6049, 0.2999]),
+    }
+    assert duplicate_clusters(fingerprints, tolerance=1e-3, box_tolerance=0.05) == [["a", "b"], ["c", "e", "f"]]
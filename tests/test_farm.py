@@ -0,0 +1,39 @@
+import os
+import sys
+import json
+import subprocess
+
+from conftest import SCRIPTS_DIR, STUBS_DIR
+
+
+def run_farm(tmp_path, names, env=None, extra=()):
+    dataset = tmp_path / "fbx"
+    dataset.mkdir()
+    for name in names:
+        (dataset / name).write_text("")
+    output = tmp_path / "out"
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, "farm.py"), str(dataset), str(output),
+               "--python-workers", "--workers", "2", "--batch-size", "2", "--retries", "1", *extra]
+    environment = dict(os.environ, PYTHONPATH=STUBS_DIR, **(env or {}))
+    result = subprocess.run(command, cwd=SCRIPTS_DIR, env=environment, capture_output=True, text=True, timeout=120)
+    return result, output
+
+
+def test_worker_crash_mid_batch_retries_then_reports(tmp_path):
+    result, output = run_farm(tmp_path, ["a.fbx", "b.fbx", "crash.fbx", "d.fbx"])
+    assert result.returncode == 0, result.stdout + result.stderr
+    for name in ("a", "b", "d"):
+        assert (output / f"{name}.obj").exists()
+    assert not (output / "crash.obj").exists()
+    errors = json.loads((output / "farm_errors.json").read_text())
+    assert [error["file"] for error in errors] == ["crash.fbx"]
+    assert "exited with code 4" in errors[0]["error"]
+
+
+def test_worker_crash_at_startup_aborts(tmp_path):
+    result, output = run_farm(tmp_path, ["a.fbx", "b.fbx"], env={"STUB_BPY_CRASH": "startup"},
+                              extra=["--startup-retries", "2"])
+    assert result.returncode == 1
+    assert "failed to start" in result.stdout
+    assert "license check failed" in result.stdout
+    assert not (output / "a.obj").exists()
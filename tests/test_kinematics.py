@@ -0,0 +1,71 @@
+import numpy as np
+from kinematics import euler_to_matrix, forward_kinematics, joint_levels, motion_to_local
+
+
+def random_hierarchy(n_joints, seed=0):
+    """Parents of a random tree whose joints are shuffled, so parents may come after their children."""
+    rng = np.random.default_rng(seed)
+    tree = np.array([-1] + [int(rng.integers(0, j)) for j in range(1, n_joints)])
+    order = rng.permutation(n_joints)
+    rank = np.argsort(order)
+    return np.where(tree[order] >= 0, rank[np.maximum(tree[order], 0)], -1)
+
+
+def reference_fk(parents, rotations, translations):
+    """One pose, joint by joint, walking up to the root for every joint."""
+    positions = np.zeros((len(parents), 3))
+    for joint in range(len(parents)):
+        chain = [joint]
+        while parents[chain[-1]] >= 0:
+            chain.append(parents[chain[-1]])
+        rotation, position = np.eye(3), np.zeros(3)
+        for j in reversed(chain):
+            position = position + rotation @ translations[j]
+            rotation = rotation @ rotations[j]
+        positions[joint] = position
+    return positions
+
+
+def test_levels_cover_parents_first():
+    parents = random_hierarchy(40)
+    seen = set()
+    for level in joint_levels(parents):
+        assert all(parents[joint] in seen or parents[joint] < 0 for joint in level)
+        seen.update(level.tolist())
+    assert len(seen) == 40
+
+
+def test_forward_kinematics_matches_per_joint_loop():
+    rng = np.random.default_rng(1)
+    parents = random_hierarchy(30)
+    offsets = rng.normal(size=(30, 3))
+    rotations = euler_to_matrix(rng.uniform(-180, 180, size=(2, 5, 30, 3)), 'ZXY')
+    translations = offsets + rng.normal(scale=0.1, size=(2, 5, 30, 3))
+    positions, global_rotations = forward_kinematics(parents, offsets, rotations, translations)
+    assert positions.shape == (2, 5, 30, 3) and global_rotations.shape == (2, 5, 30, 3, 3)
+    for b in range(2):
+        for f in range(5):
+            np.testing.assert_allclose(positions[b, f], reference_fk(parents, rotations[b, f], translations[b, f]),
+                                       atol=1e-9)
+    # The rest pose only adds up the offsets
+    rest, _ = forward_kinematics(parents, offsets)
+    np.testing.assert_allclose(rest, reference_fk(parents, np.broadcast_to(np.eye(3), (30, 3, 3)), offsets))
+
+
+def test_euler_order():
+    x, y, z = np.deg2rad([30.0, 45.0, 60.0])
+    rx = np.array([[1, 0, 0], [0, np.cos(x), -np.sin(x)], [0, np.sin(x), np.cos(x)]])
+    ry = np.array([[np.cos(y), 0, np.sin(y)], [0, 1, 0], [-np.sin(y), 0, np.cos(y)]])
+    rz = np.array([[np.cos(z), -np.sin(z), 0], [np.sin(z), np.cos(z), 0], [0, 0, 1]])
+    np.testing.assert_allclose(euler_to_matrix([60.0, 30.0, 45.0], 'ZXY'), rz @ rx @ ry, atol=1e-12)
+
+
+def test_motion_to_local_layout():
+    channels = [("Xposition", "Yposition", "Zposition", "Zrotation", "Xrotation", "Yrotation"),
+                ("Yrotation", "Xrotation", "Zrotation")]
+    offsets = np.array([[0.0, 1.0, 0.0], [0.0, 2.0, 0.0]])
+    motion = np.array([[1.0, 2.0, 3.0, 10.0, 20.0, 30.0, 40.0, 50.0, 60.0]])
+    rotations, translations = motion_to_local(motion, channels, np.array([0, 6]), offsets)
+    np.testing.assert_allclose(translations, [[[1, 2, 3], [0, 2, 0]]])
+    np.testing.assert_allclose(rotations[0, 0], euler_to_matrix([10.0, 20.0, 30.0], 'ZXY'))
+    np.testing.assert_allclose(rotations[0, 1], euler_to_matrix([40.0, 50.0, 60.0], 'YXZ'))
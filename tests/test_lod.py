@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+from lod import export_lods
+from mesh_features import export_features
+from obj2npy import OBJData
+from utils import _find_files
+
+
+@pytest.fixture
+def sample_dir(tmp_path):
+    # A grid of 8x8 vertices, triangulated, with features and one level of detail
+    path = tmp_path / "grid"
+    path.mkdir()
+    x, y = np.meshgrid(np.arange(8.0), np.arange(8.0))
+    vertices = np.stack([x.ravel(), y.ravel(), np.zeros(64)], axis=1)
+    corners = (np.arange(7)[:, None] * 8 + np.arange(7)).ravel()
+    faces = np.concatenate([np.stack([corners, corners + 1, corners + 8], axis=1),
+                            np.stack([corners + 1, corners + 9, corners + 8], axis=1)])
+    np.save(str(path / "grid_vertices.npy"), vertices)
+    np.save(str(path / "grid_faces.npy"), faces)
+    np.save(str(path / "grid_skin_indptr.npy"), np.arange(65))
+    export_features(str(path))
+    export_lods(str(path), [2])
+    return str(path)
+
+
+def test_readers_skip_levels(sample_dir, tmp_path):
+    (tmp_path / "triangle.obj").write_text("v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n")
+    obj = OBJData(str(tmp_path / "triangle.obj"))
+    obj.load_from(sample_dir)
+    assert obj.vertices.shape == (64, 3)
+    assert obj.faces.shape == (98, 3)
+
+    files = _find_files(sample_dir, ["vertices", "faces"])
+    assert files == {"vertices": os.path.join(sample_dir, "grid_vertices.npy"),
+                     "faces": os.path.join(sample_dir, "grid_faces.npy")}
+
+
+def test_dataset_lod_skips_full_resolution(sample_dir):
+    pytest.importorskip("torch")
+    from rig_dataset import BVHDataset
+
+    dataset = BVHDataset(os.path.dirname(sample_dir), lod=1, rebuild_index=True)
+    data = dataset[0]
+    assert sorted(data) == ["faces", "remap", "vertices"]
+    assert len(data["vertices"]) < 64 and len(data["remap"]) == 64
+    # Full-resolution data only by name
+    data = dataset.load(0, ["vertices", "remap", "skin_indptr", "normals"], lod=1)
+    assert len(data["skin_indptr"]) == 65 and len(data["normals"]) == 64
@@ -0,0 +1,110 @@
+import os
+import numpy as np
+import pytest
+from obj2npy import OBJData, convert_obj_file, stream_obj_file
+
+
+def write_mesh(path, tokens, n_vertices=200, n_faces=300, seed=0):
+    rng = np.random.default_rng(seed)
+    vertices = rng.normal(size=(n_vertices, 3)).astype(np.float32)
+    faces = rng.integers(1, n_vertices + 1, size=(n_faces, 3))
+    with open(path, 'w') as f:
+        for v in vertices:
+            f.write("v %r %r %r\n" % tuple(float(x) for x in v))
+            f.write("vt 0.5 0.5\nvn 0 0 1\n")
+        for face in faces:
+            f.write("f " + " ".join(tokens.replace("v", str(i), 1).replace("vt", str(i)).replace("vn", str(i))
+                                    for i in face) + "\n")
+
+
+def all_parses(path, tmp_path):
+    """load_obj with the default and with tiny blocks, and the --stream path with tiny chunks."""
+    obj = OBJData(str(path))
+    yield obj.vertices, obj.faces
+    yield obj.load_obj(str(path), block_bytes=64)
+    prefix = str(tmp_path / "streamed")
+    stream_obj_file(str(path), prefix, chunk_bytes=64)
+    yield np.load(prefix + "_vertices.npy"), np.load(prefix + "_faces.npy")
+
+
+@pytest.mark.parametrize("tokens", ["v", "v/vt", "v//vn", "v/vt/vn"])
+def test_matches_reference(tmp_path, tokens):
+    path = tmp_path / "mesh.obj"
+    write_mesh(path, tokens)
+    obj = OBJData(str(path))
+    ref_vertices, ref_faces = obj.load_obj_reference(str(path))
+    for vertices, faces in all_parses(path, tmp_path):
+        assert vertices.dtype == np.float32 and faces.dtype == np.int32
+        np.testing.assert_array_equal(vertices, ref_vertices.astype(np.float32))
+        np.testing.assert_array_equal(faces, ref_faces)
+
+
+def test_polygons_relative_indices_and_whitespace(tmp_path):
+    path = tmp_path / "mesh.obj"
+    lines = [
+        "# header comment",
+        "o quad # named object",
+        "v 0 0 0 # trailing comment",
+        "v\t1 0 0",
+        "v 1 1 0  1.0",
+        "v 0 1 0",
+        "vt 0 0",
+        "f 1/1 2/1 3/1 4/1  # a quad",
+        "v 2 0 0",
+        "v 2 1 0",
+        "f\t-4//1 -2//1 -1//1 -3//1 -4//1",
+        "f 5 6 3 #",
+    ]
+    path.write_bytes("\r\n".join(lines).encode())  # CRLF, no final newline
+    expected_vertices = [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [2, 0, 0], [2, 1, 0]]
+    expected_faces = [[0, 1, 2], [0, 2, 3],  # quad
+                      [2, 4, 5], [2, 5, 3], [2, 3, 2],  # pentagon of relative indices
+                      [4, 5, 2]]
+    for vertices, faces in all_parses(path, tmp_path):
+        np.testing.assert_array_equal(vertices, expected_vertices)
+        np.testing.assert_array_equal(faces, expected_faces)
+
+
+def test_trailing_comments_regression(tmp_path):
+    path = tmp_path / "comments.obj"
+    path.write_text("v 0 0 0 # c\nv 1 0 0 # c\nv 0 1 0#c\nf 1 2 3 # x\n")
+    obj = OBJData(str(path))
+    np.testing.assert_array_equal(obj.vertices, [[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+    np.testing.assert_array_equal(obj.faces, [[0, 1, 2]])
+
+
+def test_malformed_records(tmp_path):
+    path = tmp_path / "bad.obj"
+    path.write_text("v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 x\n")
+    with pytest.raises(ValueError):
+        OBJData(str(path))
+    path.write_text("v 0 0\n")
+    with pytest.raises(ValueError):
+        OBJData(str(path))
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_stream_conversion_matches_in_memory(tmp_path, compact):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    write_mesh(input_dir / "mesh.obj", "v/vt/vn")
+    in_memory = convert_obj_file(str(input_dir), str(output_dir / "memory"), "mesh.obj", compact=compact)
+    # Blocks shorter than a line are carried over until a line is complete
+    streamed = convert_obj_file(str(input_dir), str(output_dir / "stream"), "mesh.obj", compact=compact,
+                                stream=True, chunk_bytes=16)
+    assert [os.path.basename(path) for path in streamed] == [os.path.basename(path) for path in in_memory]
+    for expected, actual in zip(in_memory, streamed):
+        expected, actual = np.load(expected), np.load(actual)
+        assert actual.dtype == expected.dtype
+        np.testing.assert_array_equal(actual, expected)
+    if compact:
+        assert np.load(streamed[1]).dtype == np.uint8
+
+
+def test_export_to_obj_round_trip(tmp_path):
+    write_mesh(tmp_path / "mesh.obj", "v/vt/vn")
+    obj = OBJData(str(tmp_path / "mesh.obj"))
+    obj.export_to_obj(str(tmp_path / "exported.obj"))
+    reloaded = OBJData(str(tmp_path / "exported.obj"))
+    np.testing.assert_array_equal(reloaded.vertices, obj.vertices)
+    np.testing.assert_array_equal(reloaded.faces, obj.faces)
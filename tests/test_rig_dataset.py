@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+from rig_dataset import BVHDataset
+from mesh_features import export_features
+from schema import FEATURE_FIELDS
+
+
+def write_mesh(sample_dir, name):
+    os.makedirs(sample_dir)
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float64)
+    faces = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]], dtype=np.int64)
+    np.save(os.path.join(sample_dir, f"{name}_vertices.npy"), vertices)
+    np.save(os.path.join(sample_dir, f"{name}_faces.npy"), faces)
+
+
+def test_mesh_features_from_index(tmp_path, monkeypatch):
+    for name in ("a", "b", "c"):
+        write_mesh(str(tmp_path / name), name)
+    export_features(str(tmp_path / "a"))
+    export_features(str(tmp_path / "c"))
+    # Stale features of c: its mesh is newer
+    vertices = str(tmp_path / "c" / "c_vertices.npy")
+    stat = os.stat(str(tmp_path / "c" / "c_normals.npy"))
+    os.utime(vertices, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    dataset = BVHDataset(str(tmp_path), features=True, mmap_mode="r", rebuild_index=True)
+    assert dataset.features_current.tolist() == [True, False, False]
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError("sample directory listed per item")
+
+    monkeypatch.setattr(os, "scandir", no_scan)
+    monkeypatch.setattr(os, "stat", no_scan)
+    for idx in range(len(dataset)):
+        data = dataset[idx]
+        assert all(field in data for field in FEATURE_FIELDS)
+    # Current features are read from their files, stale ones computed
+    assert isinstance(dataset[0]["normals"], np.memmap)
+    assert not isinstance(dataset[2]["normals"], np.memmap)
+    np.testing.assert_allclose(dataset[2]["normals"], dataset[0]["normals"])